@@ -0,0 +1,212 @@
+import numpy as np
+
+from vector_index import normalize_rows, top_k_indices
+
+KMEANS_SAMPLE = 50_000
+ASSIGN_BLOCK = 4096
+
+
+def _assign(vectors, centroids, spherical: bool = True):
+    """Index of the nearest centroid for each row, computed in blocks to bound memory."""
+    bias = None if spherical else -0.5 * np.einsum("ij,ij->i", centroids, centroids)
+    labels = np.empty(len(vectors), dtype=np.int64)
+    for start in range(0, len(vectors), ASSIGN_BLOCK):
+        scores = vectors[start:start + ASSIGN_BLOCK] @ centroids.T
+        if bias is not None:
+            scores += bias
+        labels[start:start + ASSIGN_BLOCK] = np.argmax(scores, axis=1)
+    return labels
+
+
+def kmeans(vectors, n_clusters: int, iterations: int = 10, spherical: bool = True, seed: int = 0):
+    """Lloyd's k-means on a sample of at most KMEANS_SAMPLE rows.
+
+    Spherical mode keeps unit-length centroids and assigns by cosine
+    similarity (for the IVF coarse quantizer); otherwise plain Euclidean
+    (for product-quantization codebooks).
+    """
+    rng = np.random.default_rng(seed)
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if len(vectors) > KMEANS_SAMPLE:
+        vectors = vectors[np.sort(rng.choice(len(vectors), KMEANS_SAMPLE, replace=False))]
+    n_clusters = min(n_clusters, len(vectors))
+    centroids = vectors[rng.choice(len(vectors), n_clusters, replace=False)].copy()
+    for _ in range(iterations):
+        labels = _assign(vectors, centroids, spherical)
+        order = np.argsort(labels, kind="stable")
+        counts = np.bincount(labels, minlength=n_clusters)
+        present = np.flatnonzero(counts)
+        sums = np.add.reduceat(vectors[order], np.concatenate(([0], np.cumsum(counts[present])[:-1])), axis=0)
+        if spherical:
+            centroids[present] = normalize_rows(sums)
+        else:
+            centroids[present] = sums / counts[present, None]
+        empty = np.flatnonzero(counts == 0)
+        if len(empty):
+            centroids[empty] = vectors[rng.choice(len(vectors), len(empty), replace=False)]
+    return centroids
+
+
+class Int8Quantizer:
+    """Symmetric per-dimension int8 codes: a quarter of the float32 memory."""
+
+    def train(self, vectors):
+        scale = np.abs(np.asarray(vectors, dtype=np.float32)).max(axis=0) / 127.0
+        scale[scale == 0] = 1.0
+        self.scale = scale.astype(np.float32)
+        return self
+
+    def encode(self, vectors):
+        return np.clip(np.rint(vectors / self.scale), -127, 127).astype(np.int8)
+
+    def scores(self, query, codes):
+        """Approximate dot products of query with the encoded vectors."""
+        return codes.astype(np.float32) @ (query * self.scale)
+
+
+class ProductQuantizer:
+    """Product quantization: each vector becomes one byte per subspace.
+
+    The vector is split into `subspaces` equal slices, each replaced by the id
+    of its nearest of 256 codebook centroids. Scores come from a per-query
+    lookup table (asymmetric distance computation).
+    """
+
+    def __init__(self, subspaces: int = 16):
+        self.subspaces = subspaces
+
+    def train(self, vectors):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        dim = vectors.shape[1]
+        if dim % self.subspaces:
+            raise ValueError(f"Embedding size {dim} is not divisible into {self.subspaces} subspaces.")
+        self.width = dim // self.subspaces
+        self.codebooks = np.stack([
+            kmeans(vectors[:, j * self.width:(j + 1) * self.width], 256, spherical=False, seed=j)
+            for j in range(self.subspaces)
+        ])
+        return self
+
+    def encode(self, vectors):
+        codes = np.empty((len(vectors), self.subspaces), dtype=np.uint8)
+        for j, codebook in enumerate(self.codebooks):
+            part = vectors[:, j * self.width:(j + 1) * self.width]
+            codes[:, j] = _assign(part, codebook, spherical=False)
+        return codes
+
+    def scores(self, query, codes):
+        table = np.einsum("jkw,jw->jk", self.codebooks, query.reshape(self.subspaces, self.width))
+        offsets = np.arange(self.subspaces, dtype=np.intp) * 256
+        return np.take(table.ravel(), codes + offsets).sum(axis=1)
+
+
+class IVFIndex:
+    """Inverted-file approximate nearest-neighbour index over normalized vectors.
+
+    Spherical k-means splits the space into n_lists cells; a query scans only
+    the n_probe cells whose centroids are closest. Vectors are stored as
+    float32, or compressed with quantization="int8" (4x smaller) or "pq"
+    (pq_subspaces bytes each, by default one per four dimensions). Callers
+    holding the exact vectors can rerank the candidates this returns.
+    """
+
+    def __init__(self, n_lists: int = None, n_probe: int = 8, quantization: str = None,
+                 pq_subspaces: int = None, seed: int = 0):
+        if quantization not in (None, "int8", "pq"):
+            raise ValueError(f"Unknown quantization {quantization!r}; use 'int8' or 'pq'.")
+        self.n_lists = n_lists
+        self.n_probe = n_probe
+        self.quantization = quantization
+        self.pq_subspaces = pq_subspaces
+        self.seed = seed
+        self.centroids = None
+        self.quantizer = None
+        self.trained_size = 0
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def trained(self) -> bool:
+        return self.centroids is not None
+
+    def train(self, vectors):
+        """Fit the coarse cells (and quantizer) on a sample of vectors and reset the lists."""
+        size = len(vectors)
+        if size > KMEANS_SAMPLE:
+            rng = np.random.default_rng(self.seed)
+            vectors = vectors[np.sort(rng.choice(size, KMEANS_SAMPLE, replace=False))]
+        vectors = normalize_rows(vectors)
+        n_lists = self.n_lists or max(1, int(4 * np.sqrt(size)))
+        self.centroids = kmeans(vectors, n_lists, seed=self.seed)
+        if self.quantization == "pq":
+            self.quantizer = ProductQuantizer(self.pq_subspaces or vectors.shape[1] // 4).train(vectors)
+        elif self.quantization == "int8":
+            self.quantizer = Int8Quantizer().train(vectors)
+        self.trained_size = size
+        self._ids = [[] for _ in range(len(self.centroids))]
+        self._codes = [[] for _ in range(len(self.centroids))]
+        self._size = 0
+
+    def add(self, ids, vectors):
+        """File vectors (with their caller-side ids) under their nearest cell."""
+        vectors = normalize_rows(vectors)
+        ids = np.asarray(ids, dtype=np.int64)
+        labels = _assign(vectors, self.centroids)
+        codes = self.quantizer.encode(vectors) if self.quantizer else vectors
+        order = np.argsort(labels, kind="stable")
+        bounds = np.flatnonzero(np.diff(labels[order])) + 1
+        for group in np.split(order, bounds):
+            if len(group):
+                cell = labels[group[0]]
+                self._ids[cell].append(ids[group])
+                self._codes[cell].append(codes[group])
+        self._size += len(ids)
+
+    def _cell(self, cell: int):
+        """(ids, codes) of one cell, merging appended batches on first read."""
+        if len(self._ids[cell]) > 1:
+            self._ids[cell] = [np.concatenate(self._ids[cell])]
+            self._codes[cell] = [np.concatenate(self._codes[cell])]
+        if not self._ids[cell]:
+            return None, None
+        return self._ids[cell][0], self._codes[cell][0]
+
+    def search(self, query, top_k: int = 10, n_probe: int = None, exact=None, rerank: int = None):
+        """Return approximate (id, score) pairs, best first.
+
+        `exact` is anything indexable by an array of ids that returns the
+        original normalized vectors (e.g. a memmap); the best `rerank`
+        (default 10 * top_k) approximate candidates are then rescored exactly,
+        recovering most of the recall lost to quantization.
+        """
+        if not self.trained or not self._size:
+            return []
+        query = normalize_rows(query)[0]
+        n_probe = min(n_probe or self.n_probe, len(self.centroids))
+        cells = top_k_indices((self.centroids @ query)[None, :], n_probe)[0]
+        found_ids, found_scores = [], []
+        for cell in cells:
+            ids, codes = self._cell(cell)
+            if ids is None:
+                continue
+            found_ids.append(ids)
+            found_scores.append(self.quantizer.scores(query, codes) if self.quantizer else codes @ query)
+        if not found_ids:
+            return []
+        ids = np.concatenate(found_ids)
+        scores = np.concatenate(found_scores)
+        if exact is not None:
+            candidates = top_k_indices(scores[None, :], rerank or 10 * top_k)[0]
+            ids = ids[candidates]
+            order = np.argsort(ids)
+            ids = ids[order]
+            scores = np.asarray(exact[ids], dtype=np.float32) @ query
+        top = top_k_indices(scores[None, :], top_k)[0]
+        return [(int(ids[i]), float(scores[i])) for i in top]
+
+    @property
+    def nbytes(self) -> int:
+        """Memory held by stored codes and ids."""
+        return sum(a.nbytes for cell in self._codes + self._ids for a in cell)
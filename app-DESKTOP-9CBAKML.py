@@ -1,37 +1,182 @@
 import streamlit as st
-from streamlit_webrtc import webrtc_streamer, AudioProcessorBase
-import numpy as np
-import soundfile as sf
+from datetime import datetime
 import io
 import os
-from datetime import datetime
 import sqlite3
-import PyPDF2
+import time
 
+from chunking import chunk_pdf, chunk_text
+from jobs import job_key
+from metrics import metrics
+
+# Page-specific modules (streamlit_webrtc, numpy, soundfile, PyPDF2) are imported
+# inside the page that needs them, so other pages never load them.
 from utils import (
     transcribe_audio,
+    get_job_queue,
+    get_metrics_snapshot,
+    get_transport_stats,
+    start_metrics_export,
+    trace_request,
     generate_response,
+    generate_response_stream,
     text_to_speech,
     save_chat_log,
     get_chat_logs,
-    load_knowledge_base_from_text,
-    semantic_search,
+    document_id,
+    load_knowledge_chunks,
+    semantic_search_chunks,
+    has_knowledge,
+    get_knowledge_texts,
 )
 
-# Global knowledge storage
-knowledge_texts = []
-
-def has_knowledge():
-    return len(knowledge_texts) > 0
-
-def get_knowledge_texts():
-    return knowledge_texts
-
 st.set_page_config(page_title="AI Capstone Project", layout="wide")
 
+TRANSCRIPTION_SAMPLE_RATE = 16000
+MAX_RECORDING_SECONDS = 30 * 60
+
 # Sidebar navigation
 st.sidebar.title("Navigation")
 page = st.sidebar.radio("Select Project", ["Home", "AI Study Buddy", "Accessibility Tool", "Custom Project"])
+show_metrics = st.sidebar.checkbox("🩺 Show performance metrics")
+
+start_metrics_export()
+
+def transcribe_job(audio_data, progress=None):
+    """Background job: transcript of an uploaded or recorded clip; progress carries the merged text so far."""
+    metrics.count("bytes_uploaded", len(audio_data), source="audio")
+    return transcribe_audio(audio_data, progress)
+
+def synthesize_job(text, output_format="mp3", progress=None):
+    """Background job: speech audio path; progress carries the first segment's path as soon as it is playable."""
+    segments = []
+
+    def on_segment(index, path):
+        segments.append(path)
+        if progress:
+            progress(len(segments), message=segments[0])
+
+    return text_to_speech(text, output_format=output_format, on_segment=on_segment), len(segments)
+
+def submit_transcription(audio_data, retry=False):
+    # Keyed by the audio, so reruns poll the same job instead of transcribing again.
+    return get_job_queue().submit("transcribe", transcribe_job, audio_data,
+                                  key=job_key("transcribe", audio_data), retry=retry)
+
+def submit_speech(text, output_format="mp3", retry=False):
+    return get_job_queue().submit("tts", synthesize_job, text, output_format,
+                                  key=job_key("tts", output_format, text), retry=retry)
+
+# The show_* helpers submit by input on every rerun rather than keeping job ids in
+# session state: a keyed submit finds the running or finished job, and starts it
+# again if it has been forgotten or has expired.
+def show_speech(text, output_format, download_label, file_name):
+    """Play the first sentence once it is ready, then the full audio with a download button; True while running."""
+    job_id = submit_speech(text, output_format)
+    status = get_job_queue().status(job_id)
+    mime = f"audio/{output_format}"
+    first_segment = (status["progress"] or (None, None, None))[2]
+    if status["state"] in ("queued", "running"):
+        st.info("⏳ Generating speech...")
+        if first_segment and os.path.exists(first_segment):
+            with open(first_segment, "rb") as f:
+                st.audio(f.read(), format=mime, autoplay=True)
+        return True
+    if status["state"] == "completed":
+        audio_path, _ = get_job_queue().result(job_id)
+        if not os.path.exists(audio_path):
+            # Evicted from the audio cache since; synthesize it again under the same id.
+            get_job_queue().forget(job_id)
+            submit_speech(text, output_format)
+            st.info("⏳ Generating speech...")
+            return True
+        with open(audio_path, "rb") as f:
+            audio_bytes = f.read()
+        st.audio(audio_bytes, format=mime)
+        st.download_button(download_label, data=audio_bytes, file_name=file_name, mime=mime)
+        return False
+    st.error(f"Error generating speech: {status['error']}")
+    if st.button("Retry speech"):
+        submit_speech(text, output_format, retry=True)
+        st.rerun()
+    return False
+
+def show_transcription(audio_data):
+    """Show the transcription of audio_data; return (transcript or None, still running)."""
+    job_id = submit_transcription(audio_data)
+    status = get_job_queue().status(job_id)
+    if status["state"] in ("queued", "running"):
+        st.info("⏳ Transcribing...")
+        return None, True
+    if status["state"] == "completed":
+        transcript = get_job_queue().result(job_id)
+        st.write(f"**Transcribed Text:** {transcript}")
+        return transcript, False
+    st.error(f"Error: {status['error']}")
+    if st.button("Retry transcription"):
+        submit_transcription(audio_data, retry=True)
+        st.rerun()
+    return None, False
+
+def answer_voice_question(transcribed_text, output_format, source, **attrs):
+    """Answer a transcribed question, log it and queue its spoken reply; return the answer."""
+    with trace_request("voice_question", source=source, **attrs):
+        response = generate_response(transcribed_text)
+        if not response:
+            return None
+        st.session_state.chat_history.append({
+            "user": transcribed_text,
+            "bot": response,
+            "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        })
+        save_chat_log(transcribed_text, response)
+        submit_speech(response, output_format, retry=True)
+        return response
+
+def show_answer(turn, output_format, download_label, file_name):
+    """Show a voice turn's answer and its speech; True while the speech is still being generated."""
+    if not turn.get("response"):
+        return False
+    st.markdown(f"**AI:** {turn['response']}")
+    return show_speech(turn["response"], output_format, download_label, file_name)
+
+def show_metrics_panel(container):
+    """p50/p95 per pipeline stage, counters and outbound endpoint stats for this process."""
+    snapshot = get_metrics_snapshot()
+    container.markdown("### 🩺 Performance")
+    if not snapshot["stages"]:
+        container.caption("Nothing timed yet.")
+    else:
+        container.table([
+            {"stage": name, "calls": stats["count"], "errors": stats["errors"],
+             "p50 ms": stats["p50_ms"], "p95 ms": stats["p95_ms"]}
+            for name, stats in snapshot["stages"].items()
+        ])
+    if snapshot["counters"]:
+        container.table([{"counter": series, "value": value} for series, value in snapshot["counters"].items()])
+    endpoints = get_transport_stats()
+    if endpoints:
+        container.table([
+            {"endpoint": endpoint, "calls": stats["calls"], "failures": stats["failures"],
+             "p50 ms": stats["p50_ms"], "p95 ms": stats["p95_ms"], "circuit": stats["circuit"]}
+            for endpoint, stats in endpoints.items()
+        ])
+
+def ingest_document(file_type, data, name, progress=None):
+    """Background job: chunk, embed and store one uploaded document; return its chunk count."""
+    metrics.count("bytes_uploaded", len(data), source="documents")
+    if file_type == "text/plain":
+        chunks = chunk_text(data.decode("utf-8"), source=name)
+    else:
+        chunks = chunk_pdf(io.BytesIO(data), source=name)
+
+    def counted(chunks):
+        for n, chunk in enumerate(chunks, 1):
+            yield chunk
+            if progress and n % 50 == 0:
+                progress(n)
+
+    return load_knowledge_chunks(counted(chunks), document_id(data))
 
 # -------------------
 # AI Study Buddy page
@@ -43,101 +188,93 @@ def ai_study_buddy():
         st.session_state.chat_history = []
 
     mode = st.radio("Input Mode", ["📝 Text", "🎙️ Upload Audio", "🎤 Record Audio"])
+    pending = False
 
     if mode == "📝 Text":
         user_input = st.text_input("Ask a question or type a command")
         if st.button("Submit") and user_input:
-            response = generate_response(user_input)
-            if response:
-                st.session_state.chat_history.append({
-                    "user": user_input,
-                    "bot": response,
-                    "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                })
-                save_chat_log(user_input, response)
+            with trace_request("text_question"):
+                response = st.write_stream(generate_response_stream(user_input))
+                if response:
+                    st.session_state.chat_history.append({
+                        "user": user_input,
+                        "bot": response,
+                        "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+                    })
+                    save_chat_log(user_input, response)
 
     elif mode == "🎙️ Upload Audio":
         uploaded_file = st.file_uploader("Upload an audio file", type=["wav", "mp3", "m4a", "ogg", "flac"])
         if uploaded_file:
+            turn = st.session_state.get("upload_turn")
             if st.button("Transcribe & Ask"):
-                try:
-                    transcribed_text = transcribe_audio(uploaded_file)
-                    st.write(f"**Transcribed Text:** {transcribed_text}")
-                    response = generate_response(transcribed_text)
-                    if response:
-                        st.session_state.chat_history.append({
-                            "user": transcribed_text,
-                            "bot": response,
-                            "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                        })
-                        save_chat_log(transcribed_text, response)
-
-                        mp3_file = text_to_speech(response, output_format="mp3")
-                        with open(mp3_file, "rb") as f:
-                            audio_bytes = f.read()
-                        st.audio(audio_bytes, format="audio/mp3")
-                        st.download_button("Download MP3 Response", data=audio_bytes, file_name="response_audio.mp3", mime="audio/mp3")
-                except Exception as e:
-                    st.error(f"Error: {e}")
+                submit_transcription(uploaded_file.getvalue(), retry=True)
+                turn = st.session_state.upload_turn = {"file_id": uploaded_file.file_id}
+            if turn and turn["file_id"] == uploaded_file.file_id:
+                transcribed_text, pending = show_transcription(uploaded_file.getvalue())
+                if transcribed_text is not None:
+                    if "response" not in turn:
+                        turn["response"] = answer_voice_question(transcribed_text, "mp3", "upload")
+                    pending = show_answer(turn, "mp3", "Download MP3 Response", "response_audio.mp3")
         else:
             st.info("Upload an audio file to transcribe and get a response.")
 
     elif mode == "🎤 Record Audio":
+        from streamlit_webrtc import webrtc_streamer, AudioProcessorBase
+        from audio_buffer import PCMBuffer
+
         class AudioProcessor(AudioProcessorBase):
             def __init__(self):
-                self.frames = []
+                # The only copy of the recording. Frames arrive on the WebRTC thread;
+                # the page reads the buffer once the recording has stopped.
+                self.buffer = PCMBuffer(max_seconds=MAX_RECORDING_SECONDS)
 
             def recv(self, frame):
-                self.frames.append(frame.to_ndarray(format="flt32"))
+                self.buffer.append_frame(frame)
                 return frame
 
         webrtc_ctx = webrtc_streamer(
             key="audio-recorder",
             mode="recvonly",
-            audio_receiver_size=1024,
             media_stream_constraints={"audio": True, "video": False},
             processor_factory=AudioProcessor,
         )
 
-        if webrtc_ctx.audio_receiver:
-            audio_frames = webrtc_ctx.audio_receiver.get_frames(timeout=1)
-            if audio_frames:
-                audio_data = np.concatenate([f.to_ndarray(format="flt32") for f in audio_frames])
-                sample_rate = 16000
-
-                buf = io.BytesIO()
-                sf.write(buf, audio_data, sample_rate, format="wav")
-                buf.seek(0)
-
-                st.audio(buf.read(), format="audio/wav")
-
-                os.makedirs("audio", exist_ok=True)
-                wav_path = "audio/recorded_audio.wav"
-                sf.write(wav_path, audio_data, sample_rate)
-
-                with open(wav_path, "rb") as f:
-                    st.download_button("Download Recorded WAV", data=f, file_name="recorded_audio.wav", mime="audio/wav")
-
-                with open(wav_path, "rb") as f:
-                    transcribed_text = transcribe_audio(f)
-
-                st.write(f"**Transcribed Text:** {transcribed_text}")
-
-                if st.button("Ask AI"):
-                    response = generate_response(transcribed_text)
-                    if response:
-                        st.session_state.chat_history.append({
-                            "user": transcribed_text,
-                            "bot": response,
-                            "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                        })
-                        save_chat_log(transcribed_text, response)
-
-                        wav_file = text_to_speech(response, output_format="wav")
-                        with open(wav_file, "rb") as f:
-                            audio_bytes = f.read()
-                        st.audio(audio_bytes, format="audio/wav")
-                        st.download_button("Download WAV Response", data=audio_bytes, file_name="ai_response.wav", mime="audio/wav")
+        if webrtc_ctx.audio_processor:
+            # Keep the buffer after the processor goes away when the stream stops.
+            st.session_state.recording = webrtc_ctx.audio_processor.buffer
+        buffer = st.session_state.get("recording")
+
+        if webrtc_ctx.state.playing:
+            if buffer is not None:
+                st.caption(f"🔴 Recording... {buffer.duration:.0f} s")
+        elif buffer is not None and len(buffer):
+            # Mono 16 kHz 16-bit: the smallest payload that still transcribes well.
+            # Resample and encode once per finished recording, not on every rerun;
+            # playback, download and upload all share the same bytes.
+            encoded = st.session_state.get("recording_audio")
+            if encoded is None or encoded[0] is not buffer:
+                with metrics.span("record.encode"):
+                    encoded = (buffer, buffer.to_audio_buffer(TRANSCRIPTION_SAMPLE_RATE))
+                st.session_state.recording_audio = encoded
+            recording = encoded[1]
+            st.audio(recording.data, format=recording.mime)
+            st.download_button("Download Recorded WAV", data=recording.data, file_name="recorded_audio.wav", mime=recording.mime)
+            if st.button("🔁 Start New Recording"):
+                buffer.clear()
+                del st.session_state.recording_audio
+                st.rerun()
+
+            transcribed_text, pending = show_transcription(recording.data)
+            turn = st.session_state.get("record_turn")
+            if transcribed_text is not None and st.button("Ask AI"):
+                turn = st.session_state.record_turn = {
+                    "recording": recording,
+                    "response": answer_voice_question(transcribed_text, "wav", "recording",
+                                                      recorded_bytes=len(recording.data)),
+                }
+            if turn and turn["recording"] is recording:
+                pending = show_answer(turn, "wav", "Download WAV Response", "ai_response.wav")
 
     if st.button("🗑️ Clear Chat History"):
         st.session_state.chat_history = []
@@ -156,6 +293,10 @@ def ai_study_buddy():
         st.markdown(f"**[{ts}] AI:** {bot_out}")
         st.markdown("---")
 
+    if pending:
+        time.sleep(1)
+        st.rerun()
+
 # -----------------------
 # Accessibility Tool page
 # -----------------------
@@ -164,78 +305,119 @@ def accessibility_ui():
 
     st.write("Use speech-to-text and text-to-speech features for accessibility.")
 
+    pending = False
     audio_file = st.file_uploader("Upload audio for transcription", type=["wav", "mp3", "m4a", "ogg", "flac"])
     if audio_file:
-        try:
-            transcription = transcribe_audio(audio_file)
-            st.write(f"**Transcribed text:** {transcription}")
-        except Exception as e:
-            st.error(f"Error transcribing audio: {e}")
+        # Decoding, fingerprinting and segmenting all happen inside the job.
+        audio_data = audio_file.getvalue()
+        job_id = submit_transcription(audio_data)
+        status = get_job_queue().status(job_id)
+        if status["state"] in ("queued", "running"):
+            done, total, text = status["progress"] or (0, None, None)
+            if total:
+                st.info(f"⏳ Transcribing... {done}/{total} segments done.")
+                st.progress(done / total)
+            else:
+                st.info("⏳ Transcribing...")
+            if text:
+                st.write(f"**Transcribed so far:** {text}")
+            if st.button("Cancel transcription"):
+                get_job_queue().cancel(job_id)
+            pending = True
+        elif status["state"] == "completed":
+            st.write(f"**Transcribed text:** {get_job_queue().result(job_id)}")
+        elif status["state"] == "missing":
+            pending = True
+        else:
+            if status["error"] == "cancelled":
+                st.warning("Transcription cancelled.")
+            else:
+                st.error(f"Error transcribing audio: {status['error']}")
+            if st.button("Transcribe again"):
+                submit_transcription(audio_data, retry=True)
+                st.rerun()
 
     text_input = st.text_area("Enter text to convert to speech")
     if st.button("Convert to Speech") and text_input.strip():
-        try:
-            audio_path = text_to_speech(text_input, output_format="mp3")
-            with open(audio_path, "rb") as f:
-                audio_bytes = f.read()
-            st.audio(audio_bytes, format="audio/mp3")
-            st.download_button("Download Speech Audio", data=audio_bytes, file_name="speech.mp3", mime="audio/mp3")
-        except Exception as e:
-            st.error(f"Error generating speech: {e}")
+        submit_speech(text_input, "mp3", retry=True)
+        st.session_state.speech_text = text_input
+    if "speech_text" in st.session_state:
+        if show_speech(st.session_state.speech_text, "mp3", "Download Speech Audio", "speech.mp3"):
+            pending = True
+
+    if pending:
+        time.sleep(1)
+        st.rerun()
 
 # --------------------
 # Custom Project page
 # --------------------
 def custom_project():
-    global knowledge_texts
-
     st.title("🛠️ Custom Project: Domain-Specific Chatbot")
 
     st.markdown("Upload domain knowledge files (TXT or PDF). The bot will answer questions based on these.")
 
     uploaded_files = st.file_uploader("Upload files", accept_multiple_files=True, type=["txt", "pdf"])
 
+    ingest_pending = False
     if uploaded_files:
+        jobs = get_job_queue()
         count = 0
         for f in uploaded_files:
-            if f.type == "text/plain":
-                content = f.read().decode("utf-8")
-            elif f.type == "application/pdf":
-                pdf = PyPDF2.PdfReader(f)
-                content = ""
-                for page in pdf.pages:
-                    content += page.extract_text()
-            else:
+            if f.type not in ("text/plain", "application/pdf"):
                 st.error("Unsupported file type. Please upload txt or pdf.")
-                content = ""
-            if content:
-                success = load_knowledge_base_from_text(content)
-                if success:
+                continue
+            data = f.getvalue()
+            job_id = jobs.submit("ingest", ingest_document, f.type, data, f.name,
+                                 key=job_key("ingest", document_id(data)))
+            status = jobs.status(job_id)
+            if status["state"] in ("queued", "running"):
+                ingest_pending = True
+                done = status["progress"][0] if status["progress"] else 0
+                st.info(f"⏳ Loading {f.name}... {done} chunks so far.")
+            elif status["state"] == "completed":
+                if jobs.result(job_id):
                     count += 1
-        st.success(f"Loaded {count} document(s) into the knowledge base.")
+            elif status["state"] == "missing":
+                # Pruned between submit and status; the rerun submits it again.
+                ingest_pending = True
+            else:
+                st.error(f"Error loading {f.name}: {status['error']}")
+                if st.button("Retry", key=f"retry-{job_id}"):
+                    jobs.forget(job_id)
+                    st.rerun()
+        if not ingest_pending:
+            st.success(f"Loaded {count} document(s) into the knowledge base.")
 
     query = st.text_input("Ask a question about your domain knowledge")
+    keyword_only = st.checkbox("Keyword search only (local, no embedding call)")
 
     if st.button("Get Answer"):
         if not query.strip():
             st.warning("Please enter a question.")
-        elif not knowledge_texts:
+        elif not has_knowledge():
             st.warning("Upload domain knowledge files first.")
         else:
-            matches = semantic_search(query, top_k=1)
-            if matches:
-                prompt = f"Answer the question based on the following context:\n\n{matches[0]}\n\nQuestion: {query}"
-                answer = generate_response(prompt)
-                st.markdown(f"**Answer:** {answer}")
-                save_chat_log(query, answer)
-            else:
-                st.info("No matching info found. Try uploading more documents or rephrasing your question.")
+            with trace_request("domain_question", mode="lexical" if keyword_only else "default"):
+                matches = semantic_search_chunks(query, top_k=3, mode="lexical" if keyword_only else None)
+                if matches:
+                    context = "\n\n".join(chunk["text"] for chunk in matches)
+                    prompt = f"Answer the question based on the following context:\n\n{context}\n\nQuestion: {query}"
+                    answer = generate_response(prompt, question=query)
+                    st.markdown(f"**Answer:** {answer}")
+                    save_chat_log(query, answer)
+                else:
+                    st.info("No matching info found. Try uploading more documents or rephrasing your question.")
 
     if st.checkbox("Show loaded knowledge excerpts"):
-        for i, doc in enumerate(knowledge_texts, 1):
+        for i, doc in enumerate(get_knowledge_texts(), 1):
             st.markdown(f"**Doc {i}:**")
             st.write(doc[:1000] + ("..." if len(doc) > 1000 else ""))
 
+    if ingest_pending:
+        time.sleep(1)
+        st.rerun()
+
 # --------------
 # Home page
 # --------------
@@ -251,6 +433,9 @@ def home():
 # --------------------
 # Main app control flow
 # --------------------
+if show_metrics:
+    show_metrics_panel(st.sidebar)
+
 if page == "Home":
     home()
 elif page == "AI Study Buddy":
@@ -1,16 +1,25 @@
 import streamlit as st
 from datetime import datetime
-import sqlite3
-from io import StringIO
-from PyPDF2 import PdfReader
-from fpdf import FPDF
-import tempfile
+import hashlib
+import io
+import os
+import time
 
+from chunking import chunk_pdf, chunk_text
+from jobs import job_key
+from metrics import metrics
+from retrieval import BM25Index, OverlayIndex, estimate_tokens, select_passages
 from utils import (
+    get_job_queue,
+    get_metrics_snapshot,
+    get_transport_stats,
+    start_metrics_export,
+    trace_request,
     transcribe_audio,
-    generate_response,
+    generate_response_stream,
     text_to_speech,
     save_chat_log,
+    get_chat_log_page,
     load_knowledge_base,
     generate_custom_content
 )
@@ -24,26 +33,141 @@ page = st.sidebar.radio("🏠 Home", [
     "Custom Content Generator ✍️",
     "Chat History 📚"
 ])
+show_metrics = st.sidebar.checkbox("🩺 Show performance metrics")
+
+start_metrics_export()
+
+@st.cache_resource
+def base_knowledge_index():
+    """Read-only index of the base knowledge, built once per process and shared by every session."""
+    index = BM25Index()
+    index.add_many(
+        chunk["text"] for chunk in chunk_text(load_knowledge_base("knowledge_base.txt"), source="knowledge_base.txt")
+    )
+    return index
+
+# Set by show_job while background work is unfinished; the page reruns itself to poll it
+jobs_pending = False
 
 # Initialize session state
 if "history" not in st.session_state:
     st.session_state.history = []
-if "knowledge_base" not in st.session_state:
-    st.session_state.knowledge_base = load_knowledge_base("knowledge_base.txt")
-
-# Helper: extract text from file
-def extract_text_from_file(uploaded_file):
-    if uploaded_file.type == "text/plain":
-        stringio = StringIO(uploaded_file.getvalue().decode("utf-8"))
-        return stringio.read()
-    elif uploaded_file.type == "application/pdf":
-        pdf = PdfReader(uploaded_file)
-        text = ""
-        for page in pdf.pages:
-            text += page.extract_text() + "\n"
-        return text
+if "knowledge_index" not in st.session_state:
+    # Sessions only hold their own uploads; the base corpus is shared.
+    st.session_state.knowledge_index = OverlayIndex(base_knowledge_index())
+    st.session_state.loaded_notes = set()
+    st.session_state.tokens_saved = 0
+
+# Helper: render one chat message as a bubble
+def chat_bubble(speaker, message):
+    if speaker == "You":
+        return (
+            f"<div style='text-align: right; background-color: #DCF8C6; padding: 10px; "
+            f"border-radius: 10px; margin: 5px;'>{message}</div>"
+        )
+    return (
+        f"<div style='text-align: left; background-color: #F1F0F0; padding: 10px; "
+        f"border-radius: 10px; margin: 5px;'>{message}</div>"
+    )
+
+# Helper: debug panel with p50/p95 per pipeline stage and the counters of this server process
+def show_metrics_panel(container):
+    snapshot = get_metrics_snapshot()
+    container.markdown("### 🩺 Performance")
+    if not snapshot["stages"]:
+        container.caption("Nothing timed yet.")
+    else:
+        container.table([
+            {"stage": name, "calls": stats["count"], "errors": stats["errors"],
+             "p50 ms": stats["p50_ms"], "p95 ms": stats["p95_ms"]}
+            for name, stats in snapshot["stages"].items()
+        ])
+    if snapshot["counters"]:
+        container.table([{"counter": series, "value": value} for series, value in snapshot["counters"].items()])
+    endpoints = get_transport_stats()
+    if endpoints:
+        container.table([
+            {"endpoint": endpoint, "calls": stats["calls"], "failures": stats["failures"],
+             "p50 ms": stats["p50_ms"], "p95 ms": stats["p95_ms"], "circuit": stats["circuit"]}
+            for endpoint, stats in endpoints.items()
+        ])
+
+# Helper: show a background job's progress and return its status
+def show_job(job_id, running_text):
+    global jobs_pending
+    status = get_job_queue().status(job_id)
+    if status["state"] in ("queued", "running"):
+        jobs_pending = True
+        done, total, _ = status["progress"] or (0, None, None)
+        if total:
+            st.info(f"⏳ {running_text} ({done}/{total})")
+            st.progress(done / total)
+        else:
+            st.info(f"⏳ {running_text}" + (f" ({done:,} so far)" if done else ""))
+    elif status["state"] == "missing":
+        # Expired or pruned: rerun, so keyed jobs are submitted again and callers drop stale ids.
+        jobs_pending = True
+    return status
+
+# Background job: passages of an uploaded TXT or PDF file (PDF pages are extracted in parallel)
+def extract_passages(file_type, data, name, progress=None):
+    metrics.count("bytes_uploaded", len(data), source="notes")
+    if file_type == "text/plain":
+        chunks = chunk_text(data.decode("utf-8"), source=name)
+    elif file_type == "application/pdf":
+        chunks = chunk_pdf(io.BytesIO(data), source=name)
     else:
         return None
+    passages = []
+    for chunk in chunks:
+        passages.append(chunk["text"])
+        if progress and len(passages) % 50 == 0:
+            progress(len(passages))
+    return passages
+
+# Background job: chat history as PDF bytes
+def build_chat_pdf(history):
+    from fpdf import FPDF
+    pdf = FPDF()
+    pdf.add_page()
+    pdf.set_font("Arial", size=12)
+    pdf.set_auto_page_break(auto=True, margin=15)
+    pdf.cell(200, 10, txt="AI Study Buddy - Chat Log", ln=True, align="C")
+    pdf.ln(5)
+
+    for speaker, message in history:
+        label = "You: " if speaker == "You" else "AI: "
+        pdf.multi_cell(0, 10, txt=f"{label}{message}\n")
+
+    pdf_bytes = pdf.output(dest="S")
+    if isinstance(pdf_bytes, str):
+        pdf_bytes = pdf_bytes.encode("latin-1")
+    return bytes(pdf_bytes)
+
+# Background job: transcript of an uploaded recording
+def transcribe_job(audio_data):
+    metrics.count("bytes_uploaded", len(audio_data), source="audio")
+    transcript = transcribe_audio(audio_data)
+    if transcript.startswith("❌"):
+        raise RuntimeError(transcript.lstrip("❌ "))
+    return transcript
+
+# Background job: MP3 speech; progress carries the first segment's path as soon as it is playable
+def synthesize_job(text, progress=None):
+    segments = []
+
+    def on_segment(index, path):
+        segments.append(path)
+        if progress:
+            progress(len(segments), message=segments[0])
+
+    audio_file = text_to_speech(text, on_segment=on_segment)
+    if not audio_file or audio_file.startswith("❌"):
+        raise RuntimeError((audio_file or "No audio produced").lstrip("❌ "))
+    return audio_file, len(segments)
+
+if show_metrics:
+    show_metrics_panel(st.sidebar)
 
 # === AI Study Buddy Page ===
 if page == "AI Study Buddy 🤖":
@@ -52,12 +176,31 @@ if page == "AI Study Buddy 🤖":
 
     notes_file = st.file_uploader("📄 Upload Notes (TXT or PDF):", type=["txt", "pdf"])
     if notes_file:
-        text = extract_text_from_file(notes_file)
-        if text:
+        notes_data = notes_file.getvalue()
+        notes_id = hashlib.sha256(notes_data).hexdigest()
+        if notes_id in st.session_state.loaded_notes:
             st.success("✅ Notes loaded successfully!")
-            st.session_state.knowledge_base += "\n" + text
         else:
-            st.error("❌ Could not extract text from file.")
+            job_id = get_job_queue().submit(
+                "ingest", extract_passages, notes_file.type, notes_data, notes_file.name,
+                key=job_key("ingest", notes_id)
+            )
+            status = show_job(job_id, "Reading notes...")
+            if status["state"] == "completed":
+                passages = get_job_queue().result(job_id)
+                if passages:
+                    st.success("✅ Notes loaded successfully!")
+                    st.session_state.knowledge_index.add_many(passages)
+                    st.session_state.loaded_notes.add(notes_id)
+                else:
+                    st.error("❌ Could not extract text from file.")
+            elif status["state"] == "error":
+                st.error(f"❌ Could not extract text from file: {status['error']}")
+                if st.button("🔁 Retry", key="retry_ingest"):
+                    get_job_queue().forget(job_id)
+                    st.rerun()
+
+    token_budget = st.slider("🧮 Context token budget per question:", 200, 4000, 1000, step=100)
 
     user_text = st.text_input("💬 Type your question here:", key="ai_study_buddy_user_text")
 
@@ -67,15 +210,34 @@ if page == "AI Study Buddy 🤖":
             st.warning("⚠️ Please enter a question.")
         else:
             try:
-                prompt = f"{st.session_state.knowledge_base}\n\nQuestion: {question}\nAnswer:"
-                response = generate_response(prompt)
-                st.session_state.history.append(("You", question))
-                st.session_state.history.append(("AI", response))
-                save_chat_log(question, response)
+                with trace_request("ask", token_budget=token_budget):
+                    index = st.session_state.knowledge_index
+                    with metrics.span("retrieve"):
+                        context = "\n\n".join(select_passages(index, question, token_budget))
+                    st.session_state.last_tokens_saved = index.total_tokens - estimate_tokens(context)
+                    st.session_state.tokens_saved += st.session_state.last_tokens_saved
+                    metrics.count("prompt_tokens_saved", st.session_state.last_tokens_saved)
+                    prompt = f"{context}\n\nQuestion: {question}\nAnswer:"
+                    st.markdown(chat_bubble("You", question), unsafe_allow_html=True)
+                    answer_box = st.empty()
+                    pieces = []
+                    for piece in generate_response_stream(prompt, question=question):
+                        pieces.append(piece)
+                        answer_box.markdown(chat_bubble("AI", "".join(pieces) + "▌"), unsafe_allow_html=True)
+                    response = "".join(pieces).strip()
+                    st.session_state.history.append(("You", question))
+                    st.session_state.history.append(("AI", response))
+                    save_chat_log(question, response)
                 st.rerun()
             except Exception as e:
                 st.error(f"❌ Error generating response: {e}")
 
+    if "last_tokens_saved" in st.session_state:
+        st.caption(
+            f"🪙 Prompt tokens saved: {st.session_state.last_tokens_saved:,} on the last question, "
+            f"{st.session_state.tokens_saved:,} this session."
+        )
+
     if st.button("🗑️ Clear Chat History"):
         st.session_state.history = []
         st.rerun()
@@ -83,37 +245,25 @@ if page == "AI Study Buddy 🤖":
     if st.session_state.history:
         st.markdown("### 💬 Chat History")
         for speaker, message in st.session_state.history:
-            if speaker == "You":
-                st.markdown(
-                    f"<div style='text-align: right; background-color: #DCF8C6; padding: 10px; "
-                    f"border-radius: 10px; margin: 5px;'>{message}</div>",
-                    unsafe_allow_html=True,
-                )
-            else:
-                st.markdown(
-                    f"<div style='text-align: left; background-color: #F1F0F0; padding: 10px; "
-                    f"border-radius: 10px; margin: 5px;'>{message}</div>",
-                    unsafe_allow_html=True,
-                )
+            st.markdown(chat_bubble(speaker, message), unsafe_allow_html=True)
 
         if st.button("📄 Download Chat History as PDF"):
-            pdf = FPDF()
-            pdf.add_page()
-            pdf.set_font("Arial", size=12)
-            pdf.set_auto_page_break(auto=True, margin=15)
-            pdf.cell(200, 10, txt="AI Study Buddy - Chat Log", ln=True, align="C")
-            pdf.ln(5)
-
-            for speaker, message in st.session_state.history:
-                label = "You: " if speaker == "You" else "AI: "
-                pdf.multi_cell(0, 10, txt=f"{label}{message}\n")
-
-            with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp:
-                pdf.output(tmp.name)
-                with open(tmp.name, "rb") as f:
-                    st.download_button(
-                        "📥 Click to Download PDF", data=f, file_name="chat_history.pdf"
-                    )
+            history = list(st.session_state.history)
+            st.session_state.pdf_job = get_job_queue().submit(
+                "pdf_export", build_chat_pdf, history, key=job_key("pdf_export", repr(history)), retry=True
+            )
+        if "pdf_job" in st.session_state:
+            status = show_job(st.session_state.pdf_job, "Building PDF...")
+            if status["state"] == "completed":
+                st.download_button(
+                    "📥 Click to Download PDF", data=get_job_queue().result(st.session_state.pdf_job),
+                    file_name="chat_history.pdf"
+                )
+            elif status["state"] == "error":
+                st.error(f"❌ Error building PDF: {status['error']}")
+            elif status["state"] == "missing":
+                del st.session_state.pdf_job
+                st.warning("⚠️ That PDF has expired. Please build it again.")
 
 # === Accessibility Tool ===
 elif page == "Accessibility Tool 🎧":
@@ -123,15 +273,19 @@ elif page == "Accessibility Tool 🎧":
     st.subheader("🗣️ Speech to Text (WAV or MP3)")
     voice_file = st.file_uploader("Upload WAV or MP3 file:", type=["wav", "mp3"], key="voice_upload")
     if voice_file:
-        try:
-            with tempfile.NamedTemporaryFile(delete=False, suffix=".wav") as temp_audio:
-                temp_audio.write(voice_file.read())
-                temp_audio.flush()
-                transcript = transcribe_audio(temp_audio.name)
+        voice_data = voice_file.getvalue()
+        job_id = get_job_queue().submit(
+            "transcribe", transcribe_job, voice_data, key=job_key("transcribe", voice_data)
+        )
+        status = show_job(job_id, "Transcribing...")
+        if status["state"] == "completed":
             st.success("✅ Transcription Complete!")
-            st.markdown(f"**Transcript:** {transcript}")
-        except Exception as e:
-            st.error(f"❌ Error during transcription: {e}")
+            st.markdown(f"**Transcript:** {get_job_queue().result(job_id)}")
+        elif status["state"] == "error":
+            st.error(f"❌ Error during transcription: {status['error']}")
+            if st.button("🔁 Retry", key="retry_transcribe"):
+                get_job_queue().forget(job_id)
+                st.rerun()
 
     st.markdown("---")
     st.subheader("🔊 Text to Speech (Online, MP3)")
@@ -141,14 +295,28 @@ elif page == "Accessibility Tool 🎧":
         if not tts_text.strip():
             st.warning("⚠️ Please enter some text.")
         else:
-            try:
-                audio_file = text_to_speech(tts_text)
-                if audio_file and not audio_file.startswith("❌"):
-                    st.audio(audio_file, format="audio/mp3")
-                else:
-                    st.error(audio_file)
-            except Exception as e:
-                st.error(f"❌ Error generating audio: {e}")
+            st.session_state.tts_job = get_job_queue().submit(
+                "tts", synthesize_job, tts_text, key=job_key("tts", tts_text), retry=True
+            )
+    if "tts_job" in st.session_state:
+        status = show_job(st.session_state.tts_job, "Generating speech...")
+        first_segment = (status["progress"] or (None, None, None))[2]
+        if first_segment and os.path.exists(first_segment):
+            st.audio(first_segment, format="audio/mp3", autoplay=True)
+        if status["state"] == "completed":
+            audio_file, segment_count = get_job_queue().result(st.session_state.tts_job)
+            if not os.path.exists(audio_file):
+                # Evicted from the audio cache since; synthesize again on the next click.
+                get_job_queue().forget(st.session_state.tts_job)
+                del st.session_state.tts_job
+                st.warning("⚠️ That audio has expired. Please convert it again.")
+            elif not first_segment or segment_count > 1:
+                st.audio(audio_file, format="audio/mp3")
+        elif status["state"] == "error":
+            st.error(f"❌ Error generating audio: {status['error']}")
+        elif status["state"] == "missing":
+            del st.session_state.tts_job
+            st.warning("⚠️ That audio has expired. Please convert it again.")
 
 # === Custom Content Generator ===
 elif page == "Custom Content Generator ✍️":
@@ -161,7 +329,8 @@ elif page == "Custom Content Generator ✍️":
             st.warning("Please enter a topic.")
         else:
             try:
-                result = generate_custom_content(topic)
+                with trace_request("custom_content"):
+                    result = generate_custom_content(topic)
                 st.markdown("### 📖 Generated Educational Content:")
                 st.write(result)
             except Exception as e:
@@ -171,16 +340,23 @@ elif page == "Custom Content Generator ✍️":
 elif page == "Chat History 📚":
     st.title("📚 Chat Log Viewer")
 
+    PAGE_SIZE = 20
+    search = st.text_input("🔎 Search questions and answers:", key="chat_history_search")
+    if st.session_state.get("chat_history_last_search") != search:
+        st.session_state.chat_history_last_search = search
+        st.session_state.chat_history_cursors = [None]
+
     try:
-        conn = sqlite3.connect("chat_log.db")
-        cursor = conn.cursor()
-        cursor.execute("SELECT timestamp, question, answer FROM chat_log ORDER BY id DESC")
-        rows = cursor.fetchall()
+        cursors = st.session_state.chat_history_cursors
+        rows = get_chat_log_page(search, before_id=cursors[-1], page_size=PAGE_SIZE + 1)
+        has_older = len(rows) > PAGE_SIZE
+        rows = rows[:PAGE_SIZE]
 
         if not rows:
-            st.info("No chat logs found.")
+            st.info("No matching chat logs found." if search.strip() else "No chat logs found.")
         else:
-            for ts, q, a in rows:
+            st.caption(f"Page {len(cursors)}")
+            for _, ts, q, a in rows:
                 st.markdown(
                     f"""
                     <div style='background-color: #FAFAFA; padding: 15px; margin-bottom: 10px; border-radius: 10px; box-shadow: 0 0 5px #DDD;'>
@@ -191,6 +367,17 @@ elif page == "Chat History 📚":
                     """,
                     unsafe_allow_html=True,
                 )
-        conn.close()
+
+        newer_col, older_col = st.columns(2)
+        if len(cursors) > 1 and newer_col.button("◀ Newer"):
+            cursors.pop()
+            st.rerun()
+        if has_older and older_col.button("Older ▶"):
+            cursors.append(rows[-1][0])
+            st.rerun()
     except Exception as e:
         st.error(f"❌ Error reading chat log: {e}")
+
+if jobs_pending:
+    time.sleep(1)
+    st.rerun()
@@ -0,0 +1,171 @@
+import io
+
+MIME_TYPES = {
+    "wav": "audio/wav",
+    "mp3": "audio/mp3",
+    "m4a": "audio/mp4",
+    "ogg": "audio/ogg",
+    "flac": "audio/flac",
+}
+
+
+class AudioBuffer:
+    """Encoded audio held once in memory and shared by playback, download and upload.
+
+    st.audio, st.download_button and the transcriber all accept the same
+    `data` bytes object, so a recording is encoded once and never written to
+    or re-read from disk.
+    """
+
+    def __init__(self, data: bytes, audio_format: str = "wav"):
+        self.data = data
+        self.format = audio_format
+
+    def __len__(self):
+        return len(self.data)
+
+    @property
+    def mime(self) -> str:
+        return MIME_TYPES.get(self.format, "application/octet-stream")
+
+    def getbuffer(self):
+        """Zero-copy view of the encoded bytes, as io.BytesIO.getbuffer() provides."""
+        return memoryview(self.data)
+
+    @classmethod
+    def from_pcm(cls, samples, sample_rate: int, subtype: str = "PCM_16"):
+        """Encode float or int PCM samples (frames x channels) as an in-memory WAV."""
+        import soundfile as sf
+        buf = io.BytesIO()
+        sf.write(buf, samples, sample_rate, format="WAV", subtype=subtype)
+        return cls(buf.getvalue(), "wav")
+
+
+def to_mono(samples):
+    """Downmix (frames x channels) audio to a 1-D float32 array."""
+    import numpy as np
+    samples = np.asarray(samples, dtype=np.float32)
+    if samples.ndim == 2:
+        samples = samples.mean(axis=1, dtype=np.float32)
+    return samples
+
+
+def resample(samples, source_rate: int, target_rate: int):
+    """Vectorized resampling of mono float32 audio.
+
+    Downsampling first applies a windowed-sinc low-pass at the new Nyquist
+    frequency to avoid aliasing, then interpolates linearly onto the new grid.
+    """
+    import numpy as np
+    samples = np.asarray(samples, dtype=np.float32)
+    if source_rate == target_rate or not len(samples):
+        return samples
+    if target_rate < source_rate:
+        cutoff = 0.5 * target_rate / source_rate
+        taps = np.arange(-32, 33)
+        kernel = 2 * cutoff * np.sinc(2 * cutoff * taps) * np.hamming(len(taps))
+        samples = np.convolve(samples, (kernel / kernel.sum()).astype(np.float32), mode="same")
+    duration = len(samples) / source_rate
+    target_times = np.arange(int(duration * target_rate)) / target_rate
+    source_times = np.arange(len(samples)) / source_rate
+    return np.interp(target_times, source_times, samples).astype(np.float32)
+
+
+def frame_to_mono(frame):
+    """Convert a PyAV AudioFrame (packed or planar, int or float) to mono float32 in [-1, 1]."""
+    import numpy as np
+    data = frame.to_ndarray()
+    channels = len(frame.layout.channels)
+    if frame.format.is_planar:
+        data = data.reshape(channels, -1).T
+    else:
+        data = data.reshape(-1, channels)
+    if np.issubdtype(data.dtype, np.integer):
+        data = data.astype(np.float32) / float(np.iinfo(data.dtype).max + 1)
+    return to_mono(data)
+
+
+class PCMBuffer:
+    """Preallocated mono float32 buffer for captured audio frames.
+
+    Storage grows by doubling, so appending a frame is a slice copy rather than
+    a list append plus a full concatenate on every rerun. With max_seconds set
+    it becomes a ring that keeps only the most recent audio, so memory stays
+    flat however long the recording runs.
+    """
+
+    def __init__(self, sample_rate: int = None, initial_seconds: float = 10.0, max_seconds: float = None):
+        self.sample_rate = sample_rate
+        self.initial_seconds = initial_seconds
+        self.max_seconds = max_seconds
+        self._data = None
+        self._size = 0
+        self._start = 0
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def duration(self) -> float:
+        return self._size / self.sample_rate if self.sample_rate else 0.0
+
+    def _allocate(self, capacity: int):
+        import numpy as np
+        if self.max_seconds:
+            capacity = min(capacity, int(self.max_seconds * self.sample_rate))
+        data = np.empty(capacity, dtype=np.float32)
+        if self._size:
+            data[:self._size] = self.samples()
+        self._data = data
+        self._start = 0
+
+    def append(self, samples, sample_rate: int):
+        """Append mono samples; a frame at a different rate is resampled to the buffer's rate."""
+        if self.sample_rate is None:
+            self.sample_rate = sample_rate
+        elif sample_rate != self.sample_rate:
+            samples = resample(samples, sample_rate, self.sample_rate)
+        n = len(samples)
+        if not n:
+            return
+        if self._data is None:
+            self._allocate(max(n, int(self.initial_seconds * self.sample_rate)))
+        capacity = len(self._data)
+        if self._size + n > capacity and not (self.max_seconds and capacity >= self.max_seconds * self.sample_rate):
+            grown = capacity
+            while grown < self._size + n:
+                grown *= 2
+            self._allocate(grown)
+            capacity = len(self._data)
+        if n >= capacity:
+            self._data[:] = samples[-capacity:]
+            self._start, self._size = 0, capacity
+            return
+        end = (self._start + self._size) % capacity
+        first = min(n, capacity - end)
+        self._data[end:end + first] = samples[:first]
+        self._data[:n - first] = samples[first:]
+        overflow = max(0, self._size + n - capacity)
+        self._start = (self._start + overflow) % capacity
+        self._size = min(capacity, self._size + n)
+
+    def append_frame(self, frame):
+        self.append(frame_to_mono(frame), frame.sample_rate)
+
+    def samples(self):
+        """The captured audio in order (a view when it is contiguous)."""
+        import numpy as np
+        if self._data is None:
+            return np.empty(0, dtype=np.float32)
+        end = self._start + self._size
+        if end <= len(self._data):
+            return self._data[self._start:end]
+        return np.concatenate([self._data[self._start:], self._data[:end - len(self._data)]])
+
+    def clear(self):
+        self._size = 0
+        self._start = 0
+
+    def to_audio_buffer(self, target_rate: int = 16000) -> AudioBuffer:
+        """Encode as 16-bit mono WAV at target_rate, the smallest form the transcriber accepts well."""
+        return AudioBuffer.from_pcm(resample(self.samples(), self.sample_rate, target_rate), target_rate)
@@ -0,0 +1,83 @@
+import atexit
+import queue
+import threading
+import time
+
+
+class BatchWriter:
+    """Queue items and hand them to _write_batch() in batches from one background thread.
+
+    A batch is written once `batch_size` items are waiting or `flush_interval`
+    seconds after its first item, whichever comes first. flush() blocks until
+    everything queued so far is written; close() runs at interpreter exit.
+    Subclasses set up their output before calling __init__, which starts the
+    thread, and implement _write_batch(items).
+    """
+
+    error_message = "Error writing batch"
+
+    def __init__(self, name: str, batch_size: int = 256, flush_interval: float = 1.0):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def _write_batch(self, items):
+        raise NotImplementedError
+
+    def _enqueue(self, item) -> bool:
+        """Queue item; False once the writer is closed."""
+        if self._closed:
+            return False
+        self._queue.put(item)
+        return True
+
+    def flush(self, timeout: float = None) -> bool:
+        """Wait until every item queued before this call is written."""
+        if self._closed:
+            return True
+        done = threading.Event()
+        self._queue.put(done)
+        return done.wait(timeout)
+
+    def close(self):
+        if self._closed:
+            return
+        self.flush()
+        self._closed = True
+        self._queue.put(None)
+        self._thread.join()
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            items, waiters, stop = [], [], False
+            deadline = time.monotonic() + self.flush_interval
+            while True:
+                if item is None:
+                    stop = True
+                elif isinstance(item, threading.Event):
+                    waiters.append(item)
+                else:
+                    items.append(item)
+                if stop or waiters or len(items) >= self.batch_size:
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+            if items:
+                try:
+                    self._write_batch(items)
+                except Exception as e:
+                    print(f"❌ {self.error_message}: {e}")
+            for waiter in waiters:
+                waiter.set()
+            if stop:
+                return
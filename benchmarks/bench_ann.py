@@ -0,0 +1,78 @@
+"""Recall@k versus latency of the IVF index (float32, int8, PQ) against exact search.
+
+Vectors are drawn around random topic centres, like embeddings of a course
+library, and queries are perturbed copies of stored vectors. Each row is one
+operating point; pick the n_probe/quantization pair that meets the recall a
+deployment needs (set it with ANN_INDEX and ANN_PROBES). PQ is the
+memory-saving option: in pure NumPy its table lookups cost more per
+vector than a float32 dot product, so it pays off only at small n_probe.
+
+Run from the repository root:
+    python benchmarks/bench_ann.py [vectors] [dim]
+"""
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ann_index import IVFIndex
+from vector_index import VectorIndex, normalize_rows
+
+VECTORS = 50_000
+DIM = 1024
+TOPICS = 500
+TOP_K = 10
+QUERIES = 100
+PROBES = (1, 4, 8, 16, 32, 64)
+
+
+def synthetic(rng, n, dim):
+    centres = rng.standard_normal((TOPICS, dim)).astype(np.float32)
+    vectors = centres[rng.integers(0, TOPICS, n)] + 0.7 * rng.standard_normal((n, dim)).astype(np.float32)
+    return normalize_rows(vectors)
+
+
+def per_query_ms(fn, queries):
+    start = time.perf_counter()
+    results = [fn(query) for query in queries]
+    return results, (time.perf_counter() - start) / len(queries) * 1000
+
+
+def recall(results, truth):
+    return np.mean([len(set(found) & set(expected)) / len(expected) for found, expected in zip(results, truth)])
+
+
+def main(n, dim):
+    rng = np.random.default_rng(0)
+    vectors = synthetic(rng, n, dim)
+    queries = normalize_rows(vectors[rng.integers(0, n, QUERIES)] + 0.2 * rng.standard_normal((QUERIES, dim)))
+
+    exact = VectorIndex(dim=dim)
+    exact.add_many(vectors, [""] * n)
+    truth, exact_ms = per_query_ms(lambda q: [i for i, _ in exact.search(q, TOP_K)], queries)
+    print(f"{n} vectors x {dim} dims; exact search {exact_ms:.2f} ms/query, {vectors.nbytes / 1e6:.0f} MB")
+    print(f"{'index':>14} {'n_probe':>7} {'recall@10':>9} {'ms/query':>9} {'speedup':>8} {'MB':>7}")
+
+    for quantization in (None, "int8", "pq"):
+        index = IVFIndex(quantization=quantization)
+        start = time.perf_counter()
+        index.train(vectors)
+        index.add(np.arange(n), vectors)
+        build = time.perf_counter() - start
+        label = f"ivf-{quantization or 'f32'}"
+        for rerank in ((False, True) if quantization else (False,)):
+            for n_probe in PROBES:
+                search = (lambda q: [i for i, _ in index.search(q, TOP_K, n_probe, exact=vectors)]) if rerank \
+                    else (lambda q: [i for i, _ in index.search(q, TOP_K, n_probe)])
+                results, ms = per_query_ms(search, queries)
+                print(f"{label + ('+rerank' if rerank else ''):>14} {n_probe:>7} {recall(results, truth):>9.3f} "
+                      f"{ms:>9.2f} {exact_ms / ms:>7.1f}x {index.nbytes / 1e6:>7.1f}")
+        print(f"{label:>14} built in {build:.1f} s")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else VECTORS,
+         int(sys.argv[2]) if len(sys.argv) > 2 else DIM)
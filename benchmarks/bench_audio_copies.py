@@ -0,0 +1,63 @@
+"""Bytes copied or written per recorder request: old temp-file path vs AudioBuffer.
+
+Each stage's materialized buffer (or disk write/read) is counted once, for a
+synthetic one-minute recording. The upload sink stands in for the transcriber.
+
+Run from the repository root:
+    python benchmarks/bench_audio_copies.py
+"""
+import io
+import os
+import sys
+import tempfile
+
+import numpy as np
+import soundfile as sf
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from audio_buffer import AudioBuffer
+from transcription import audio_source
+
+SAMPLE_RATE = 16000
+SECONDS = 60
+
+
+def old_pipeline(audio_data, workdir):
+    copied = 0
+    buf = io.BytesIO()
+    sf.write(buf, audio_data, SAMPLE_RATE, format="wav")
+    copied += buf.tell()
+    buf.seek(0)
+    playback = buf.read()                      # st.audio(buf.read())
+    copied += len(playback)
+    wav_path = os.path.join(workdir, "recorded_audio.wav")
+    sf.write(wav_path, audio_data, SAMPLE_RATE)  # second encode, to disk
+    copied += os.path.getsize(wav_path)
+    with open(wav_path, "rb") as f:            # download_button reads the file
+        copied += len(f.read())
+    with open(wav_path, "rb") as f:            # requests multipart upload reads it again
+        copied += len(f.read())
+    return copied
+
+
+def new_pipeline(audio_data):
+    recording = AudioBuffer.from_pcm(audio_data, SAMPLE_RATE)
+    copied = len(recording.data)               # the single encode
+    body = audio_source(recording)             # memoryview, no copy
+    assert isinstance(body, memoryview)
+    return copied
+
+
+def main():
+    frames = np.random.default_rng(0).uniform(-0.5, 0.5, (SAMPLE_RATE * SECONDS, 1)).astype(np.float32)
+    with tempfile.TemporaryDirectory() as workdir:
+        old = old_pipeline(frames, workdir)
+    new = new_pipeline(frames)
+    print(f"recording: {SECONDS}s mono at {SAMPLE_RATE} Hz")
+    print(f"old path: {old / 1e6:8.2f} MB copied or written")
+    print(f"new path: {new / 1e6:8.2f} MB copied or written ({old / new:.1f}x less)")
+
+
+if __name__ == "__main__":
+    main()
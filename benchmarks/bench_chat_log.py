@@ -0,0 +1,84 @@
+"""Rows per second: connect-per-insert save_chat_log vs the batched ChatLogWriter.
+
+Run from the repository root:
+    python benchmarks/bench_chat_log.py
+"""
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from chat_log import CHAT_LOG_SCHEMA, ChatLogWriter
+
+ROWS = 2_000
+THREADS = 4
+
+
+def save_chat_log_per_insert(user_input, response, db_path):
+    """The original save_chat_log from utils.py."""
+    conn = sqlite3.connect(db_path)
+    c = conn.cursor()
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS chat_log (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            timestamp TEXT,
+            question TEXT,
+            answer TEXT
+        )
+    ''')
+    c.execute('''
+        INSERT INTO chat_log (timestamp, question, answer)
+        VALUES (?, ?, ?)
+    ''', (datetime.now().isoformat(), user_input, response))
+    conn.commit()
+    conn.close()
+
+
+def run_threads(target):
+    per_thread = ROWS // THREADS
+    threads = [threading.Thread(target=target, args=(per_thread,)) for _ in range(THREADS)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - start
+
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        old_db = os.path.join(tmp, "old.db")
+
+        def old_worker(n):
+            for i in range(n):
+                while True:
+                    try:
+                        save_chat_log_per_insert(f"question {i}", "answer " * 50, old_db)
+                        break
+                    except sqlite3.OperationalError:
+                        time.sleep(0.001)
+
+        old_seconds = run_threads(old_worker)
+
+        writer = ChatLogWriter(os.path.join(tmp, "new.db"), CHAT_LOG_SCHEMA)
+
+        def new_worker(n):
+            for i in range(n):
+                writer.write(f"question {i}", "answer " * 50)
+
+        new_seconds = run_threads(new_worker)
+        start = time.perf_counter()
+        writer.close()
+        new_seconds += time.perf_counter() - start
+
+        print(f"connect-per-insert: {ROWS / old_seconds:10.0f} rows/s")
+        print(f"ChatLogWriter:      {ROWS / new_seconds:10.0f} rows/s ({writer.rows_written} rows committed)")
+
+
+if __name__ == "__main__":
+    main()
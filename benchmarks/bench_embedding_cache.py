@@ -0,0 +1,33 @@
+"""Measure cold vs warm corpus loading through CachedEmbedder with FakeEmbedder.
+
+Run from the repository root:
+    python benchmarks/bench_embedding_cache.py
+"""
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from embeddings import CachedEmbedder, EmbeddingCache, FakeEmbedder
+
+
+def main():
+    texts = [f"Lecture note {i}: gradient descent updates weights step {i % 97}." for i in range(5_000)]
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = EmbeddingCache(os.path.join(tmp, "embedding_cache.db"))
+        for label in ("cold", "warm"):
+            fake = FakeEmbedder()
+            embedder = CachedEmbedder(fake, cache)
+            start = time.perf_counter()
+            for i in range(0, len(texts), fake.batch_size):
+                embedder.embed(texts[i:i + fake.batch_size])
+            elapsed = (time.perf_counter() - start) * 1000
+            print(f"{label}: {elapsed:8.1f} ms, provider calls={fake.calls}, "
+                  f"hits={embedder.hits}, misses={embedder.misses}")
+        cache.close()
+
+
+if __name__ == "__main__":
+    main()
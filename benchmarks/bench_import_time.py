@@ -0,0 +1,106 @@
+"""Cold-start and per-rerun import cost of the app scripts and their modules.
+
+Cold start runs each target in a fresh interpreter under `python -X importtime`
+and reports the cumulative import time plus the heaviest imports. Per rerun
+re-executes an app script's top-level import statements in a warm interpreter,
+which is what Streamlit does on every widget interaction.
+
+Run from the repository root:
+    python benchmarks/bench_import_time.py [module-or-script ...]
+"""
+import ast
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+DEFAULT_TARGETS = ["utils", "utils-DESKTOP-9CBAKML.py", "app.py", "app-DESKTOP-9CBAKML.py"]
+RUNS = 5
+RERUNS = 200
+TOP = 8
+
+# Executes the import statements of a script: once cold, then RERUNS times warm.
+RERUN_PROBE = """
+import sys, time
+sys.path.insert(0, {root!r})
+code = compile({source!r}, {name!r}, "exec")
+start = time.perf_counter()
+exec(code, {{"__name__": "__bench__"}})
+cold = time.perf_counter() - start
+start = time.perf_counter()
+for _ in range({reruns}):
+    exec(code, {{"__name__": "__bench__"}})
+print(cold, (time.perf_counter() - start) / {reruns})
+"""
+
+
+def import_statements(path):
+    """Source of a script's top-level import statements, in order."""
+    with open(path, encoding="utf-8") as f:
+        tree = ast.parse(f.read(), path)
+    nodes = [node for node in tree.body if isinstance(node, (ast.Import, ast.ImportFrom))]
+    return "\n".join(ast.unparse(node) for node in nodes)
+
+
+def probe_code(target):
+    """Code importing target; scripts are reduced to their import statements."""
+    if target.endswith(".py"):
+        return import_statements(os.path.join(ROOT, target))
+    return f"import {target}"
+
+
+def importtime(code):
+    """(total cumulative microseconds, [(self_us, cumulative_us, module)]) from -X importtime."""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=ROOT, capture_output=True, text=True,
+    )
+    if proc.returncode:
+        raise RuntimeError(proc.stderr.strip().splitlines()[-1])
+    rows = []
+    total = 0
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        rows.append((int(self_us), int(cumulative_us), name.rstrip()))
+        if not name.startswith("  "):
+            total += int(cumulative_us)
+    return total, rows
+
+
+def cold_start(target):
+    code = probe_code(target)
+    totals = []
+    for _ in range(RUNS):
+        total, rows = importtime(code)
+        totals.append(total)
+    print(f"\n{target}: cold imports {statistics.median(totals) / 1000:.1f} ms incl. interpreter startup (median of {RUNS})")
+    for self_us, cumulative_us, name in sorted(rows, key=lambda row: -row[1])[:TOP]:
+        print(f"  {cumulative_us / 1000:8.1f} ms cumulative {self_us / 1000:7.1f} ms self  {name.strip()}")
+
+
+def per_rerun(target):
+    source = import_statements(os.path.join(ROOT, target))
+    probe = RERUN_PROBE.format(root=ROOT, source=source, name=target, reruns=RERUNS)
+    proc = subprocess.run([sys.executable, "-c", probe], cwd=ROOT, capture_output=True, text=True)
+    if proc.returncode:
+        raise RuntimeError(proc.stderr.strip().splitlines()[-1])
+    cold, warm = map(float, proc.stdout.split())
+    print(f"  script imports: first run {cold * 1000:.1f} ms, each rerun {warm * 1e6:.1f} us")
+
+
+def main(targets):
+    for target in targets:
+        try:
+            cold_start(target)
+            if target.endswith(".py"):
+                per_rerun(target)
+        except RuntimeError as e:
+            print(f"\n{target}: unavailable here ({e})")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:] or DEFAULT_TARGETS)
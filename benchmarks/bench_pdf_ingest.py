@@ -0,0 +1,65 @@
+"""PDF ingestion time: serial `text +=` extraction vs parallel streaming extraction vs a cache hit.
+
+Builds a synthetic textbook with fpdf and ingests it into chunk records.
+Needs PyPDF2 and fpdf.
+
+Run from the repository root:
+    python benchmarks/bench_pdf_ingest.py [pages]
+"""
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from chunking import chunk_pages, chunk_text
+from pdf_ingest import PageTextCache, extract_pages
+
+PAGES = 300
+SENTENCE = "Gradient descent updates each parameter against the slope of the loss. "
+
+
+def build_pdf(path, pages):
+    from fpdf import FPDF
+    pdf = FPDF()
+    pdf.set_font("Arial", size=10)
+    for number in range(pages):
+        pdf.add_page()
+        pdf.multi_cell(0, 5, f"Chapter {number}. " + SENTENCE * 40)
+    pdf.output(path)
+
+
+def serial_concat(path):
+    """The original extract_text_from_file followed by chunk_text."""
+    from PyPDF2 import PdfReader
+    pdf = PdfReader(path)
+    text = ""
+    for page in pdf.pages:
+        text += (page.extract_text() or "") + "\n"
+    return list(chunk_text(text, source="book.pdf"))
+
+
+def timed(label, fn):
+    start = time.perf_counter()
+    chunks = fn()
+    elapsed = time.perf_counter() - start
+    print(f"{label:32s} {elapsed:7.2f} s  {len(chunks)} chunks")
+    return elapsed
+
+
+def main(pages):
+    with tempfile.TemporaryDirectory() as workdir:
+        path = os.path.join(workdir, "book.pdf")
+        build_pdf(path, pages)
+        print(f"{pages} pages, {os.path.getsize(path) / 1e6:.1f} MB, {os.cpu_count()} CPUs")
+        cache = PageTextCache(os.path.join(workdir, "cache"))
+
+        serial = timed("serial text += + chunk_text", lambda: serial_concat(path))
+        parallel = timed("parallel streaming (cold)", lambda: list(chunk_pages(extract_pages(path, cache))))
+        cached = timed("cache hit", lambda: list(chunk_pages(extract_pages(path, cache))))
+        print(f"speedup: {serial / parallel:.1f}x cold, {serial / cached:.0f}x cached")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else PAGES)
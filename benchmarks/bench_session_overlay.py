@@ -0,0 +1,58 @@
+"""Memory held per session: a private copy of the base index vs an OverlayIndex over a shared base.
+
+Each simulated session uploads one small set of notes.
+
+Run from the repository root:
+    python benchmarks/bench_session_overlay.py
+"""
+import os
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from retrieval import BM25Index, OverlayIndex
+
+SESSIONS = 50
+BASE_PASSAGES = 5_000
+UPLOAD_PASSAGES = 20
+
+
+def passage(i):
+    return f"Lecture {i % 97} covers topic {i} with gradient descent, regularization and example {i * 7}."
+
+
+BASE = [passage(i) for i in range(BASE_PASSAGES)]
+
+
+def per_session_bytes(make_session):
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    sessions = []
+    for s in range(SESSIONS):
+        index = make_session()
+        index.add_many(f"Session {s} notes, page {p}: my own summary of backpropagation." for p in range(UPLOAD_PASSAGES))
+        sessions.append(index)
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    return used / SESSIONS
+
+
+def private_copy():
+    index = BM25Index()
+    index.add_many(BASE)
+    return index
+
+
+def main():
+    shared = BM25Index()
+    shared.add_many(BASE)
+    copy = per_session_bytes(private_copy)
+    overlay = per_session_bytes(lambda: OverlayIndex(shared))
+    print(f"{SESSIONS} sessions, {BASE_PASSAGES} base passages, {UPLOAD_PASSAGES} uploaded each")
+    print(f"private copy   {copy / 1024:10.1f} KiB/session")
+    print(f"overlay        {overlay / 1024:10.1f} KiB/session  ({copy / overlay:.0f}x less)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""Compare VectorIndex against the original per-document cosine loop.
+
+Run from the repository root:
+    python benchmarks/bench_vector_index.py
+"""
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from vector_index import VectorIndex
+
+DIM = 1024
+TOP_K = 5
+QUERIES = 20
+
+
+def loop_search(query_emb, knowledge_embeddings, top_k):
+    """The original semantic_search ranking from utils-DESKTOP-9CBAKML.py."""
+    def cosine_sim(a, b):
+        return np.dot(a, b) / (np.linalg.norm(a) * np.linalg.norm(b))
+
+    sims = [cosine_sim(query_emb, np.array(doc_emb)) for doc_emb in knowledge_embeddings]
+    return sorted(range(len(sims)), key=lambda i: sims[i], reverse=True)[:top_k]
+
+
+def timed(fn, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+def main():
+    rng = np.random.default_rng(0)
+    queries = rng.standard_normal((QUERIES, DIM)).astype(np.float32)
+    print(f"{'vectors':>8} {'loop ms/q':>10} {'index ms/q':>11} {'batch ms/q':>11} {'speedup':>8}")
+    for n in (1_000, 10_000, 100_000):
+        vectors = rng.standard_normal((n, DIM)).astype(np.float32)
+        as_lists = vectors.tolist() if n <= 10_000 else None
+
+        index = VectorIndex(dim=DIM)
+        index.add_many(vectors, [str(i) for i in range(n)])
+
+        if as_lists is not None:
+            loop_ms = timed(lambda: loop_search(queries[0], as_lists, TOP_K), 3)
+        else:
+            # The list-of-lists loop takes minutes at this size; time a 10k slice and scale.
+            sample = vectors[:10_000].tolist()
+            loop_ms = timed(lambda: loop_search(queries[0], sample, TOP_K), 1) * (n / 10_000)
+        index_ms = timed(lambda: index.search(queries[0], TOP_K), 10)
+        batch_ms = timed(lambda: index.search_many(queries, TOP_K), 3) / QUERIES
+
+        print(f"{n:>8} {loop_ms:>10.2f} {index_ms:>11.3f} {batch_ms:>11.3f} {loop_ms / index_ms:>7.0f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,187 @@
+import os
+import re
+import sqlite3
+import threading
+from datetime import datetime
+
+from batch_writer import BatchWriter
+
+
+class ChatLogSchema:
+    """Table and column names of one chat-log layout.
+
+    Both layouts share the same shape: an autoincrement id, a text timestamp
+    and a question/answer pair.
+    """
+
+    def __init__(self, table: str, question_column: str, answer_column: str, timestamp_format: str = None):
+        self.table = table
+        self.question_column = question_column
+        self.answer_column = answer_column
+        self.timestamp_format = timestamp_format
+
+    def timestamp(self) -> str:
+        now = datetime.now()
+        return now.strftime(self.timestamp_format) if self.timestamp_format else now.isoformat()
+
+    @property
+    def fts_table(self) -> str:
+        return f"{self.table}_fts"
+
+    def create_statements(self):
+        return [
+            f"""CREATE TABLE IF NOT EXISTS {self.table} (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                timestamp TEXT,
+                {self.question_column} TEXT,
+                {self.answer_column} TEXT
+            )""",
+            f"CREATE INDEX IF NOT EXISTS idx_{self.table}_timestamp ON {self.table} (timestamp)",
+        ]
+
+    def fts_statements(self):
+        """External-content FTS5 index over question and answer, kept in sync by triggers."""
+        t, fts = self.table, self.fts_table
+        q, a = self.question_column, self.answer_column
+        return [
+            f"""CREATE VIRTUAL TABLE {fts} USING fts5(
+                {q}, {a}, content='{t}', content_rowid='id'
+            )""",
+            f"""CREATE TRIGGER IF NOT EXISTS {t}_fts_insert AFTER INSERT ON {t} BEGIN
+                INSERT INTO {fts}(rowid, {q}, {a}) VALUES (new.id, new.{q}, new.{a});
+            END""",
+            f"""CREATE TRIGGER IF NOT EXISTS {t}_fts_delete AFTER DELETE ON {t} BEGIN
+                INSERT INTO {fts}({fts}, rowid, {q}, {a}) VALUES ('delete', old.id, old.{q}, old.{a});
+            END""",
+            f"""CREATE TRIGGER IF NOT EXISTS {t}_fts_update AFTER UPDATE ON {t} BEGIN
+                INSERT INTO {fts}({fts}, rowid, {q}, {a}) VALUES ('delete', old.id, old.{q}, old.{a});
+                INSERT INTO {fts}(rowid, {q}, {a}) VALUES (new.id, new.{q}, new.{a});
+            END""",
+            f"INSERT INTO {fts}({fts}) VALUES ('rebuild')",
+        ]
+
+    def insert_statement(self) -> str:
+        return (f"INSERT INTO {self.table} (timestamp, {self.question_column}, {self.answer_column}) "
+                f"VALUES (?, ?, ?)")
+
+
+# chat_log.db written by app.py
+CHAT_LOG_SCHEMA = ChatLogSchema("chat_log", "question", "answer")
+# data/session_logs.db written by the desktop app
+SESSION_LOG_SCHEMA = ChatLogSchema("chat_logs", "user_input", "bot_response", "%Y-%m-%d %H:%M:%S")
+
+
+def connect(db_path: str, schema: ChatLogSchema):
+    """Open a WAL-mode connection and make sure the schema exists."""
+    directory = os.path.dirname(db_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    conn = sqlite3.connect(db_path, timeout=30, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    for statement in schema.create_statements():
+        conn.execute(statement)
+    has_fts = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (schema.fts_table,)
+    ).fetchone()
+    if not has_fts:
+        try:
+            with conn:
+                for statement in schema.fts_statements():
+                    conn.execute(statement)
+        except sqlite3.OperationalError as e:
+            # SQLite built without FTS5: search falls back to LIKE scans.
+            print(f"Full-text search unavailable: {e}")
+    conn.commit()
+    return conn
+
+
+def _fts_query(text: str) -> str:
+    """Turn free text into an FTS5 query: every word must match, the last as a prefix."""
+    words = re.findall(r"\w+", text)
+    if not words:
+        return ""
+    terms = [f'"{word}"' for word in words]
+    terms[-1] += "*"
+    return " ".join(terms)
+
+
+def fetch_page(conn, schema: ChatLogSchema, search: str = "", before_id: int = None, page_size: int = 20):
+    """Return up to page_size (id, timestamp, question, answer) rows, newest first.
+
+    Pages are keyset-paginated: pass the id of the last row of one page as
+    before_id to get the next, so deep pages cost the same as the first.
+    """
+    t, q, a = schema.table, schema.question_column, schema.answer_column
+    before_id = before_id if before_id is not None else 2 ** 63 - 1
+    if not search.strip():
+        return conn.execute(
+            f"SELECT id, timestamp, {q}, {a} FROM {t} WHERE id < ? ORDER BY id DESC LIMIT ?",
+            (before_id, page_size)
+        ).fetchall()
+    try:
+        match = _fts_query(search)
+        if not match:
+            return []
+        return conn.execute(
+            f"""SELECT {t}.id, {t}.timestamp, {t}.{q}, {t}.{a}
+                FROM {schema.fts_table} JOIN {t} ON {t}.id = {schema.fts_table}.rowid
+                WHERE {schema.fts_table} MATCH ? AND {schema.fts_table}.rowid < ?
+                ORDER BY {schema.fts_table}.rowid DESC LIMIT ?""",
+            (match, before_id, page_size)
+        ).fetchall()
+    except sqlite3.OperationalError:
+        pattern = f"%{search.strip()}%"
+        return conn.execute(
+            f"""SELECT id, timestamp, {q}, {a} FROM {t}
+                WHERE id < ? AND ({q} LIKE ? OR {a} LIKE ?) ORDER BY id DESC LIMIT ?""",
+            (before_id, pattern, pattern, page_size)
+        ).fetchall()
+
+
+class ChatLogWriter(BatchWriter):
+    """Queue chat-log rows and group-commit them from one background thread.
+
+    Rows are committed once `batch_size` are waiting or `flush_interval`
+    seconds after the first queued row, whichever comes first. flush() blocks
+    until everything queued so far is on disk; close() runs at interpreter exit.
+    """
+
+    error_message = "Error saving chat log"
+
+    def __init__(self, db_path: str, schema: ChatLogSchema = CHAT_LOG_SCHEMA,
+                 batch_size: int = 256, flush_interval: float = 0.25):
+        self.db_path = db_path
+        self.schema = schema
+        self.rows_written = 0
+        self._conn = connect(db_path, schema)
+        self._insert = schema.insert_statement()
+        super().__init__(f"chat-log-writer:{db_path}", batch_size, flush_interval)
+
+    def write(self, question: str, answer: str, timestamp: str = None):
+        if not self._enqueue((timestamp or self.schema.timestamp(), question, answer)):
+            raise RuntimeError("ChatLogWriter is closed.")
+
+    def close(self):
+        if self._closed:
+            return
+        super().close()
+        self._conn.close()
+
+    def _write_batch(self, rows):
+        self._conn.executemany(self._insert, rows)
+        self._conn.commit()
+        self.rows_written += len(rows)
+
+
+_writers = {}
+_writers_lock = threading.Lock()
+
+
+def get_writer(db_path: str, schema: ChatLogSchema = CHAT_LOG_SCHEMA) -> ChatLogWriter:
+    """Process-wide writer for a database file, created on first use."""
+    with _writers_lock:
+        key = os.path.abspath(db_path)
+        if key not in _writers:
+            _writers[key] = ChatLogWriter(db_path, schema)
+        return _writers[key]
@@ -0,0 +1,100 @@
+import re
+
+DEFAULT_WINDOW = 1000
+DEFAULT_OVERLAP = 200
+
+_SENTENCE_RE = re.compile(r"[^.!?\n]+(?:[.!?]+|\n+|$)")
+
+
+def split_sentences(text: str):
+    """Yield (start, end) character offsets of the sentences in text."""
+    for match in _SENTENCE_RE.finditer(text):
+        start, end = match.span()
+        while start < end and text[start].isspace():
+            start += 1
+        while end > start and text[end - 1].isspace():
+            end -= 1
+        if start < end:
+            yield start, end
+
+
+def _split_long(start: int, end: int, text: str, window: int):
+    """Break a span longer than window at whitespace, falling back to a hard cut."""
+    while end - start > window:
+        cut = text.rfind(" ", start, start + window)
+        if cut <= start:
+            cut = start + window
+        yield start, cut
+        start = cut
+        while start < end and text[start].isspace():
+            start += 1
+    if start < end:
+        yield start, end
+
+
+def chunk_text(text: str, source: str = "upload", window: int = DEFAULT_WINDOW,
+               overlap: int = DEFAULT_OVERLAP, page: int = None):
+    """Yield sentence-aligned chunk records of at most `window` characters.
+
+    Consecutive chunks share up to `overlap` characters of trailing sentences so
+    an answer split across a boundary is still retrievable from one chunk.
+    """
+    if overlap >= window:
+        raise ValueError("overlap must be smaller than window.")
+
+    spans = (
+        span
+        for start, end in split_sentences(text)
+        for span in _split_long(start, end, text, window)
+    )
+
+    current = []
+    for span in spans:
+        if current and span[1] - current[0][0] > window:
+            yield _make_chunk(text, current, source, page)
+            carried = []
+            for prev in reversed(current):
+                if current[-1][1] - prev[0] > overlap or span[1] - prev[0] > window:
+                    break
+                carried.insert(0, prev)
+            current = carried
+        current.append(span)
+    if current:
+        yield _make_chunk(text, current, source, page)
+
+
+def _make_chunk(text: str, spans, source: str, page: int):
+    start, end = spans[0][0], spans[-1][1]
+    return {
+        "text": text[start:end],
+        "source": source,
+        "page": page,
+        "start": start,
+        "end": end,
+    }
+
+
+def chunk_pages(pages, source: str = "upload", window: int = DEFAULT_WINDOW,
+                overlap: int = DEFAULT_OVERLAP):
+    """Chunk an iterable of page texts one page at a time, tagging page numbers."""
+    for page_number, page_text in enumerate(pages, 1):
+        if page_text:
+            yield from chunk_text(page_text, source, window, overlap, page=page_number)
+
+
+def iter_pdf_pages(file):
+    """Yield the extracted text of each page of a PDF file or path."""
+    import PyPDF2
+    reader = PyPDF2.PdfReader(file)
+    for page in reader.pages:
+        yield page.extract_text() or ""
+
+
+def chunk_pdf(file, source: str = "upload", window: int = DEFAULT_WINDOW,
+              overlap: int = DEFAULT_OVERLAP):
+    """Stream chunk records from a PDF without building the full document text.
+
+    Pages are extracted in parallel and their text cached per file hash (see pdf_ingest).
+    """
+    from pdf_ingest import default_cache, extract_pages
+    return chunk_pages(extract_pages(file, default_cache()), source, window, overlap)
@@ -0,0 +1,179 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+from transport import transport as default_transport
+
+COHERE_BATCH_SIZE = 96
+
+
+class CohereEmbedder:
+    """Embed texts with a Cohere client, splitting requests at the provider batch limit."""
+
+    def __init__(self, client, model: str = "small", batch_size: int = COHERE_BATCH_SIZE, transport=None):
+        self.client = client
+        self.model = model
+        self.batch_size = batch_size
+        self.transport = transport or default_transport
+
+    def embed(self, texts):
+        texts = list(texts)
+        vectors = []
+        for i in range(0, len(texts), self.batch_size):
+            response = self.transport.call(
+                "cohere.embed",
+                self.client.embed,
+                texts=texts[i:i + self.batch_size],
+                model=self.model,
+                truncate="RIGHT",
+                request_options=self.transport.request_options("cohere.embed"),
+            )
+            vectors.extend(response.embeddings)
+        return np.asarray(vectors, dtype=np.float32)
+
+
+class FakeEmbedder:
+    """Deterministic offline embedder for tests and benchmarks.
+
+    Words are hashed into a fixed number of buckets, so texts that share
+    vocabulary get similar vectors and cosine ranking still behaves sensibly.
+    """
+
+    def __init__(self, dim: int = 256, model: str = "fake", batch_size: int = COHERE_BATCH_SIZE):
+        self.dim = dim
+        self.model = model
+        self.batch_size = batch_size
+        self.calls = 0
+        self.texts_embedded = 0
+
+    def embed(self, texts):
+        texts = list(texts)
+        self.calls += 1
+        self.texts_embedded += len(texts)
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for word in text.lower().split():
+                digest = hashlib.blake2b(word.encode("utf-8"), digest_size=8).digest()
+                vectors[row, int.from_bytes(digest, "little") % self.dim] += 1.0
+        return vectors
+
+
+def content_key(text: str, model: str) -> str:
+    """Cache key for an embedding: a hash of the model name and the exact text."""
+    return hashlib.sha256(f"{model}\0{text}".encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """On-disk SQLite cache of embeddings with least-recently-used eviction."""
+
+    def __init__(self, db_path: str = "data/embedding_cache.db", max_entries: int = 200_000):
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS embeddings (
+                key TEXT PRIMARY KEY,
+                dim INTEGER,
+                vector BLOB,
+                last_used REAL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_last_used ON embeddings (last_used)")
+        self._conn.commit()
+
+    def get_many(self, keys):
+        """Return {key: vector} for the keys present in the cache."""
+        found = {}
+        with self._lock:
+            for i in range(0, len(keys), 500):
+                batch = keys[i:i + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", batch
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = np.frombuffer(blob, dtype=np.float32)
+            if found:
+                now = time.time()
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE key = ?",
+                    [(now, key) for key in found]
+                )
+                self._conn.commit()
+        return found
+
+    def put_many(self, items):
+        """Store (key, vector) pairs and evict the oldest entries beyond max_entries."""
+        now = time.time()
+        rows = []
+        for key, vector in items:
+            vector = np.asarray(vector, dtype=np.float32)
+            rows.append((key, vector.shape[0], vector.tobytes(), now))
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, dim, vector, last_used) VALUES (?, ?, ?, ?)",
+                rows
+            )
+            self._conn.execute(
+                """DELETE FROM embeddings WHERE key IN (
+                       SELECT key FROM embeddings ORDER BY last_used DESC LIMIT -1 OFFSET ?
+                   )""",
+                (self.max_entries,)
+            )
+            self._conn.commit()
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def close(self):
+        self._conn.close()
+
+
+class CachedEmbedder:
+    """Wrap an embedder so texts already seen for the same model are never re-embedded."""
+
+    def __init__(self, embedder, cache: EmbeddingCache):
+        self.embedder = embedder
+        self.cache = cache
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def model(self):
+        return self.embedder.model
+
+    @property
+    def batch_size(self):
+        return self.embedder.batch_size
+
+    def embed(self, texts):
+        texts = list(texts)
+        keys = [content_key(text, self.model) for text in texts]
+        found = self.cache.get_many(keys)
+
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in found and key not in missing:
+                missing[key] = text
+        self.hits += len(texts) - len(missing)
+        self.misses += len(missing)
+
+        if missing:
+            vectors = self.embedder.embed(list(missing.values()))
+            fresh = dict(zip(missing, vectors))
+            self.cache.put_many(fresh.items())
+            found.update(fresh)
+
+        if not texts:
+            return np.empty((0, 0), dtype=np.float32)
+        return np.stack([found[key] for key in keys])
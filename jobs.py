@@ -0,0 +1,231 @@
+import hashlib
+import inspect
+import multiprocessing
+import os
+import pickle
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+QUEUED = "queued"
+RUNNING = "running"
+COMPLETED = "completed"
+FAILED = "error"
+MISSING = "missing"
+
+
+class JobCancelled(Exception):
+    """Raised by a job's progress callback once cancel() has been called for it."""
+
+    def __init__(self):
+        super().__init__("cancelled")
+
+
+def job_key(*parts) -> str:
+    """De-duplication key for a job: a hash of its kind and inputs (str, bytes or anything with a stable repr)."""
+    digest = hashlib.sha256()
+    for part in parts:
+        if isinstance(part, str):
+            part = part.encode("utf-8")
+        elif not isinstance(part, (bytes, bytearray, memoryview)):
+            part = repr(part).encode("utf-8")
+        digest.update(len(part).to_bytes(8, "big"))
+        digest.update(part)
+    return digest.hexdigest()
+
+
+class JobQueue:
+    """Local background jobs with progress, de-duplication and persisted results.
+
+    submit() returns a job id immediately; a Streamlit page keeps the id in
+    session state and polls status() on later reruns instead of redoing the
+    work. Submitting with the key of a known job returns that job's id, so
+    identical work runs once and polling reruns never restart it; a failed job
+    runs again when submitted with retry=True or after forget(). Completed
+    results are pickled into SQLite and survive restarts for result_ttl
+    seconds; failures are kept in memory only, without their traceback, so
+    the frames and the inputs they reference can be freed. Finished jobs leave
+    memory after result_ttl, and the oldest go first beyond max_jobs; status()
+    then reports them as "missing", so a page holding an old id can submit
+    again instead of failing.
+
+    Jobs run on a thread pool. process=True sends a picklable, module-level
+    function to a process pool instead (no progress reporting there). A
+    thread-pool function that takes a `progress` argument receives a
+    callback progress(done, total=None, message=None). cancel() stops a job
+    that has not started; a running one stops at its next progress() call,
+    which raises JobCancelled. Either way it fails with error "cancelled".
+    """
+
+    def __init__(self, db_path: str = "data/jobs.db", workers: int = 4, process_workers: int = None,
+                 result_ttl: float = 24 * 3600, max_jobs: int = 256):
+        self.db_path = db_path
+        self.result_ttl = result_ttl
+        self.max_jobs = max_jobs
+        self._threads = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="job")
+        self._process_workers = process_workers
+        self._processes = None
+        self._jobs = {}
+        self._lock = threading.Lock()
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                kind TEXT,
+                result BLOB,
+                finished REAL
+            )
+        """)
+        self._conn.execute("DELETE FROM jobs WHERE finished < ?", (time.time() - result_ttl,))
+        self._conn.commit()
+
+    def submit(self, kind: str, fn, *args, key: str = None, process: bool = False, retry: bool = False,
+               **kwargs) -> str:
+        """Queue fn(*args, **kwargs) and return its job id."""
+        job_id = key or uuid.uuid4().hex
+        with self._lock:
+            self._prune()
+            job = self._jobs.get(job_id)
+            if job and not (retry and job["state"] == FAILED):
+                return job_id
+            finished = self._persisted(job_id) if key else None
+            if finished is not None:
+                self._jobs[job_id] = {"id": job_id, "kind": kind, "state": COMPLETED, "progress": None,
+                                      "error": None, "finished": finished}
+                return job_id
+            job = {"id": job_id, "kind": kind, "state": QUEUED, "progress": None, "error": None}
+            self._jobs[job_id] = job
+        if process:
+            with self._lock:
+                if self._processes is None:
+                    # Spawn, not fork: this process has live threads whose locks a fork would copy.
+                    self._processes = ProcessPoolExecutor(max_workers=self._process_workers,
+                                                          mp_context=multiprocessing.get_context("spawn"))
+            future = self._processes.submit(fn, *args, **kwargs)
+        else:
+            if "progress" in inspect.signature(fn).parameters:
+                kwargs["progress"] = lambda done, total=None, message=None: self._report(job, done, total, message)
+            future = self._threads.submit(self._run, job, fn, args, kwargs)
+        job["future"] = future
+        future.add_done_callback(lambda f: self._finish(job, f))
+        return job_id
+
+    @staticmethod
+    def _run(job, fn, args, kwargs):
+        job["state"] = RUNNING
+        return fn(*args, **kwargs)
+
+    @staticmethod
+    def _report(job, done, total, message):
+        if job.get("cancelled"):
+            raise JobCancelled()
+        job["progress"] = (done, total, message)
+
+    def _finish(self, job, future):
+        job.pop("future", None)
+        job["finished"] = now = time.time()
+        if future.cancelled():
+            job["state"], job["error"] = FAILED, "cancelled"
+            return
+        error = future.exception()
+        if error is not None:
+            # The traceback pins every frame of the failed call, uploaded bytes included.
+            error.__context__ = error.__cause__ = None
+            job["state"], job["error"], job["exception"] = FAILED, str(error), error.with_traceback(None)
+            return
+        result = future.result()
+        try:
+            blob = pickle.dumps(result)
+        except Exception:
+            job["result"] = result
+        else:
+            with self._lock:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO jobs (id, kind, result, finished) VALUES (?, ?, ?, ?)",
+                    (job["id"], job["kind"], blob, now)
+                )
+                self._conn.execute("DELETE FROM jobs WHERE finished < ?", (now - self.result_ttl,))
+                self._conn.commit()
+        job["state"] = COMPLETED
+
+    def _prune(self):
+        """Drop finished jobs older than result_ttl, then the oldest beyond max_jobs; call with the lock held."""
+        expiry = time.time() - self.result_ttl
+        finished = sorted((job["finished"], job_id) for job_id, job in self._jobs.items() if "finished" in job)
+        excess = len(self._jobs) - self.max_jobs
+        for when, job_id in finished:
+            if when >= expiry and excess <= 0:
+                break
+            del self._jobs[job_id]
+            excess -= 1
+
+    def _persisted(self, job_id: str):
+        """When the stored result of job_id finished, or None if there is none within result_ttl."""
+        row = self._conn.execute(
+            "SELECT finished FROM jobs WHERE id = ? AND finished >= ?", (job_id, time.time() - self.result_ttl)
+        ).fetchone()
+        return row[0] if row else None
+
+    def status(self, job_id: str) -> dict:
+        """{"id", "kind", "state", "progress", "error"}; state is queued, running, completed, error or missing.
+
+        A job is missing when it was never submitted here, was forgotten, or
+        has been pruned or expired.
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                row = self._conn.execute(
+                    "SELECT kind, finished FROM jobs WHERE id = ? AND finished >= ?",
+                    (job_id, time.time() - self.result_ttl)
+                ).fetchone()
+                if row is None:
+                    return {"id": job_id, "kind": None, "state": MISSING, "progress": None, "error": None}
+                job = self._jobs[job_id] = {"id": job_id, "kind": row[0], "state": COMPLETED,
+                                            "progress": None, "error": None, "finished": row[1]}
+        state = job["state"]
+        if state == QUEUED and "future" in job and job["future"].running():
+            state = RUNNING
+        return {"id": job_id, "kind": job["kind"], "state": state, "progress": job["progress"],
+                "error": job["error"]}
+
+    def result(self, job_id: str):
+        """The result of a completed job; re-raises the error of a failed one."""
+        job = self._jobs.get(job_id)
+        if job and job["state"] == FAILED:
+            raise job.get("exception") or RuntimeError(job["error"])
+        if job and "result" in job:
+            return job["result"]
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT result FROM jobs WHERE id = ? AND finished >= ?", (job_id, time.time() - self.result_ttl)
+            ).fetchone()
+        if row is None:
+            raise KeyError(job_id)
+        return pickle.loads(row[0])
+
+    def cancel(self, job_id: str) -> bool:
+        """Ask a queued or running job to stop; False if it has already finished or is unknown."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job["state"] not in (QUEUED, RUNNING):
+                return False
+            job["cancelled"] = True
+            if "future" in job:
+                job["future"].cancel()
+            return True
+
+    def forget(self, job_id: str):
+        """Drop a job and its stored result."""
+        with self._lock:
+            job = self._jobs.pop(job_id, None)
+            if job and "future" in job:
+                job["future"].cancel()
+            self._conn.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+            self._conn.commit()
@@ -0,0 +1,401 @@
+import json
+import os
+import shutil
+import tempfile
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+
+from vector_index import normalize_rows, top_k_indices
+
+MANIFEST = "manifest.json"
+SEGMENTS = "segments.jsonl"
+OFFSETS = "offsets.i64"
+VECTORS = "vectors.f32"
+TOMBSTONES = "tombstones.i64"
+LOCK = "write.lock"
+DATA_FILES = (SEGMENTS, OFFSETS, VECTORS, TOMBSTONES)
+ANN_MIN_RECORDS = 5000
+ANN_ADD_BLOCK = 65536
+
+
+def _encode(chunks, position: int):
+    """JSON lines for chunk records and their (offset, length) pairs when written at byte `position`."""
+    lines = [(json.dumps(chunk, ensure_ascii=False) + "\n").encode("utf-8") for chunk in chunks]
+    lengths = np.array([len(line) for line in lines], dtype=np.int64)
+    offsets = np.empty((len(lines), 2), dtype=np.int64)
+    offsets[:, 0] = position + np.cumsum(lengths) - lengths
+    offsets[:, 1] = lengths
+    return b"".join(lines), offsets
+
+
+class _FileLock:
+    """Exclusive advisory lock on a file, held across processes (fcntl on POSIX, msvcrt on Windows)."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = None
+
+    def __enter__(self):
+        self._file = open(self.path, "a+b")
+        if os.name == "nt":
+            import msvcrt
+            self._file.seek(0)
+            msvcrt.locking(self._file.fileno(), msvcrt.LK_LOCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc_info):
+        try:
+            if os.name == "nt":
+                import msvcrt
+                self._file.seek(0)
+                msvcrt.locking(self._file.fileno(), msvcrt.LK_UNLCK, 1)
+            else:
+                import fcntl
+                fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+        finally:
+            self._file.close()
+            self._file = None
+
+
+class KnowledgeStore:
+    """Append-only on-disk knowledge base of chunk records and their embeddings.
+
+    Layout of the store directory:
+      segments.jsonl  one JSON chunk record per line, never rewritten
+      offsets.i64     (byte offset, length) of each record in segments.jsonl
+      vectors.f32     row-major normalized float32 embeddings, memory-mapped
+      tombstones.i64  ids of deleted records
+      manifest.json   committed record count, segments and tombstone
+                      lengths, embedding size, live record counts per
+                      document id and a generation number that compact()
+                      bumps when it renumbers ids
+
+    Data files are appended first and the manifest is replaced atomically last.
+    Everything past the committed lengths is left over from an interrupted
+    write: readers never look at it and the next write truncates it before
+    appending. Writers in any process serialize on write.lock, so one never
+    truncates another's in-flight append. Every commit bumps a revision
+    counter in the manifest; files are only opened on first use and re-mapped
+    when the revision moves. compact() writes a new set of data files under
+    the next generation's suffix (segments.<generation>.jsonl, ...) and
+    switches to them with the manifest.
+
+    With `ann` (IVFIndex options, e.g. {"n_probe": 8, "quantization": "int8"}),
+    searches over at least ANN_MIN_RECORDS records go through an in-memory
+    IVF index, built on first search and extended as records are added, and
+    its candidates are reranked against the exact memory-mapped vectors.
+    """
+
+    def __init__(self, path: str = "data/knowledge_store", ann: dict = None):
+        self.path = path
+        self.ann = ann
+        self._ann_index = None
+        self._ann_generation = None
+        self._lock = threading.RLock()
+        self._loaded_revision = None
+        self._revision = 0
+        self._write_depth = 0
+        self._count = 0
+        self._dim = None
+        self._vectors = None
+        self._offsets = None
+        self._deleted = set()
+        self._documents = {}
+        self._generation = 0
+        self._segments_bytes = 0
+        self._tombstones = 0
+        self._suffix = ""
+
+    def _file(self, name: str) -> str:
+        return os.path.join(self.path, name)
+
+    def _data_file(self, name: str, suffix: str = None) -> str:
+        """Path of a data file of the current (or given) generation."""
+        base, ext = os.path.splitext(name)
+        return self._file(base + (self._suffix if suffix is None else suffix) + ext)
+
+    def _refresh(self):
+        """(Re)load the manifest and memory maps if the store changed on disk."""
+        try:
+            with open(self._file(MANIFEST), "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+        except FileNotFoundError:
+            return
+        revision = manifest.get("revision", 0)
+        if revision == self._loaded_revision:
+            return
+        self._revision = revision
+        self._count = manifest["count"]
+        self._dim = manifest["dim"]
+        self._documents = manifest.get("documents", {})
+        self._generation = manifest.get("generation", 0)
+        self._suffix = manifest.get("files", "")
+        if self._count:
+            self._vectors = np.memmap(self._data_file(VECTORS), dtype=np.float32, mode="r",
+                                      shape=(self._count, self._dim))
+            self._offsets = np.memmap(self._data_file(OFFSETS), dtype=np.int64, mode="r",
+                                      shape=(self._count, 2))
+        else:
+            self._vectors = None
+            self._offsets = None
+        # Stores written before these lengths were recorded: derive them.
+        if "segments_bytes" in manifest:
+            self._segments_bytes = manifest["segments_bytes"]
+        else:
+            self._segments_bytes = int(self._offsets[-1].sum()) if self._count else 0
+        if "tombstones" in manifest:
+            self._tombstones = manifest["tombstones"]
+        elif os.path.exists(self._data_file(TOMBSTONES)):
+            self._tombstones = os.path.getsize(self._data_file(TOMBSTONES)) // 8
+        else:
+            self._tombstones = 0
+        if self._tombstones:
+            self._deleted = set(np.fromfile(self._data_file(TOMBSTONES), dtype=np.int64, count=self._tombstones).tolist())
+        else:
+            self._deleted = set()
+        self._loaded_revision = revision
+
+    @contextmanager
+    def _writing(self):
+        """Hold the cross-process write lock with the latest commit loaded.
+
+        If the write fails, in-memory state is reloaded from the manifest on
+        next use. Re-entrant within one store object.
+        """
+        if self._write_depth:
+            yield
+            return
+        os.makedirs(self.path, exist_ok=True)
+        with _FileLock(self._file(LOCK)):
+            self._write_depth += 1
+            try:
+                self._refresh()
+                yield
+            except BaseException:
+                self._loaded_revision = None
+                raise
+            finally:
+                self._write_depth -= 1
+
+    def _write_manifest(self):
+        self._revision += 1
+        tmp_path = self._file(MANIFEST + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({
+                "version": 1,
+                "revision": self._revision,
+                "count": self._count,
+                "dim": self._dim,
+                "documents": self._documents,
+                "generation": self._generation,
+                "files": self._suffix,
+                "segments_bytes": self._segments_bytes,
+                "tombstones": self._tombstones,
+            }, f)
+        os.replace(tmp_path, self._file(MANIFEST))
+        self._loaded_revision = None
+        self._refresh()
+
+    def __len__(self):
+        with self._lock:
+            self._refresh()
+            return self._count - len(self._deleted)
+
+    @property
+    def generation(self) -> int:
+        """Changes whenever record ids are renumbered, so derived indexes know to rebuild."""
+        with self._lock:
+            self._refresh()
+            return self._generation
+
+    def is_deleted(self, record_id: int) -> bool:
+        with self._lock:
+            self._refresh()
+            return record_id in self._deleted
+
+    def add(self, chunks, embeddings):
+        """Append chunk records with their embeddings; return the new record ids."""
+        chunks = list(chunks)
+        if not chunks and not len(embeddings):
+            return []
+        vectors = normalize_rows(embeddings)
+        if len(chunks) != len(vectors):
+            raise ValueError("Number of chunks and embeddings must match.")
+        with self._lock, self._writing():
+            if self._dim is None:
+                self._dim = vectors.shape[1]
+            elif vectors.shape[1] != self._dim:
+                raise ValueError(f"Expected embeddings of size {self._dim}, got {vectors.shape[1]}.")
+
+            data, offsets = _encode(chunks, self._segments_bytes)
+            self._append(SEGMENTS, data, self._segments_bytes)
+            self._append(OFFSETS, offsets, self._count * 2 * 8)
+            self._append(VECTORS, vectors, self._count * self._dim * 4)
+            self._segments_bytes += len(data)
+
+            for chunk in chunks:
+                document = chunk.get("document")
+                if document:
+                    self._documents[document] = self._documents.get(document, 0) + 1
+
+            first_id = self._count
+            self._count += len(chunks)
+            self._write_manifest()
+            return list(range(first_id, self._count))
+
+    def _append(self, name: str, data, committed_bytes: int):
+        """Append bytes or an array after the committed prefix, dropping bytes from an interrupted write."""
+        if not isinstance(data, bytes):
+            data = np.ascontiguousarray(data).tobytes()
+        with open(self._data_file(name), "ab") as f:
+            if f.tell() != committed_bytes:
+                f.truncate(committed_bytes)
+            f.write(data)
+
+    def delete(self, ids):
+        """Mark record ids as deleted without rewriting the data files."""
+        with self._lock, self._writing():
+            ids = sorted({int(i) for i in ids} - self._deleted)
+            if not ids:
+                return
+            for record_id in ids:
+                document = self.get(record_id).get("document")
+                if document in self._documents:
+                    self._documents[document] -= 1
+                    if not self._documents[document]:
+                        del self._documents[document]
+            self._append(TOMBSTONES, np.asarray(ids, dtype=np.int64), self._tombstones * 8)
+            self._tombstones += len(ids)
+            self._write_manifest()
+
+    def delete_source(self, source: str):
+        """Delete every record that came from the given source; return how many."""
+        ids = [i for i, chunk in self.items() if chunk.get("source") == source]
+        self.delete(ids)
+        return len(ids)
+
+    def delete_document(self, document: str):
+        """Delete every record tagged with the given document id; return how many."""
+        ids = [i for i, chunk in self.items() if chunk.get("document") == document]
+        self.delete(ids)
+        return len(ids)
+
+    def document_size(self, document: str) -> int:
+        """Number of live records stored for a document id (0 if unknown)."""
+        with self._lock:
+            self._refresh()
+            return self._documents.get(document, 0)
+
+    def get(self, record_id: int):
+        with self._lock:
+            self._refresh()
+            offset, length = self._offsets[record_id]
+            with open(self._data_file(SEGMENTS), "rb") as f:
+                f.seek(int(offset))
+                return json.loads(f.read(int(length)).decode("utf-8"))
+
+    def items(self, start: int = 0):
+        """Yield (id, chunk) for every live record from id start on, in one forward pass over segments."""
+        with self._lock:
+            self._refresh()
+            count, deleted = self._count, set(self._deleted)
+            if start >= count:
+                return
+            offsets = np.array(self._offsets[start:count])
+        with open(self._data_file(SEGMENTS), "rb") as f:
+            for record_id, (offset, length) in enumerate(offsets.tolist(), start):
+                if record_id in deleted:
+                    continue
+                if f.tell() != offset:
+                    f.seek(offset)
+                yield record_id, json.loads(f.read(length).decode("utf-8"))
+
+    def texts(self):
+        return [chunk["text"] for _, chunk in self.items()]
+
+    def search(self, query, top_k: int = 3):
+        """Return (chunk, score) pairs for the top_k live records nearest to query."""
+        with self._lock:
+            return [(self.get(i), score) for i, score in self.search_ids(query, top_k)]
+
+    def search_ids(self, query, top_k: int = 3):
+        """Return (id, score) pairs for the top_k live records nearest to query."""
+        with self._lock:
+            self._refresh()
+            if not self._count or top_k <= 0:
+                return []
+            if self.ann and self._count - len(self._deleted) >= ANN_MIN_RECORDS:
+                return self._search_ann(query, top_k)
+            scores = normalize_rows(query) @ self._vectors.T
+            if self._deleted:
+                scores[0, list(self._deleted)] = -np.inf
+            top = top_k_indices(scores, top_k)[0]
+            return [(int(i), float(scores[0, i])) for i in top if np.isfinite(scores[0, i])]
+
+    def _search_ann(self, query, top_k: int):
+        from ann_index import IVFIndex
+        index = self._ann_index
+        if (index is None or self._ann_generation != self._generation
+                or self._count > 4 * index.trained_size):
+            index = IVFIndex(**self.ann)
+            index.train(self._vectors)
+            self._ann_index, self._ann_generation = index, self._generation
+        for start in range(len(index), self._count, ANN_ADD_BLOCK):
+            stop = min(start + ANN_ADD_BLOCK, self._count)
+            index.add(np.arange(start, stop), self._vectors[start:stop])
+        hits = index.search(query, top_k + len(self._deleted), exact=self._vectors)
+        return [(i, score) for i, score in hits if i not in self._deleted][:top_k]
+
+    def compact(self):
+        """Rewrite the store without deleted records, renumbering ids.
+
+        The new files are built in a temporary directory and moved in under the
+        next generation's names; replacing the manifest is the commit point, so
+        a crash at any step leaves either the old store or the new one.
+        """
+        with self._lock, self._writing():
+            if not self._deleted:
+                return
+            live = list(self.items())
+            chunks = [chunk for _, chunk in live]
+            vectors = np.array(self._vectors[[i for i, _ in live]]) if live else np.empty((0, self._dim), np.float32)
+            data, offsets = _encode(chunks, 0)
+            old_files = [self._data_file(name) for name in DATA_FILES]
+            suffix = f".{self._generation + 1}"
+            tmp_dir = tempfile.mkdtemp(prefix="compact-", dir=self.path)
+            try:
+                for name, content in ((SEGMENTS, data), (OFFSETS, offsets.tobytes()), (VECTORS, vectors.tobytes())):
+                    with open(os.path.join(tmp_dir, name), "wb") as f:
+                        f.write(content)
+                        f.flush()
+                        os.fsync(f.fileno())
+                    os.replace(os.path.join(tmp_dir, name), self._data_file(name, suffix))
+            finally:
+                shutil.rmtree(tmp_dir, ignore_errors=True)
+
+            documents = {}
+            for chunk in chunks:
+                document = chunk.get("document")
+                if document:
+                    documents[document] = documents.get(document, 0) + 1
+            self._vectors = None
+            self._offsets = None
+            self._count = len(chunks)
+            self._deleted = set()
+            self._tombstones = 0
+            self._segments_bytes = len(data)
+            self._documents = documents
+            self._generation += 1
+            self._suffix = suffix
+            self._write_manifest()
+            for path in old_files:
+                try:
+                    os.remove(path)
+                except OSError:
+                    # Missing, or still mapped by a reader on Windows; the data is no longer referenced.
+                    pass
@@ -0,0 +1,109 @@
+import time
+
+from transport import transport as default_transport
+
+
+class CohereGenerateBackend:
+    """Cohere 'generate' endpoint, blocking or streamed."""
+
+    def __init__(self, client, model: str = "command", max_tokens: int = 300,
+                 temperature: float = 0.7, transport=None):
+        self.client = client
+        self.model = model
+        self.max_tokens = max_tokens
+        self.temperature = temperature
+        self.transport = transport or default_transport
+
+    def generate(self, prompt: str) -> str:
+        response = self.transport.call(
+            "cohere.generate",
+            self.client.generate,
+            model=self.model,
+            prompt=prompt,
+            max_tokens=self.max_tokens,
+            temperature=self.temperature,
+            request_options=self.transport.request_options("cohere.generate"),
+        )
+        return response.generations[0].text.strip()
+
+    def stream(self, prompt: str):
+        """Yield pieces of the completion as Cohere produces them."""
+        events = self.transport.stream(
+            "cohere.generate_stream",
+            self.client.generate_stream,
+            model=self.model,
+            prompt=prompt,
+            max_tokens=self.max_tokens,
+            temperature=self.temperature,
+            request_options=self.transport.request_options("cohere.generate_stream"),
+        )
+        for event in events:
+            if event.event_type == "text-generation":
+                yield event.text
+
+
+class CohereChatBackend:
+    """Cohere 'chat' endpoint, blocking or streamed."""
+
+    def __init__(self, client, model: str = "command", max_tokens: int = 300,
+                 temperature: float = 0.7, transport=None):
+        self.client = client
+        self.model = model
+        self.max_tokens = max_tokens
+        self.temperature = temperature
+        self.transport = transport or default_transport
+
+    def generate(self, prompt: str) -> str:
+        response = self.transport.call(
+            "cohere.chat",
+            self.client.chat,
+            model=self.model,
+            message=prompt,
+            temperature=self.temperature,
+            max_tokens=self.max_tokens,
+            request_options=self.transport.request_options("cohere.chat"),
+        )
+        return response.text.strip()
+
+    def stream(self, prompt: str):
+        events = self.transport.stream(
+            "cohere.chat_stream",
+            self.client.chat_stream,
+            model=self.model,
+            message=prompt,
+            temperature=self.temperature,
+            max_tokens=self.max_tokens,
+            request_options=self.transport.request_options("cohere.chat_stream"),
+        )
+        for event in events:
+            if event.event_type == "text-generation":
+                yield event.text
+
+
+class FakeStreamingBackend:
+    """Offline stand-in that streams a canned answer word by word.
+
+    `first_token_delay` and `token_delay` (seconds) simulate model latency.
+    """
+
+    def __init__(self, answer: str = None, first_token_delay: float = 0.3, token_delay: float = 0.02):
+        self.answer = answer
+        self.first_token_delay = first_token_delay
+        self.token_delay = token_delay
+
+    def _answer_for(self, prompt: str) -> str:
+        if self.answer is not None:
+            return self.answer
+        question = prompt.rsplit("Question:", 1)[-1].split("Answer:", 1)[0].strip()
+        return f"This is an offline answer to: {question or prompt[:80]}"
+
+    def generate(self, prompt: str) -> str:
+        return "".join(self.stream(prompt)).strip()
+
+    def stream(self, prompt: str):
+        time.sleep(self.first_token_delay)
+        words = self._answer_for(prompt).split(" ")
+        for i, word in enumerate(words):
+            if i:
+                time.sleep(self.token_delay)
+            yield word if i == 0 else " " + word
@@ -0,0 +1,290 @@
+import atexit
+import contextvars
+import json
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+
+from batch_writer import BatchWriter
+
+# The request opened by Metrics.request() on this thread, if any.
+_current_request = contextvars.ContextVar("current_request", default=None)
+
+
+def _percentile(ordered, p):
+    if not ordered:
+        return None
+    return ordered[min(len(ordered) - 1, int(p * len(ordered)))]
+
+
+def _series(name: str, labels: dict) -> str:
+    """Prometheus-style series name, e.g. cache_hits{cache="response"}."""
+    if not labels:
+        return name
+    return name + "{" + ",".join(f'{key}="{value}"' for key, value in sorted(labels.items())) + "}"
+
+
+class StageStats:
+    """Call count, errors, total time and a latency window for one pipeline stage."""
+
+    def __init__(self, window: int = 1000):
+        self.count = 0
+        self.errors = 0
+        self.total_seconds = 0.0
+        self.latencies = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float, ok: bool = True):
+        with self._lock:
+            self.count += 1
+            self.total_seconds += seconds
+            if not ok:
+                self.errors += 1
+            self.latencies.append(seconds)
+
+    def quantile(self, p: float):
+        """Latency in seconds at quantile p of the recent window, or None before the first call."""
+        with self._lock:
+            return _percentile(sorted(self.latencies), p)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            latencies = sorted(self.latencies)
+            count, errors, total = self.count, self.errors, self.total_seconds
+
+        def ms(seconds):
+            return None if seconds is None else round(seconds * 1000, 1)
+
+        return {
+            "count": count,
+            "errors": errors,
+            "p50_ms": ms(_percentile(latencies, 0.50)),
+            "p95_ms": ms(_percentile(latencies, 0.95)),
+            "mean_ms": ms(total / count) if count else None,
+            "total_seconds": total,
+        }
+
+
+class Metrics:
+    """Process-wide stage timers and labelled counters.
+
+    span() times a block under a stage name and count() adds to a counter.
+    Both also attach to the request opened by request() on the current
+    thread, so each request can be logged with its own breakdown. Recording
+    costs two perf_counter calls and a locked deque append, cheap enough to
+    leave on everywhere. Numbers are per process.
+    """
+
+    def __init__(self, window: int = 1000):
+        self.window = window
+        self._stages = {}
+        self._counters = {}
+        self._lock = threading.Lock()
+        self._exporter = None
+
+    def stage(self, name: str) -> StageStats:
+        with self._lock:
+            if name not in self._stages:
+                self._stages[name] = StageStats(self.window)
+            return self._stages[name]
+
+    def observe(self, name: str, seconds: float, ok: bool = True):
+        """Record one timing of a stage measured elsewhere."""
+        self.stage(name).record(seconds, ok)
+        record = _current_request.get()
+        if record is not None:
+            span = {"stage": name, "ms": round(seconds * 1000, 1)}
+            if not ok:
+                span["ok"] = False
+            record["spans"].append(span)
+
+    @contextmanager
+    def span(self, name: str):
+        """Time the enclosed block as one call of stage `name`; an exception counts as an error."""
+        start = time.perf_counter()
+        ok = True
+        try:
+            yield
+        except GeneratorExit:
+            # A streaming consumer stopped early; not a failure of the stage.
+            raise
+        except BaseException:
+            ok = False
+            raise
+        finally:
+            self.observe(name, time.perf_counter() - start, ok)
+
+    def span_iter(self, name: str, iterable):
+        """Yield from iterable, timing the work of producing its items as one call of stage `name`.
+
+        Unlike span() around a yield, time the consumer spends between items is
+        left out. Closing early is not an error; an exception from the iterable is.
+        """
+        iterator = iter(iterable)
+        seconds = 0.0
+        ok = True
+        try:
+            while True:
+                start = time.perf_counter()
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+                finally:
+                    seconds += time.perf_counter() - start
+                yield item
+        except GeneratorExit:
+            close = getattr(iterator, "close", None)
+            if close:
+                close()
+            raise
+        except BaseException:
+            ok = False
+            raise
+        finally:
+            self.observe(name, seconds, ok)
+
+    def count(self, name: str, amount: float = 1, **labels):
+        series = _series(name, labels)
+        with self._lock:
+            self._counters[series] = self._counters.get(series, 0) + amount
+        record = _current_request.get()
+        if record is not None:
+            record["counters"][series] = record["counters"].get(series, 0) + amount
+
+    @contextmanager
+    def request(self, kind: str, log=None, **attrs):
+        """Group the spans and counters of one user request.
+
+        The request's total time is recorded as stage "request.<kind>" and,
+        when `log` (a RequestLog) is given, the finished record is written to it.
+        """
+        record = {"id": uuid.uuid4().hex[:16], "kind": kind, "ts": round(time.time(), 3), **attrs,
+                  "spans": [], "counters": {}}
+        token = _current_request.set(record)
+        start = time.perf_counter()
+        ok = True
+        try:
+            yield record
+        except BaseException:
+            ok = False
+            raise
+        finally:
+            _current_request.reset(token)
+            seconds = time.perf_counter() - start
+            self.stage(f"request.{kind}").record(seconds, ok)
+            record["ms"] = round(seconds * 1000, 1)
+            record["ok"] = ok
+            if log is not None:
+                log.write(record)
+
+    def snapshot(self) -> dict:
+        """{"stages": {name: {count, errors, p50_ms, p95_ms, mean_ms, total_seconds}}, "counters": {series: value}}"""
+        with self._lock:
+            stages = dict(self._stages)
+            counters = dict(self._counters)
+        return {
+            "stages": {name: stats.snapshot() for name, stats in sorted(stages.items())},
+            "counters": dict(sorted(counters.items())),
+        }
+
+    def prometheus_text(self, prefix: str = "study_buddy") -> str:
+        """The current metrics in the Prometheus text exposition format."""
+        with self._lock:
+            stages = sorted(self._stages.items())
+            counters = sorted(self._counters.items())
+        lines = [
+            f"# HELP {prefix}_stage_seconds Latency of each pipeline stage over the recent window.",
+            f"# TYPE {prefix}_stage_seconds summary",
+        ]
+        for name, stats in stages:
+            for quantile in (0.5, 0.95):
+                value = stats.quantile(quantile)
+                if value is not None:
+                    lines.append(f'{prefix}_stage_seconds{{stage="{name}",quantile="{quantile}"}} {value:.6f}')
+            lines.append(f'{prefix}_stage_seconds_sum{{stage="{name}"}} {stats.total_seconds:.6f}')
+            lines.append(f'{prefix}_stage_seconds_count{{stage="{name}"}} {stats.count}')
+        lines.append(f"# TYPE {prefix}_stage_errors_total counter")
+        for name, stats in stages:
+            lines.append(f'{prefix}_stage_errors_total{{stage="{name}"}} {stats.errors}')
+        typed = set()
+        for series, value in counters:
+            name = series.split("{", 1)[0]
+            if name not in typed:
+                lines.append(f"# TYPE {prefix}_{name}_total counter")
+                typed.add(name)
+            labels = series[len(name):]
+            lines.append(f"{prefix}_{name}_total{labels} {value}")
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path: str):
+        """Atomically replace `path` with the current metrics."""
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp = f"{path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(self.prometheus_text())
+        os.replace(tmp, path)
+
+    def export_periodically(self, path: str, interval: float = 15.0):
+        """Rewrite `path` every `interval` seconds and at exit, from a daemon thread.
+
+        The file suits node_exporter's textfile collector or any scraper that
+        reads Prometheus text. Later calls are ignored.
+        """
+        with self._lock:
+            if self._exporter is not None:
+                return
+            self._exporter = threading.Thread(target=self._export_loop, args=(path, interval),
+                                              name="metrics-export", daemon=True)
+        self._exporter.start()
+        atexit.register(self.write_prometheus, path)
+
+    def _export_loop(self, path, interval):
+        while True:
+            time.sleep(interval)
+            try:
+                self.write_prometheus(path)
+            except Exception as e:
+                print(f"❌ Error exporting metrics: {e}")
+
+
+class RequestLog(BatchWriter):
+    """Buffered JSON-lines log of finished requests.
+
+    write() only queues the record; one background thread appends queued
+    records in batches once `batch_size` are waiting or `flush_interval`
+    seconds after the first, so logging adds no file I/O to a request. The
+    file is rotated to `<path>.1` once it passes max_bytes.
+    """
+
+    error_message = "Error writing request log"
+
+    def __init__(self, path: str = "data/request_log.jsonl", batch_size: int = 256,
+                 flush_interval: float = 1.0, max_bytes: int = 50 * 1024 * 1024):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.records_written = 0
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        super().__init__(f"request-log:{path}", batch_size, flush_interval)
+
+    def write(self, record: dict):
+        self._enqueue(record)
+
+    def _write_batch(self, records):
+        lines = "".join(json.dumps(record, default=str, separators=(",", ":")) + "\n" for record in records)
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(lines)
+            size = f.tell()
+        self.records_written += len(records)
+        if size > self.max_bytes:
+            os.replace(self.path, f"{self.path}.1")
+
+
+metrics = Metrics()
@@ -0,0 +1,213 @@
+import hashlib
+import json
+import multiprocessing
+import os
+import tempfile
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+PAGES_PER_TASK = 16
+MAX_WORKERS = os.cpu_count() or 1
+READ_BLOCK_BYTES = 1 << 20
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool():
+    """Process-wide worker pool for page extraction, created on first use."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # Spawn, not fork: the pool is created from a worker thread of a multithreaded
+            # server, and a forked child can inherit a lock some other thread was holding.
+            _pool = ProcessPoolExecutor(max_workers=MAX_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+        return _pool
+
+
+def _extract_range(path: str, start: int, stop: int):
+    """Text of pages [start, stop) of the PDF at path; runs in a worker process."""
+    import PyPDF2
+    reader = PyPDF2.PdfReader(path)
+    return [reader.pages[i].extract_text() or "" for i in range(start, stop)]
+
+
+class PageTextCache:
+    """Extracted page texts per PDF content hash, one JSON line per page, evicting LRU past max_bytes."""
+
+    def __init__(self, directory: str = "data/pdf_text_cache", max_bytes: int = 100 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.jsonl")
+
+    def read(self, key: str):
+        """Iterator over the cached page texts, or None."""
+        path = self.path(key)
+        try:
+            os.utime(path)
+            f = open(path, encoding="utf-8")
+        except FileNotFoundError:
+            return None
+        return self._lines(f)
+
+    @staticmethod
+    def _lines(f):
+        with f:
+            for line in f:
+                yield json.loads(line)
+
+    def writer(self, key: str):
+        return _PageWriter(self, key)
+
+    def _evict(self, keep: str):
+        entries = []
+        total = 0
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and not entry.name.endswith(".part"):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+                total += stat.st_size
+        if total <= self.max_bytes:
+            return
+        for _, size, path in sorted(entries):
+            if path == keep:
+                continue
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                continue
+            total -= size
+            if total <= self.max_bytes:
+                break
+
+
+class _PageWriter:
+    """Appends pages to a temporary file that only becomes a cache entry once every page is written."""
+
+    def __init__(self, cache: PageTextCache, key: str):
+        self.cache = cache
+        self.key = key
+        fd, self._tmp_path = tempfile.mkstemp(dir=cache.directory, suffix=".part")
+        self._file = os.fdopen(fd, "w", encoding="utf-8")
+
+    def write(self, text: str):
+        self._file.write(json.dumps(text) + "\n")
+
+    def commit(self):
+        self._file.close()
+        path = self.cache.path(self.key)
+        os.replace(self._tmp_path, path)
+        self.cache._evict(keep=path)
+
+    def abort(self):
+        self._file.close()
+        try:
+            os.remove(self._tmp_path)
+        except FileNotFoundError:
+            pass
+
+
+def _hash_and_spool(file):
+    """(sha256 hex, path, is_temporary) for a path or file-like object, reading it once in blocks."""
+    digest = hashlib.sha256()
+    if isinstance(file, str):
+        with open(file, "rb") as f:
+            for block in iter(lambda: f.read(READ_BLOCK_BYTES), b""):
+                digest.update(block)
+        return digest.hexdigest(), file, False
+    if hasattr(file, "seek"):
+        file.seek(0)
+    fd, path = tempfile.mkstemp(suffix=".pdf")
+    with os.fdopen(fd, "wb") as out:
+        for block in iter(lambda: file.read(READ_BLOCK_BYTES), b""):
+            digest.update(block)
+            out.write(block)
+    if hasattr(file, "seek"):
+        file.seek(0)
+    return digest.hexdigest(), path, True
+
+
+def _extract_serial(reader):
+    for page in reader.pages:
+        yield page.extract_text() or ""
+
+
+def _extract_parallel(path: str, page_count: int, pages_per_task: int):
+    """Yield page texts in order while worker processes extract ranges ahead of the consumer.
+
+    At most two ranges per worker are in flight, so memory stays bounded no
+    matter how slowly the caller consumes pages.
+    """
+    pool = _get_pool()
+    ranges = iter(range(0, page_count, pages_per_task))
+    pending = deque()
+    try:
+        for start in ranges:
+            pending.append(pool.submit(_extract_range, path, start, min(start + pages_per_task, page_count)))
+            if len(pending) >= 2 * MAX_WORKERS:
+                break
+        while pending:
+            texts = pending.popleft().result()
+            start = next(ranges, None)
+            if start is not None:
+                pending.append(pool.submit(_extract_range, path, start, min(start + pages_per_task, page_count)))
+            yield from texts
+    finally:
+        for future in pending:
+            future.cancel()
+
+
+def extract_pages(file, cache: PageTextCache = None, pages_per_task: int = PAGES_PER_TASK):
+    """Yield the text of each page of a PDF file or path, in order, never None.
+
+    Pages are extracted in a process pool, a range at a time, and streamed to
+    the caller as they are ready (in-process on single-CPU hosts and for short
+    documents). With a cache, text is stored per file hash
+    and a repeat upload is served without parsing the PDF at all.
+    """
+    key, path, temporary = _hash_and_spool(file)
+    try:
+        cached = cache.read(key) if cache else None
+        if cached is not None:
+            yield from cached
+            return
+        import PyPDF2
+        reader = PyPDF2.PdfReader(path)
+        page_count = len(reader.pages)
+        if MAX_WORKERS == 1 or page_count <= pages_per_task:
+            pages = _extract_serial(reader)
+        else:
+            pages = _extract_parallel(path, page_count, pages_per_task)
+        writer = cache.writer(key) if cache else None
+        try:
+            for text in pages:
+                if writer:
+                    writer.write(text)
+                yield text
+        except BaseException:
+            if writer:
+                writer.abort()
+            raise
+        finally:
+            if hasattr(pages, "close"):
+                pages.close()
+        if writer:
+            writer.commit()
+    finally:
+        if temporary:
+            os.remove(path)
+
+
+_default_cache = None
+
+
+def default_cache() -> PageTextCache:
+    """Process-wide page text cache under data/pdf_text_cache."""
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = PageTextCache()
+    return _default_cache
@@ -0,0 +1,197 @@
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+from vector_index import normalize_rows
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def normalize_prompt(prompt: str) -> str:
+    """Case-fold, collapse whitespace and drop trailing punctuation."""
+    return _WHITESPACE_RE.sub(" ", prompt.lower()).strip().rstrip("?!. ")
+
+
+class ResponseCache:
+    """SQLite-backed LLM response cache shared by every process on the machine.
+
+    Lookups match the normalized prompt exactly. If an embedder and a
+    similarity_threshold are given, a miss falls back to the cached entry whose
+    question is most similar, if its cosine similarity reaches the threshold.
+    Only the question is embedded, and only entries whose prompt is otherwise
+    identical (same namespace, same retrieved context around the question) are
+    candidates, so questions that pull in the same passages never share an
+    answer. Entries expire after `ttl` seconds and the least recently used are
+    evicted beyond `max_entries`.
+    """
+
+    def __init__(self, db_path: str = "data/response_cache.db", ttl: float = 7 * 24 * 3600,
+                 max_entries: int = 5000, embedder=None, similarity_threshold: float = None):
+        self.db_path = db_path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.embedder = embedder
+        self.similarity_threshold = similarity_threshold
+        self.hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._semantic_rows = {}
+        self._semantic_count = 0
+        self._last_rowid = 0
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, timeout=10)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                prompt TEXT,
+                response TEXT,
+                embedding BLOB,
+                created REAL,
+                last_used REAL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_last_used ON responses (last_used)")
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(responses)")}
+        if "scope" not in columns:
+            # Embeddings from before scopes covered the whole prompt; they are never matched.
+            self._conn.execute("ALTER TABLE responses ADD COLUMN scope TEXT")
+        self._conn.commit()
+
+    @property
+    def semantic(self) -> bool:
+        return self.embedder is not None and self.similarity_threshold is not None
+
+    @staticmethod
+    def _key(normalized: str, namespace: str) -> str:
+        return hashlib.sha256(f"{namespace}\0{normalized}".encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def _scope(prompt: str, question: str, namespace: str) -> str:
+        """Hash of the namespace and the prompt with its question cut out."""
+        template = normalize_prompt(prompt.replace(question, "\0", 1)) if question else ""
+        return hashlib.sha256(f"{namespace}\0{template}".encode("utf-8")).hexdigest()
+
+    def _embed_question(self, question: str):
+        return normalize_rows(self.embedder.embed([question]))[0].astype(np.float32)
+
+    def _fetch(self, key: str):
+        row = self._conn.execute("SELECT response, created FROM responses WHERE key = ?", (key,)).fetchone()
+        if row is None or time.time() - row[1] > self.ttl:
+            return None
+        self._conn.execute("UPDATE responses SET last_used = ? WHERE key = ?", (time.time(), key))
+        self._conn.commit()
+        return row[0]
+
+    def _sync_semantic_rows(self):
+        """Pull embeddings written since the last lookup, by this or any other process."""
+        rows = self._conn.execute(
+            "SELECT rowid, key, scope, embedding FROM responses "
+            "WHERE rowid > ? AND embedding IS NOT NULL AND scope IS NOT NULL ORDER BY rowid",
+            (self._last_rowid,)
+        ).fetchall()
+        for rowid, key, scope, blob in rows:
+            keys, vectors = self._semantic_rows.setdefault(scope, ([], []))
+            keys.append(key)
+            vectors.append(np.frombuffer(blob, dtype=np.float32))
+            self._semantic_count += 1
+            self._last_rowid = rowid
+        if self._semantic_count > 2 * self.max_entries:
+            self._semantic_rows, self._semantic_count, self._last_rowid = {}, 0, 0
+            self._sync_semantic_rows()
+
+    def _semantic_lookup(self, query, scope: str):
+        self._sync_semantic_rows()
+        keys, vectors = self._semantic_rows.get(scope, ([], []))
+        if not vectors:
+            return None
+        scores = np.stack(vectors) @ query
+        for i in np.argsort(-scores)[:5]:
+            if scores[i] < self.similarity_threshold:
+                break
+            response = self._fetch(keys[i])
+            if response is not None:
+                return response
+        return None
+
+    def get(self, prompt: str, namespace: str = "", question: str = None):
+        """Return a cached response for prompt, or None.
+
+        `question` is the user's own words inside prompt (default: all of it);
+        it alone is compared for near-duplicate matches.
+        """
+        normalized = normalize_prompt(prompt)
+        with self._lock:
+            response = self._fetch(self._key(normalized, namespace))
+            if response is not None:
+                self.hits += 1
+                return response
+            if not self.semantic:
+                self.misses += 1
+                return None
+        scope = self._scope(prompt, question, namespace)
+        # The embed call goes over the network; never hold the lock across it.
+        try:
+            query = self._embed_question(normalize_prompt(question or prompt))
+        except Exception as e:
+            print(f"Error in semantic cache lookup: {e}")
+            query = None
+        with self._lock:
+            if query is not None:
+                response = self._semantic_lookup(query, scope)
+                if response is not None:
+                    self.semantic_hits += 1
+                    return response
+            self.misses += 1
+            return None
+
+    def put(self, prompt: str, response: str, namespace: str = "", question: str = None):
+        normalized = normalize_prompt(prompt)
+        embedding = scope = None
+        if self.semantic:
+            try:
+                embedding = self._embed_question(normalize_prompt(question or prompt)).tobytes()
+                scope = self._scope(prompt, question, namespace)
+            except Exception as e:
+                print(f"Error embedding prompt for cache: {e}")
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, prompt, response, embedding, scope, created, last_used) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (self._key(normalized, namespace), normalized, response, embedding, scope, now, now)
+            )
+            self._conn.execute("DELETE FROM responses WHERE created < ?", (now - self.ttl,))
+            self._conn.execute(
+                """DELETE FROM responses WHERE key IN (
+                       SELECT key FROM responses ORDER BY last_used DESC LIMIT -1 OFFSET ?
+                   )""",
+                (self.max_entries,)
+            )
+            self._conn.commit()
+
+    def stats(self) -> dict:
+        with self._lock:
+            size = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        lookups = self.hits + self.semantic_hits + self.misses
+        return {
+            "hits": self.hits,
+            "semantic_hits": self.semantic_hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits + self.semantic_hits) / lookups if lookups else 0.0,
+            "entries": size,
+        }
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+            self._conn.commit()
+            self._semantic_rows, self._semantic_count, self._last_rowid = {}, 0, 0
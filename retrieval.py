@@ -0,0 +1,199 @@
+import heapq
+import math
+import re
+import threading
+from collections import Counter
+
+_TOKEN_RE = re.compile(r"\w+")
+
+
+def tokenize(text: str):
+    return _TOKEN_RE.findall(text.lower())
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough LLM token count (about four characters per token for English)."""
+    return (len(text) + 3) // 4
+
+
+class BM25Index:
+    """Incremental inverted index over passages with Okapi BM25 scoring."""
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.passages = []
+        self.postings = {}
+        self.doc_lengths = []
+        self.total_length = 0
+        self.total_tokens = 0
+
+    def __len__(self):
+        return len(self.passages)
+
+    def add(self, text: str):
+        """Index one passage and return its id."""
+        doc_id = len(self.passages)
+        terms = tokenize(text)
+        for term, tf in Counter(terms).items():
+            self.postings.setdefault(term, []).append((doc_id, tf))
+        self.passages.append(text)
+        self.doc_lengths.append(len(terms))
+        self.total_length += len(terms)
+        self.total_tokens += estimate_tokens(text)
+        return doc_id
+
+    def add_many(self, texts):
+        return [self.add(text) for text in texts]
+
+    def passage(self, doc_id: int) -> str:
+        return self.passages[doc_id]
+
+    def document_frequency(self, term: str) -> int:
+        return len(self.postings.get(term, ()))
+
+    def accumulate(self, idfs, avg_length: float, scores: dict, offset: int = 0):
+        """Add the BM25 contribution of each (term, idf) to scores[offset + id].
+
+        idf and avg_length come from the caller so that several indexes can be
+        scored as one corpus.
+        """
+        for term, idf in idfs:
+            for doc_id, tf in self.postings.get(term, ()):
+                norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[doc_id] / avg_length)
+                key = offset + doc_id
+                scores[key] = scores.get(key, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+
+    def search(self, query: str, top_k: int = 5):
+        """Return (id, score) pairs for the best-matching passages, best first."""
+        return _search_combined([self], query, top_k)
+
+
+def _idf(n: int, df: int) -> float:
+    return math.log(1 + (n - df + 0.5) / (df + 0.5))
+
+
+def _search_combined(indexes, query: str, top_k: int):
+    """BM25 over several indexes as one corpus, ids numbered consecutively across them."""
+    n = sum(len(index) for index in indexes)
+    if not n or top_k <= 0:
+        return []
+    avg_length = sum(index.total_length for index in indexes) / n or 1.0
+    idfs = []
+    for term in set(tokenize(query)):
+        df = sum(index.document_frequency(term) for index in indexes)
+        if df:
+            idfs.append((term, _idf(n, df)))
+    scores = {}
+    offset = 0
+    for index in indexes:
+        index.accumulate(idfs, avg_length, scores, offset)
+        offset += len(index)
+    return heapq.nlargest(top_k, scores.items(), key=lambda item: item[1])
+
+
+class OverlayIndex:
+    """One session's view of a shared, read-only BM25Index plus passages only it has added.
+
+    The base is never modified, so a single copy serves every session; each
+    overlay holds just its own uploads. Overlay ids continue after the base
+    ids, and scores use statistics of the combined corpus, so results rank
+    exactly as if everything were in one index.
+    """
+
+    def __init__(self, base: BM25Index):
+        self.base = base
+        self.local = BM25Index(base.k1, base.b)
+
+    def __len__(self):
+        return len(self.base) + len(self.local)
+
+    @property
+    def total_tokens(self) -> int:
+        return self.base.total_tokens + self.local.total_tokens
+
+    def add(self, text: str):
+        return len(self.base) + self.local.add(text)
+
+    def add_many(self, texts):
+        return [self.add(text) for text in texts]
+
+    def passage(self, doc_id: int) -> str:
+        if doc_id < len(self.base):
+            return self.base.passage(doc_id)
+        return self.local.passage(doc_id - len(self.base))
+
+    def search(self, query: str, top_k: int = 5):
+        """Return (id, score) pairs across base and overlay, best first."""
+        return _search_combined([self.base, self.local], query, top_k)
+
+
+def reciprocal_rank_fusion(rankings, top_k: int = 5, k: int = 60):
+    """Fuse ranked lists of (id, score) pairs into one, scoring each id by sum(1 / (k + rank)).
+
+    Only ranks matter, so BM25 and cosine scores can be combined without
+    calibrating one against the other.
+    """
+    fused = {}
+    for ranking in rankings:
+        for rank, (doc_id, _) in enumerate(ranking, 1):
+            fused[doc_id] = fused.get(doc_id, 0.0) + 1.0 / (k + rank)
+    return heapq.nlargest(top_k, fused.items(), key=lambda item: item[1])
+
+
+class StoreLexicalIndex:
+    """BM25 index mirroring a KnowledgeStore, kept in sync incrementally.
+
+    New records are indexed on the next search; the index is rebuilt only when
+    the store renumbers ids (compaction). Results use store record ids and skip
+    deleted records, so they can be fused with KnowledgeStore.search_ids.
+    """
+
+    def __init__(self, store, k1: float = 1.5, b: float = 0.75):
+        self.store = store
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.Lock()
+        self._reset(store.generation)
+
+    def _reset(self, generation):
+        self.index = BM25Index(self.k1, self.b)
+        self._ids = []
+        self._next_id = 0
+        self._generation = generation
+
+    def sync(self):
+        """Index records added to the store since the last sync."""
+        with self._lock:
+            generation = self.store.generation
+            if generation != self._generation:
+                self._reset(generation)
+            for record_id, chunk in self.store.items(self._next_id):
+                self.index.add(chunk["text"])
+                self._ids.append(record_id)
+                self._next_id = record_id + 1
+
+    def search(self, query: str, top_k: int = 5):
+        """Return (record id, BM25 score) pairs for live records, best first."""
+        self.sync()
+        deleted = max(0, len(self._ids) - len(self.store))
+        hits = self.index.search(query, top_k + deleted)
+        results = [(self._ids[i], score) for i, score in hits if not self.store.is_deleted(self._ids[i])]
+        return results[:top_k]
+
+
+def select_passages(index, query: str, token_budget: int, max_candidates: int = 50):
+    """Pick the highest-ranked passages whose combined size fits in token_budget.
+
+    index is a BM25Index or an OverlayIndex.
+    """
+    selected = []
+    used = 0
+    for doc_id, _ in index.search(query, max_candidates):
+        passage = index.passage(doc_id)
+        cost = estimate_tokens(passage)
+        if used + cost > token_budget:
+            continue
+        selected.append(passage)
+        used += cost
+    return selected
@@ -0,0 +1,107 @@
+"""JobQueue de-duplication, retry and expiry, as the Streamlit pages rely on them.
+
+Run from the repository root:
+    python -m pytest tests
+"""
+import time
+
+import pytest
+
+from jobs import JobQueue, job_key
+
+
+@pytest.fixture
+def jobs(tmp_path):
+    return JobQueue(str(tmp_path / "jobs.db"), workers=2)
+
+
+def wait(jobs, job_id, timeout=5.0):
+    give_up_at = time.monotonic() + timeout
+    while jobs.status(job_id)["state"] in ("queued", "running"):
+        assert time.monotonic() < give_up_at, "job did not finish"
+        time.sleep(0.01)
+    return jobs.status(job_id)
+
+
+class Flaky:
+    """Fails on its first call and succeeds afterwards."""
+
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self, audio):
+        self.calls += 1
+        if self.calls == 1:
+            raise RuntimeError("upstream unavailable")
+        return f"transcript of {audio!r}"
+
+
+def test_resubmitting_a_failed_keyed_job_returns_the_failure_until_retry(jobs):
+    transcribe = Flaky()
+    key = job_key("transcribe", b"audio")
+    job_id = jobs.submit("transcribe", transcribe, b"audio", key=key)
+    assert wait(jobs, job_id)["state"] == "error"
+
+    # A polling rerun must not start the work again.
+    assert jobs.submit("transcribe", transcribe, b"audio", key=key) == job_id
+    assert wait(jobs, job_id)["error"] == "upstream unavailable"
+    assert transcribe.calls == 1
+
+    # The retry button resubmits under the same id, so ids held by the page stay valid.
+    assert jobs.submit("transcribe", transcribe, b"audio", key=key, retry=True) == job_id
+    assert wait(jobs, job_id)["state"] == "completed"
+    assert jobs.result(job_id) == "transcript of b'audio'"
+    assert transcribe.calls == 2
+
+
+
+def test_unknown_forgotten_and_expired_jobs_report_missing(tmp_path):
+    jobs = JobQueue(str(tmp_path / "jobs.db"), result_ttl=0.2)
+    assert jobs.status("never-submitted")["state"] == "missing"
+
+    key = job_key("tts", "hello")
+    job_id = jobs.submit("tts", lambda: "audio.mp3", key=key)
+    assert wait(jobs, job_id)["state"] == "completed"
+    jobs.forget(job_id)
+    assert jobs.status(job_id)["state"] == "missing"
+
+    job_id = jobs.submit("tts", lambda: "audio.mp3", key=key)
+    wait(jobs, job_id)
+    time.sleep(0.3)
+    jobs.submit("other", lambda: None)  # prunes expired jobs from memory
+    assert jobs.status(job_id)["state"] == "missing"
+    # The stored result expired too, so the same key runs again.
+    assert jobs.submit("tts", lambda: "fresh.mp3", key=key) == job_id
+    wait(jobs, job_id)
+    assert jobs.result(job_id) == "fresh.mp3"
+
+
+def test_failed_jobs_pruned_past_max_jobs_report_missing(tmp_path):
+    jobs = JobQueue(str(tmp_path / "jobs.db"), max_jobs=2)
+    failed = jobs.submit("transcribe", Flaky(), b"audio")
+    wait(jobs, failed)
+    for i in range(3):
+        wait(jobs, jobs.submit("other", lambda: i))
+    assert jobs.status(failed)["state"] == "missing"
+
+
+def test_cancel_stops_a_running_job_at_its_next_progress_report(jobs):
+    stopped = []
+
+    def transcribe(progress=None):
+        try:
+            for done in range(1000):
+                progress(done, 1000, "partial text")
+                time.sleep(0.01)
+        finally:
+            stopped.append(done)
+
+    job_id = jobs.submit("transcribe", transcribe)
+    while not jobs.status(job_id)["progress"]:
+        time.sleep(0.01)
+    assert jobs.status(job_id)["progress"][2] == "partial text"
+    assert jobs.cancel(job_id)
+    status = wait(jobs, job_id)
+    assert (status["state"], status["error"]) == ("error", "cancelled")
+    assert stopped and stopped[0] < 1000
+    assert not jobs.cancel(job_id)
@@ -0,0 +1,292 @@
+"""AsyncTranscriber and TranscriptionJobs against a local stand-in for the AssemblyAI API.
+
+Run from the repository root:
+    python -m pytest tests
+"""
+import asyncio
+import threading
+import time
+from collections import Counter
+
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from transcription import (
+    AsyncTranscriber,
+    FakeTranscriber,
+    TranscriptionError,
+    TranscriptionJobs,
+    TranscriptionTimeout,
+    merge_transcripts,
+)
+from transport import EndpointPolicy, Transport
+
+
+class FakeAssemblyAI:
+    """Upload, submit and poll endpoints; a job completes on its `polls_until_done`-th poll."""
+
+    def __init__(self):
+        self.uploads = []
+        self.submissions = []
+        self.polls = Counter()
+        self.polls_until_done = 3
+        self.error = None
+        self.fail_next_polls = 0
+        self.upload_delay = 0.0
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    def app(self):
+        app = web.Application()
+        app.router.add_post("/upload", self.upload)
+        app.router.add_post("/transcript", self.submit)
+        app.router.add_get("/transcript/{id}", self.status)
+        return app
+
+    async def upload(self, request):
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            body = await request.read()
+            await asyncio.sleep(self.upload_delay)
+        finally:
+            self.in_flight -= 1
+        self.uploads.append((request.headers.get("authorization"), body))
+        return web.json_response({"upload_url": f"https://cdn.test/{len(self.uploads)}"})
+
+    async def submit(self, request):
+        payload = await request.json()
+        self.submissions.append(payload)
+        transcript_id = f"t{len(self.submissions)}"
+        return web.json_response({"id": transcript_id, "status": "queued"})
+
+    async def status(self, request):
+        transcript_id = request.match_info["id"]
+        if self.fail_next_polls:
+            self.fail_next_polls -= 1
+            return web.json_response({"error": "unavailable"}, status=503)
+        self.polls[transcript_id] += 1
+        if self.polls[transcript_id] < self.polls_until_done:
+            return web.json_response({"id": transcript_id, "status": "processing"})
+        if self.error:
+            return web.json_response({"id": transcript_id, "status": "error", "error": self.error})
+        audio_url = self.submissions[int(transcript_id[1:]) - 1]["audio_url"]
+        return web.json_response({"id": transcript_id, "status": "completed", "text": f"text of {audio_url}"})
+
+
+@pytest.fixture
+def service():
+    """(FakeAssemblyAI, base_url) served from an event loop in a background thread."""
+    fake = FakeAssemblyAI()
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+
+    async def start():
+        server = TestServer(fake.app())
+        await server.start_server()
+        return server
+
+    server = asyncio.run_coroutine_threadsafe(start(), loop).result()
+    yield fake, str(server.make_url("")).rstrip("/")
+    asyncio.run_coroutine_threadsafe(server.close(), loop).result()
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join()
+
+
+def transcriber(base_url, **options):
+    # A private transport, so breaker state and stats never leak between tests.
+    transport = Transport(policies={}, default_policy=EndpointPolicy(timeout=5.0, backoff=0.01, max_backoff=0.02))
+    return AsyncTranscriber("test-key", base_url=base_url, poll_initial=0.01, poll_max=0.02,
+                            transport=transport, **options)
+
+
+def run(coro_fn):
+    return asyncio.run(coro_fn())
+
+
+def test_upload_streams_raw_bytes_with_the_api_key(service):
+    fake, base_url = service
+
+    async def main():
+        async with transcriber(base_url) as client:
+            return await client.upload(b"RIFF fake audio")
+
+    assert run(main) == "https://cdn.test/1"
+    assert fake.uploads == [("test-key", b"RIFF fake audio")]
+
+
+def test_upload_reads_paths_from_disk(service, tmp_path):
+    fake, base_url = service
+    path = tmp_path / "clip.wav"
+    path.write_bytes(b"wav bytes on disk")
+
+    async def main():
+        async with transcriber(base_url) as client:
+            await client.upload(str(path))
+
+    run(main)
+    assert fake.uploads[0][1] == b"wav bytes on disk"
+
+
+def test_submit_posts_the_upload_url_and_options(service):
+    fake, base_url = service
+
+    async def main():
+        async with transcriber(base_url) as client:
+            return await client.submit(b"audio", language_code="en")
+
+    assert run(main) == "t1"
+    assert fake.submissions == [{"audio_url": "https://cdn.test/1", "language_code": "en"}]
+
+
+def test_result_polls_until_completed(service):
+    fake, base_url = service
+    fake.polls_until_done = 4
+
+    async def main():
+        async with transcriber(base_url) as client:
+            return await client.transcribe(b"audio")
+
+    assert run(main) == "text of https://cdn.test/1"
+    assert fake.polls["t1"] == 4
+
+
+def test_polling_retries_transient_server_errors(service):
+    fake, base_url = service
+    fake.fail_next_polls = 2
+
+    async def main():
+        async with transcriber(base_url) as client:
+            return await client.transcribe(b"audio")
+
+    assert run(main) == "text of https://cdn.test/1"
+
+
+def test_failed_job_raises_transcription_error(service):
+    fake, base_url = service
+    fake.error = "audio too short"
+
+    async def main():
+        async with transcriber(base_url) as client:
+            await client.transcribe(b"audio")
+
+    with pytest.raises(TranscriptionError, match="audio too short"):
+        run(main)
+
+
+def test_result_times_out_after_the_deadline(service):
+    fake, base_url = service
+    fake.polls_until_done = 10 ** 6
+
+    async def main():
+        async with transcriber(base_url) as client:
+            start = time.monotonic()
+            with pytest.raises(TranscriptionTimeout):
+                await client.transcribe(b"audio", deadline=0.2)
+            return time.monotonic() - start
+
+    assert run(main) < 2.0
+
+
+def test_jobs_run_concurrently_and_poll_without_blocking(service):
+    fake, base_url = service
+    fake.upload_delay = 0.2
+    jobs = TranscriptionJobs(transcriber=transcriber(base_url))
+
+    start = time.monotonic()
+    job_ids = [jobs.submit(f"clip {i}".encode()) for i in range(4)]
+    assert time.monotonic() - start < 0.1
+    assert all(jobs.status(job_id) == "processing" for job_id in job_ids)
+
+    results = sorted(jobs.result(job_id, timeout=10) for job_id in job_ids)
+    assert results == [f"text of https://cdn.test/{i}" for i in range(1, 5)]
+    assert all(jobs.status(job_id) == "completed" for job_id in job_ids)
+    assert fake.max_in_flight == 4
+    # Four 0.2 s uploads side by side, not one after another.
+    assert time.monotonic() - start < 0.75
+
+
+def test_cancelled_job_reports_cancelled(service):
+    fake, base_url = service
+    fake.polls_until_done = 10 ** 6
+    jobs = TranscriptionJobs(transcriber=transcriber(base_url))
+    job_id = jobs.submit(b"audio")
+    time.sleep(0.05)
+    assert jobs.cancel(job_id)
+    assert jobs.status(job_id) == "cancelled"
+
+
+class CountingFakeTranscriber(FakeTranscriber):
+    """FakeTranscriber that counts status polls, to tell whether abandoned segments keep running."""
+
+    def __init__(self, **options):
+        super().__init__(**options)
+        self.polls = 0
+
+    async def status(self, transcript_id):
+        self.polls += 1
+        return await super().status(transcript_id)
+
+
+def test_merge_transcripts_drops_words_repeated_across_each_seam():
+    texts = ["the quick brown fox jumps", "Fox jumps over the lazy dog.", "lazy dog sleeps"]
+    assert merge_transcripts(texts) == "the quick brown fox jumps over the lazy dog. sleeps"
+
+
+def test_merge_transcripts_keeps_a_single_repeated_word_and_skips_empty_segments():
+    assert merge_transcripts(["I said no", "", None, "no way"]) == "I said no no way"
+
+
+def test_merge_transcripts_finds_the_seam_after_a_clipped_first_word():
+    texts = ["we saw why neural networks learn features.", "works learn features. Next we cover transformers."]
+    assert merge_transcripts(texts) == "we saw why neural networks learn features. Next we cover transformers."
+
+
+def test_transcribe_many_merges_segments_in_order_and_reports_prefixes():
+    fake = FakeTranscriber(latency=0.05, transcript_for=lambda audio: audio.decode())
+    partials = []
+
+    async def main():
+        return await fake.transcribe_many([b"one two three", b"two three four", b"three four five"],
+                                          on_partial=lambda text, done, total: partials.append((done, total)))
+
+    assert run(main) == "one two three four five"
+    assert partials[-1] == (3, 3)
+    assert [done for done, _ in partials] == sorted(done for done, _ in partials)
+
+
+def test_transcribe_many_deadline_covers_the_whole_call():
+    # Each segment alone fits in the deadline; one after another they do not.
+    fake = FakeTranscriber(latency=0.15)
+
+    async def main():
+        start = time.monotonic()
+        with pytest.raises(TranscriptionTimeout):
+            await fake.transcribe_many([b"a", b"b", b"c"], deadline=0.3, max_concurrency=1)
+        return time.monotonic() - start
+
+    assert run(main) < 0.45
+
+
+def test_transcribe_many_cancels_the_other_segments_when_one_fails():
+    def transcript_for(audio):
+        if audio == b"bad":
+            raise TranscriptionError("segment rejected")
+        return "fine"
+
+    fake = CountingFakeTranscriber(latency=10.0, transcript_for=transcript_for)
+
+    async def main():
+        start = time.monotonic()
+        with pytest.raises(TranscriptionError, match="segment rejected"):
+            await fake.transcribe_many([b"good", b"good", b"bad", b"good"])
+        elapsed = time.monotonic() - start
+        polls = fake.polls
+        await asyncio.sleep(0.3)
+        return elapsed, fake.polls - polls
+
+    elapsed, polls_after_failure = run(main)
+    assert elapsed < 1.0
+    assert polls_after_failure == 0
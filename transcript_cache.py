@@ -0,0 +1,136 @@
+import hashlib
+import io
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from audio_buffer import AudioBuffer
+
+FINGERPRINT_BLOCK_FRAMES = 65536
+RAW_BLOCK_BYTES = 1 << 20
+
+
+def _open_stream(audio_file):
+    """A seekable binary stream or path for audio_file, without copying in-memory data."""
+    if isinstance(audio_file, AudioBuffer):
+        return io.BytesIO(audio_file.data)
+    if isinstance(audio_file, (bytes, bytearray, memoryview)):
+        return io.BytesIO(audio_file)
+    if hasattr(audio_file, "seek"):
+        audio_file.seek(0)
+    return audio_file
+
+
+def _hash_raw(stream, digest):
+    if isinstance(stream, str):
+        with open(stream, "rb") as f:
+            return _hash_raw(f, digest)
+    for block in iter(lambda: stream.read(RAW_BLOCK_BYTES), b""):
+        digest.update(block)
+    return digest
+
+
+def audio_fingerprint(audio_file, block_frames: int = FINGERPRINT_BLOCK_FRAMES) -> str:
+    """Content hash of the decoded audio, read block by block so long files never sit in memory whole.
+
+    The same recording re-encoded into another container hashes the same as
+    long as its samples do. Audio that cannot be decoded locally falls back to
+    a streaming hash of the file bytes.
+    """
+    import soundfile as sf
+    stream = _open_stream(audio_file)
+    digest = hashlib.sha256()
+    try:
+        with sf.SoundFile(stream) as f:
+            digest.update(f"pcm16:{f.samplerate}:{f.channels}\0".encode())
+            for block in f.blocks(blocksize=block_frames, dtype="int16"):
+                digest.update(block.tobytes())
+    except Exception:
+        digest = hashlib.sha256(b"raw\0")
+        if hasattr(stream, "seek"):
+            stream.seek(0)
+        _hash_raw(stream, digest)
+    if hasattr(stream, "seek"):
+        stream.seek(0)
+    return digest.hexdigest()
+
+
+def transcript_key(fingerprint: str, **options) -> str:
+    """Cache key for a transcript: the audio fingerprint plus the transcription options."""
+    return hashlib.sha256(f"{fingerprint}\0{json.dumps(options, sort_keys=True)}".encode()).hexdigest()
+
+
+class TranscriptCache:
+    """On-disk SQLite cache of transcripts, evicting least-recently-used entries beyond max_bytes."""
+
+    def __init__(self, db_path: str = "data/transcript_cache.db", max_bytes: int = 50 * 1024 * 1024):
+        self.db_path = db_path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS transcripts (
+                key TEXT PRIMARY KEY,
+                transcript TEXT,
+                size INTEGER,
+                last_used REAL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_transcripts_last_used ON transcripts (last_used)")
+        self._conn.commit()
+
+    def get(self, key: str):
+        """The cached transcript for key, or None."""
+        with self._lock:
+            row = self._conn.execute("SELECT transcript FROM transcripts WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._conn.execute("UPDATE transcripts SET last_used = ? WHERE key = ?", (time.time(), key))
+            self._conn.commit()
+            return row[0]
+
+    def put(self, key: str, transcript: str):
+        """Store a transcript and evict the oldest entries until the cache fits in max_bytes."""
+        size = len(transcript.encode("utf-8"))
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO transcripts (key, transcript, size, last_used) VALUES (?, ?, ?, ?)",
+                (key, transcript, size, time.time())
+            )
+            total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM transcripts").fetchone()[0]
+            if total > self.max_bytes:
+                rows = self._conn.execute(
+                    "SELECT key, size FROM transcripts WHERE key != ? ORDER BY last_used", (key,)
+                ).fetchall()
+                evicted = []
+                for old_key, old_size in rows:
+                    if total <= self.max_bytes:
+                        break
+                    evicted.append((old_key,))
+                    total -= old_size
+                self._conn.executemany("DELETE FROM transcripts WHERE key = ?", evicted)
+            self._conn.commit()
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries, size = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM transcripts"
+            ).fetchone()
+        return {"entries": entries, "bytes": size, "hits": self.hits, "misses": self.misses}
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM transcripts").fetchone()[0]
+
+    def close(self):
+        self._conn.close()
@@ -0,0 +1,341 @@
+import asyncio
+import itertools
+import os
+import re
+import threading
+import time
+import uuid
+
+from metrics import metrics
+from transport import transport as default_transport
+
+ASSEMBLYAI_BASE_URL = "https://api.assemblyai.com/v2"
+
+
+class TranscriptionError(Exception):
+    """AssemblyAI reported an error for a transcript job."""
+
+
+class TranscriptionTimeout(TranscriptionError):
+    """A transcript job did not finish before its deadline."""
+
+
+def audio_source(audio_file):
+    """Normalize transcriber input without copying it.
+
+    Paths stay paths (streamed from disk at upload time), buffers such as
+    Streamlit uploads or AudioBuffer become zero-copy memoryviews, and raw
+    bytes pass through. Other file-like objects are read once.
+    """
+    if isinstance(audio_file, (bytes, bytearray, memoryview)):
+        return audio_file
+    if isinstance(audio_file, (str, os.PathLike)):
+        return os.fspath(audio_file)
+    if hasattr(audio_file, "getbuffer"):
+        return audio_file.getbuffer()
+    if hasattr(audio_file, "read"):
+        return audio_file.read()
+    raise ValueError("Invalid audio file input.")
+
+
+def _payload_factory(source):
+    """Return a callable producing a fresh request body for each upload attempt."""
+    if isinstance(source, str):
+        return lambda: open(source, "rb")
+    return lambda: source
+
+
+def _words_key(words):
+    return [re.sub(r"[^\w']", "", word).lower() for word in words]
+
+
+def merge_transcripts(texts, max_overlap_words: int = 30, min_overlap_words: int = 2, max_skipped_words: int = 2):
+    """Join transcripts of overlapping segments, dropping words repeated across each seam.
+
+    The longest run (up to max_overlap_words) that ends one transcript and
+    starts the next, compared case- and punctuation-insensitively, is kept once.
+    A segment usually starts mid-word, so the run may begin after up to
+    max_skipped_words leading words of the next transcript; those go too.
+    """
+    merged = []
+    for text in texts:
+        words = (text or "").split()
+        if not words:
+            continue
+        tail = _words_key(merged[-max_overlap_words:])
+        head = _words_key(words[:max_overlap_words + max_skipped_words])
+        drop, best = 0, 0
+        for skip in range(min(max_skipped_words, len(head) - min_overlap_words) + 1):
+            longest = min(len(tail), len(head) - skip, max_overlap_words)
+            for k in range(longest, max(min_overlap_words, best + 1) - 1, -1):
+                if tail[-k:] == head[skip:skip + k]:
+                    drop, best = skip + k, k
+                    break
+        merged.extend(words[drop:])
+    return " ".join(merged)
+
+
+class AsyncTranscriber:
+    """AssemblyAI client on a pooled aiohttp session with backoff polling.
+
+    Use as an async context manager, or call close() when done:
+
+        async with AsyncTranscriber(api_key) as transcriber:
+            transcript_id = await transcriber.submit("lecture.wav")
+            text = await transcriber.result(transcript_id)
+    """
+
+    def __init__(self, api_key: str, base_url: str = ASSEMBLYAI_BASE_URL,
+                 poll_initial: float = 0.5, poll_max: float = 8.0, poll_backoff: float = 1.6,
+                 deadline: float = 900.0, max_connections: int = 10, transport=None):
+        self.api_key = api_key
+        self.base_url = base_url.rstrip("/")
+        self.poll_initial = poll_initial
+        self.poll_max = poll_max
+        self.poll_backoff = poll_backoff
+        self.deadline = deadline
+        self.max_connections = max_connections
+        self.transport = transport or default_transport
+        self._session = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    def _get_session(self):
+        import aiohttp
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                headers={"authorization": self.api_key},
+                connector=aiohttp.TCPConnector(limit=self.max_connections, keepalive_timeout=30),
+                trace_configs=[self.transport.aiohttp_trace_config()],
+            )
+        return self._session
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def _request(self, endpoint: str, method: str, path: str, payload=None, **kwargs):
+        import aiohttp
+        timeout = aiohttp.ClientTimeout(total=self.transport.policy(endpoint).timeout)
+
+        async def send():
+            data = payload() if payload else None
+            try:
+                async with self._get_session().request(
+                    method, f"{self.base_url}{path}", data=data, timeout=timeout,
+                    trace_request_ctx={"endpoint": endpoint}, **kwargs
+                ) as response:
+                    response.raise_for_status()
+                    return await response.json()
+            finally:
+                if hasattr(data, "close"):
+                    data.close()
+
+        return await self.transport.acall(endpoint, send)
+
+    async def upload(self, audio_file) -> str:
+        """Upload audio and return the URL AssemblyAI assigned to it.
+
+        The body is sent as a raw stream: files are read from disk in chunks and
+        in-memory audio is sent from its buffer, never copied into a multipart form.
+        """
+        source = audio_source(audio_file)
+        payload = _payload_factory(source)
+        body = await self._request("assemblyai.upload", "POST", "/upload", payload=payload)
+        size = os.path.getsize(source) if isinstance(source, str) else memoryview(source).nbytes
+        metrics.count("bytes_sent", size, endpoint="assemblyai.upload")
+        return body["upload_url"]
+
+    async def submit(self, audio_file, **options) -> str:
+        """Upload audio, start a transcript job and return its id without waiting."""
+        audio_url = await self.upload(audio_file)
+        body = await self._request("assemblyai.submit", "POST", "/transcript", json={"audio_url": audio_url, **options})
+        return body["id"]
+
+    async def status(self, transcript_id: str) -> dict:
+        """Return the raw transcript resource, including 'status' and 'text'."""
+        return await self._request("assemblyai.poll", "GET", f"/transcript/{transcript_id}")
+
+    async def result(self, transcript_id: str, deadline: float = None) -> str:
+        """Poll with exponential backoff until the job completes, fails or times out."""
+        deadline = self.deadline if deadline is None else deadline
+        give_up_at = time.monotonic() + deadline
+        delay = self.poll_initial
+        while True:
+            body = await self.status(transcript_id)
+            if body["status"] == "completed":
+                return body["text"]
+            if body["status"] == "error":
+                raise TranscriptionError(f"AssemblyAI error: {body['error']}")
+            remaining = give_up_at - time.monotonic()
+            if remaining <= 0:
+                raise TranscriptionTimeout(f"Transcript {transcript_id} not ready after {deadline:g}s")
+            await asyncio.sleep(min(delay, remaining))
+            delay = min(delay * self.poll_backoff, self.poll_max)
+
+    async def transcribe(self, audio_file, deadline: float = None, **options) -> str:
+        transcript_id = await self.submit(audio_file, **options)
+        return await self.result(transcript_id, deadline)
+
+    async def transcribe_many(self, segments, deadline: float = None, max_concurrency: int = 4,
+                              on_partial=None, **options) -> str:
+        """Transcribe consecutive (possibly overlapping) segments concurrently and merge them in order.
+
+        At most max_concurrency segments are in flight. Whenever the finished
+        segments form a longer in-order prefix, on_partial(text, done, total)
+        receives the merged transcript so far. `deadline` bounds the whole
+        call; when it passes or any segment fails, the other segments are
+        cancelled and the error is raised.
+        """
+        deadline = self.deadline if deadline is None else deadline
+        give_up_at = time.monotonic() + deadline
+        semaphore = asyncio.Semaphore(max_concurrency)
+        texts = [None] * len(segments)
+        reported = 0
+
+        async def one(index, segment):
+            nonlocal reported
+            async with semaphore:
+                remaining = give_up_at - time.monotonic()
+                if remaining <= 0:
+                    raise TranscriptionTimeout(f"Segment {index + 1} not started after {deadline:g}s")
+                texts[index] = await self.transcribe(segment, remaining, **options)
+            ready = reported
+            while ready < len(texts) and texts[ready] is not None:
+                ready += 1
+            if on_partial and ready > reported:
+                reported = ready
+                on_partial(merge_transcripts(texts[:ready]), ready, len(texts))
+
+        tasks = [asyncio.ensure_future(one(i, segment)) for i, segment in enumerate(segments)]
+        try:
+            if tasks:
+                await asyncio.wait(tasks, timeout=max(0.0, give_up_at - time.monotonic()),
+                                   return_when=asyncio.FIRST_EXCEPTION)
+            for task in tasks:
+                if task.done() and not task.cancelled() and task.exception() is not None:
+                    raise task.exception()
+            if not all(task.done() for task in tasks):
+                raise TranscriptionTimeout(f"Segments not transcribed after {deadline:g}s")
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+        return merge_transcripts(texts)
+
+
+class FakeTranscriber(AsyncTranscriber):
+    """Offline stand-in for AssemblyAI with configurable per-job latency.
+
+    Jobs report "processing" until `latency` seconds after submission, so the
+    real polling, deadline and concurrency logic still runs. `transcript_for`
+    maps the uploaded audio to its text (by default a fixed string).
+    """
+
+    def __init__(self, latency: float = 1.0, transcript_for=None, **options):
+        options.setdefault("poll_initial", min(0.1, latency or 0.1))
+        super().__init__("fake-key", **options)
+        self.latency = latency
+        self.transcript_for = transcript_for or (lambda audio: "offline transcript")
+        self.max_in_flight = 0
+        self._jobs = {}
+
+    async def submit(self, audio_file, **options) -> str:
+        source = audio_source(audio_file)
+        if isinstance(source, str):
+            with open(source, "rb") as f:
+                source = f.read()
+        transcript_id = uuid.uuid4().hex
+        self._jobs[transcript_id] = (time.monotonic() + self.latency, self.transcript_for(source))
+        in_flight = sum(1 for ready_at, _ in self._jobs.values() if ready_at > time.monotonic())
+        self.max_in_flight = max(self.max_in_flight, in_flight)
+        return transcript_id
+
+    async def status(self, transcript_id: str) -> dict:
+        ready_at, text = self._jobs[transcript_id]
+        if time.monotonic() < ready_at:
+            return {"id": transcript_id, "status": "processing"}
+        return {"id": transcript_id, "status": "completed", "text": text}
+
+
+class TranscriptionJobs:
+    """Thread-safe, non-blocking facade over AsyncTranscriber for the Streamlit script thread.
+
+    Jobs run on a private event loop in a daemon thread. submit() returns a job id
+    immediately; status() and result() never block unless a timeout is given.
+    """
+
+    def __init__(self, api_key: str = None, transcriber: AsyncTranscriber = None, **transcriber_options):
+        self._transcriber = transcriber or AsyncTranscriber(api_key, **transcriber_options)
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="transcription-loop", daemon=True)
+        self._thread.start()
+        self._jobs = {}
+        self._partials = {}
+        self._ids = itertools.count(1)
+
+    def submit(self, audio_file, deadline: float = None, **options) -> int:
+        coro = self._transcriber.transcribe(audio_source(audio_file), deadline, **options)
+        job_id = next(self._ids)
+        self._jobs[job_id] = asyncio.run_coroutine_threadsafe(coro, self._loop)
+        return job_id
+
+    def submit_many(self, segments, deadline: float = None, max_concurrency: int = 4, **options) -> int:
+        """Like submit(), for consecutive segments whose transcripts are merged in order.
+
+        partial() exposes the merged text of the segments finished so far.
+        """
+        job_id = next(self._ids)
+        segments = [audio_source(segment) for segment in segments]
+        self._partials[job_id] = ("", 0, len(segments))
+
+        def on_partial(text, done, total):
+            self._partials[job_id] = (text, done, total)
+
+        coro = self._transcriber.transcribe_many(segments, deadline, max_concurrency, on_partial, **options)
+        self._jobs[job_id] = asyncio.run_coroutine_threadsafe(coro, self._loop)
+        return job_id
+
+    def partial(self, job_id: int):
+        """(text so far, segments done, total segments) for a submit_many job."""
+        return self._partials.get(job_id, ("", 0, 1))
+
+    def status(self, job_id: int) -> str:
+        """One of 'processing', 'completed', 'error' or 'cancelled'."""
+        future = self._jobs[job_id]
+        if not future.done():
+            return "processing"
+        if future.cancelled():
+            return "cancelled"
+        return "error" if future.exception() else "completed"
+
+    def result(self, job_id: int, timeout: float = None) -> str:
+        """Return the transcript, raising the job's error; waits up to timeout seconds."""
+        return self._jobs[job_id].result(timeout)
+
+    def cancel(self, job_id: int) -> bool:
+        return self._jobs[job_id].cancel()
+
+    def forget(self, job_id: int):
+        self._jobs.pop(job_id, None)
+        self._partials.pop(job_id, None)
+
+    def transcribe(self, audio_file, deadline: float = None, **options) -> str:
+        """Blocking convenience wrapper: submit a job and wait for its transcript."""
+        job_id = self.submit(audio_file, deadline, **options)
+        try:
+            return self.result(job_id)
+        finally:
+            self.forget(job_id)
+
+    def transcribe_many(self, segments, deadline: float = None, **options) -> str:
+        job_id = self.submit_many(segments, deadline, **options)
+        try:
+            return self.result(job_id)
+        finally:
+            self.forget(job_id)
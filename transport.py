@@ -0,0 +1,368 @@
+import asyncio
+import contextvars
+import random
+import threading
+import time
+from collections import deque
+
+RETRYABLE_STATUS = {408, 425, 429, 500, 502, 503, 504}
+
+# Endpoint name of the call() or stream() in progress, for connection accounting.
+_current_endpoint = contextvars.ContextVar("current_endpoint", default=None)
+_EXHAUSTED = object()
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling an endpoint whose circuit breaker is open."""
+
+
+class EndpointPolicy:
+    """Timeout, retry and circuit-breaker settings for one outbound endpoint."""
+
+    def __init__(self, timeout: float = 30.0, max_retries: int = 2, backoff: float = 0.5,
+                 max_backoff: float = 8.0, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+
+    def retry_delay(self, attempt: int) -> float:
+        """Full-jitter exponential backoff for the given (0-based) retry attempt."""
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+
+
+DEFAULT_POLICIES = {
+    "cohere.generate": EndpointPolicy(timeout=60.0),
+    "cohere.generate_stream": EndpointPolicy(timeout=60.0),
+    "cohere.chat": EndpointPolicy(timeout=60.0),
+    "cohere.chat_stream": EndpointPolicy(timeout=60.0),
+    "cohere.embed": EndpointPolicy(timeout=30.0),
+    "assemblyai.upload": EndpointPolicy(timeout=300.0),
+    "assemblyai.submit": EndpointPolicy(timeout=30.0),
+    "assemblyai.poll": EndpointPolicy(timeout=15.0, max_retries=3),
+}
+
+
+class CircuitBreaker:
+    """Open after `failure_threshold` consecutive failures; allow one trial call after `reset_timeout`."""
+
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half-open"
+        return "open"
+
+    def before_call(self):
+        with self._lock:
+            if self.state == "open":
+                raise CircuitOpenError("circuit open")
+            if self.state == "half-open":
+                # Let this caller probe; everyone else waits for its outcome.
+                self.opened_at = time.monotonic()
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+
+
+class EndpointStats:
+    """Call, retry, latency and connection counters for one endpoint."""
+
+    def __init__(self, window: int = 1000):
+        self.calls = 0
+        self.failures = 0
+        self.retries = 0
+        self.rejected = 0
+        self.new_connections = 0
+        self.reused_connections = 0
+        self.latencies = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def increment(self, counter: str):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def record(self, seconds: float, ok: bool):
+        with self._lock:
+            self.calls += 1
+            if not ok:
+                self.failures += 1
+            self.latencies.append(seconds)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            latencies = sorted(self.latencies)
+        def percentile(p):
+            if not latencies:
+                return None
+            return round(latencies[min(len(latencies) - 1, int(p * len(latencies)))] * 1000, 1)
+        return {
+            "calls": self.calls,
+            "failures": self.failures,
+            "retries": self.retries,
+            "rejected": self.rejected,
+            "p50_ms": percentile(0.50),
+            "p95_ms": percentile(0.95),
+            "new_connections": self.new_connections,
+            "reused_connections": self.reused_connections,
+        }
+
+
+def is_retryable(exc: BaseException) -> bool:
+    """Transient network errors and throttling/server HTTP statuses are retried."""
+    status = getattr(exc, "status_code", None) or getattr(exc, "status", None)
+    response = getattr(exc, "response", None)
+    if status is None and response is not None:
+        status = getattr(response, "status_code", None)
+    if isinstance(status, int):
+        return status in RETRYABLE_STATUS
+    if isinstance(exc, (ConnectionError, TimeoutError, asyncio.TimeoutError)):
+        return True
+    try:
+        import httpx
+        if isinstance(exc, httpx.TransportError):
+            return True
+    except ImportError:
+        pass
+    try:
+        import aiohttp
+        if isinstance(exc, aiohttp.ClientConnectionError):
+            return True
+    except ImportError:
+        pass
+    return False
+
+
+class Transport:
+    """Shared outbound-HTTP layer: pooled clients, per-endpoint timeouts,
+    bounded jittered retries, circuit breakers and latency/reuse counters.
+
+    Wrap any client call with call()/acall() under an endpoint name such as
+    "cohere.chat"; the name selects the policy and the stats bucket.
+    """
+
+    def __init__(self, policies: dict = None, default_policy: EndpointPolicy = None):
+        self.policies = dict(DEFAULT_POLICIES if policies is None else policies)
+        self.default_policy = default_policy or EndpointPolicy()
+        self._breakers = {}
+        self._stats = {}
+        self._lock = threading.Lock()
+        self._httpx_clients = {}
+
+    def policy(self, endpoint: str) -> EndpointPolicy:
+        return self.policies.get(endpoint, self.default_policy)
+
+    def stats(self, endpoint: str) -> EndpointStats:
+        with self._lock:
+            if endpoint not in self._stats:
+                self._stats[endpoint] = EndpointStats()
+            return self._stats[endpoint]
+
+    def breaker(self, endpoint: str) -> CircuitBreaker:
+        with self._lock:
+            if endpoint not in self._breakers:
+                policy = self.policy(endpoint)
+                self._breakers[endpoint] = CircuitBreaker(policy.failure_threshold, policy.reset_timeout)
+            return self._breakers[endpoint]
+
+    def _before_call(self, endpoint: str, breaker: CircuitBreaker):
+        try:
+            breaker.before_call()
+        except CircuitOpenError:
+            self.stats(endpoint).increment("rejected")
+            raise CircuitOpenError(f"{endpoint} is temporarily unavailable (circuit open)")
+
+    def call(self, endpoint: str, fn, *args, **kwargs):
+        """Call fn(*args, **kwargs) under the endpoint's retry and breaker policy."""
+        policy = self.policy(endpoint)
+        breaker = self.breaker(endpoint)
+        stats = self.stats(endpoint)
+        attempt = 0
+        while True:
+            self._before_call(endpoint, breaker)
+            start = time.perf_counter()
+            token = _current_endpoint.set(endpoint)
+            try:
+                result = fn(*args, **kwargs)
+            except Exception as e:
+                stats.record(time.perf_counter() - start, ok=False)
+                breaker.record_failure()
+                if attempt >= policy.max_retries or not is_retryable(e):
+                    raise
+                stats.increment("retries")
+                time.sleep(policy.retry_delay(attempt))
+                attempt += 1
+                continue
+            finally:
+                _current_endpoint.reset(token)
+            stats.record(time.perf_counter() - start, ok=True)
+            breaker.record_success()
+            return result
+
+    def stream(self, endpoint: str, fn, *args, **kwargs):
+        """Yield the items of the iterator fn(*args, **kwargs) under the endpoint's policy.
+
+        Streaming SDK methods are often generators that send nothing until
+        first iterated, so the first item is fetched inside the retry and
+        breaker loop. Latency and success are recorded over the whole stream.
+        Errors after the first item are not retried, since part of the stream
+        has already been delivered; a consumer that stops early is not a failure.
+        """
+        policy = self.policy(endpoint)
+        breaker = self.breaker(endpoint)
+        stats = self.stats(endpoint)
+        attempt = 0
+        while True:
+            self._before_call(endpoint, breaker)
+            start = time.perf_counter()
+            token = _current_endpoint.set(endpoint)
+            try:
+                items = iter(fn(*args, **kwargs))
+                first = next(items, _EXHAUSTED)
+            except Exception as e:
+                stats.record(time.perf_counter() - start, ok=False)
+                breaker.record_failure()
+                if attempt >= policy.max_retries or not is_retryable(e):
+                    raise
+                stats.increment("retries")
+                time.sleep(policy.retry_delay(attempt))
+                attempt += 1
+                continue
+            finally:
+                _current_endpoint.reset(token)
+            break
+
+        ok = True
+        try:
+            if first is not _EXHAUSTED:
+                yield first
+                yield from items
+        except GeneratorExit:
+            raise
+        except Exception:
+            ok = False
+            raise
+        finally:
+            stats.record(time.perf_counter() - start, ok=ok)
+            if ok:
+                breaker.record_success()
+            else:
+                breaker.record_failure()
+
+    async def acall(self, endpoint: str, fn, *args, **kwargs):
+        """Async counterpart of call(): awaits fn(*args, **kwargs)."""
+        policy = self.policy(endpoint)
+        breaker = self.breaker(endpoint)
+        stats = self.stats(endpoint)
+        attempt = 0
+        while True:
+            self._before_call(endpoint, breaker)
+            start = time.perf_counter()
+            try:
+                result = await fn(*args, **kwargs)
+            except Exception as e:
+                stats.record(time.perf_counter() - start, ok=False)
+                breaker.record_failure()
+                if attempt >= policy.max_retries or not is_retryable(e):
+                    raise
+                stats.increment("retries")
+                await asyncio.sleep(policy.retry_delay(attempt))
+                attempt += 1
+                continue
+            stats.record(time.perf_counter() - start, ok=True)
+            breaker.record_success()
+            return result
+
+    def record_connection(self, endpoint: str, reused: bool):
+        self.stats(endpoint).increment("reused_connections" if reused else "new_connections")
+
+    def request_options(self, endpoint: str) -> dict:
+        """Per-call options for Cohere SDK methods carrying the endpoint timeout."""
+        return {"timeout_in_seconds": self.policy(endpoint).timeout}
+
+    def httpx_client(self, prefix: str, max_connections: int = 20):
+        """Shared keep-alive httpx.Client (e.g. for cohere.Client(httpx_client=...)).
+
+        Requests made inside call() or stream() count towards that endpoint
+        name; others are attributed to "<prefix>.<last path segment>", so a
+        Cohere POST /v1/chat counts towards "cohere.chat".
+        """
+        import httpx
+
+        with self._lock:
+            if prefix in self._httpx_clients:
+                return self._httpx_clients[prefix]
+            transport = self
+
+            class CountingTransport(httpx.HTTPTransport):
+                def handle_request(self, request):
+                    opened = []
+                    request.extensions = {
+                        **request.extensions,
+                        "trace": lambda name, info: opened.append(name) if name.startswith("connection.connect_tcp") else None,
+                    }
+                    response = super().handle_request(request)
+                    endpoint = _current_endpoint.get() or f"{prefix}.{request.url.path.rstrip('/').rsplit('/', 1)[-1]}"
+                    transport.record_connection(endpoint, reused=not opened)
+                    return response
+
+            client = httpx.Client(
+                transport=CountingTransport(limits=httpx.Limits(
+                    max_connections=max_connections, max_keepalive_connections=max_connections
+                )),
+                timeout=httpx.Timeout(max(p.timeout for p in self.policies.values()) if self.policies else 60.0),
+            )
+            self._httpx_clients[prefix] = client
+            return client
+
+    def aiohttp_trace_config(self):
+        """aiohttp TraceConfig that counts new vs reused connections per endpoint.
+
+        Pass trace_request_ctx={"endpoint": name} on each request.
+        """
+        import aiohttp
+
+        async def on_create(session, ctx, params):
+            endpoint = (ctx.trace_request_ctx or {}).get("endpoint")
+            if endpoint:
+                self.record_connection(endpoint, reused=False)
+
+        async def on_reuse(session, ctx, params):
+            endpoint = (ctx.trace_request_ctx or {}).get("endpoint")
+            if endpoint:
+                self.record_connection(endpoint, reused=True)
+
+        trace_config = aiohttp.TraceConfig()
+        trace_config.on_connection_create_end.append(on_create)
+        trace_config.on_connection_reuseconn.append(on_reuse)
+        return trace_config
+
+    def snapshot(self) -> dict:
+        """Per-endpoint counters, latency percentiles and breaker state."""
+        with self._lock:
+            endpoints = list(self._stats)
+        return {
+            endpoint: {**self.stats(endpoint).snapshot(), "circuit": self.breaker(endpoint).state}
+            for endpoint in endpoints
+        }
+
+
+transport = Transport()
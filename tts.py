@@ -0,0 +1,307 @@
+import hashlib
+import io
+import os
+import tempfile
+import wave
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from chunking import split_sentences
+from metrics import metrics
+
+SUPPORTED_FORMATS = ("mp3", "wav")
+
+
+def convert_audio(data: bytes, source_format: str, target_format: str) -> bytes:
+    """Re-encode audio bytes between mp3 and wav (needs pydub and ffmpeg)."""
+    if source_format == target_format:
+        return data
+    try:
+        from pydub import AudioSegment
+    except ImportError:
+        raise ImportError(f"pydub required for {target_format.upper()} conversion. Install with: pip install pydub")
+    sound = AudioSegment.from_file(io.BytesIO(data), format=source_format)
+    out = io.BytesIO()
+    sound.export(out, format=target_format)
+    return out.getvalue()
+
+
+def split_for_speech(text: str, min_chars: int = 80):
+    """Split text into sentence groups for incremental synthesis.
+
+    The first sentence stands alone so playback can start early; later ones are
+    merged up to min_chars to keep the number of synthesis calls down.
+    """
+    segments = []
+    current = ""
+    for start, end in split_sentences(text):
+        sentence = text[start:end]
+        current = f"{current} {sentence}" if current else sentence
+        if not segments or len(current) >= min_chars:
+            segments.append(current)
+            current = ""
+    if current:
+        segments.append(current)
+    return segments
+
+
+def join_audio(segments, output_format: str) -> bytes:
+    """Concatenate encoded segments: MP3 frames back to back, WAV via the wave module."""
+    if output_format == "mp3":
+        return b"".join(segments)
+    out = io.BytesIO()
+    with wave.open(out, "wb") as writer:
+        for i, data in enumerate(segments):
+            with wave.open(io.BytesIO(data), "rb") as reader:
+                if i == 0:
+                    writer.setparams(reader.getparams())
+                writer.writeframes(reader.readframes(reader.getnframes()))
+    return out.getvalue()
+
+
+class GTTSBackend:
+    """Google Translate TTS (online, MP3)."""
+
+    name = "gtts"
+    native_format = "mp3"
+
+    def synthesize(self, text: str, voice: str = None) -> bytes:
+        from gtts import gTTS
+        out = io.BytesIO()
+        gTTS(text=text, lang=voice or "en").write_to_fp(out)
+        return out.getvalue()
+
+
+class Pyttsx3Backend:
+    """Offline system TTS through pyttsx3 (SAPI5, NSSpeechSynthesizer or eSpeak), WAV output."""
+
+    name = "pyttsx3"
+    native_format = "wav"
+
+    def __init__(self, rate: int = None):
+        self.rate = rate
+        self._engine = None
+        # pyttsx3 engines belong to the thread that created them and runAndWait is
+        # not reentrant, so one dedicated thread creates the engine and runs every call.
+        self._worker = ThreadPoolExecutor(max_workers=1, thread_name_prefix="pyttsx3")
+
+    def synthesize(self, text: str, voice: str = None) -> bytes:
+        return self._worker.submit(self._synthesize, text, voice).result()
+
+    def _synthesize(self, text: str, voice: str = None) -> bytes:
+        if self._engine is None:
+            import pyttsx3
+            self._engine = pyttsx3.init()
+            if self.rate:
+                self._engine.setProperty("rate", self.rate)
+        if voice:
+            self._engine.setProperty("voice", voice)
+        fd, path = tempfile.mkstemp(suffix=".wav")
+        os.close(fd)
+        try:
+            self._engine.save_to_file(text, path)
+            self._engine.runAndWait()
+            with open(path, "rb") as f:
+                return f.read()
+        finally:
+            os.remove(path)
+
+
+BACKENDS = {
+    "gtts": GTTSBackend,
+    "pyttsx3": Pyttsx3Backend,
+}
+
+
+class AudioCache:
+    """Content-addressed cache of synthesized audio files, evicting least recently used past max_bytes."""
+
+    def __init__(self, directory: str = "data/tts_cache", max_bytes: int = 200 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def key(text: str, backend: str, voice: str, output_format: str) -> str:
+        return hashlib.sha256(f"{backend}\0{voice or ''}\0{output_format}\0{text}".encode("utf-8")).hexdigest()
+
+    def path(self, key: str, output_format: str) -> str:
+        return os.path.join(self.directory, f"{key}.{output_format}")
+
+    def get(self, key: str, output_format: str):
+        """Return the cached file path, or None."""
+        path = self.path(key, output_format)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return path
+
+    def put(self, key: str, output_format: str, data: bytes) -> str:
+        """Store audio atomically (safe with concurrent writers) and return its path."""
+        path = self.path(key, output_format)
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".part")
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        self._evict(keep=path)
+        return path
+
+    def _evict(self, keep: str):
+        entries = []
+        total = 0
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and not entry.name.endswith(".part"):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+                total += stat.st_size
+        if total <= self.max_bytes:
+            return
+        for _, size, path in sorted(entries):
+            if path == keep:
+                continue
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                continue
+            total -= size
+            if total <= self.max_bytes:
+                break
+
+
+class TextToSpeech:
+    """Synthesize speech through the first backend that succeeds, serving repeats from the audio cache.
+
+    Returned paths are either immutable cache entries or fresh per-request
+    files, so concurrent users never overwrite each other's audio.
+    """
+
+    def __init__(self, backends, cache: AudioCache = None):
+        self.backends = list(backends)
+        self.cache = cache
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    def synthesize(self, text: str, output_format: str = "mp3", voice: str = None) -> str:
+        output_format = output_format.lower()
+        if output_format not in SUPPORTED_FORMATS:
+            raise ValueError("Unsupported output format. Use 'mp3' or 'wav'.")
+
+        cached = self._cached(text, output_format, voice)
+        if cached:
+            return cached
+        errors = []
+        for backend in self.backends:
+            try:
+                return self._synthesize_with(backend, text, output_format, voice, check_cache=False)
+            except Exception as e:
+                errors.append(f"{backend.name}: {e}")
+        raise RuntimeError("; ".join(errors) or "No TTS backend configured.")
+
+    def _cached(self, text: str, output_format: str, voice: str):
+        """Path of a cached rendering of text by any backend, counting the hit or miss."""
+        if self.cache is None:
+            return None
+        for backend in self.backends:
+            cached = self.cache.get(AudioCache.key(text, backend.name, voice, output_format), output_format)
+            if cached:
+                self.cache_hits += 1
+                metrics.count("cache_hits", cache="tts")
+                return cached
+        self.cache_misses += 1
+        metrics.count("cache_misses", cache="tts")
+        return None
+
+    def _store(self, data: bytes, text: str, backend, output_format: str, voice: str) -> str:
+        if self.cache is not None:
+            return self.cache.put(AudioCache.key(text, backend.name, voice, output_format), output_format, data)
+        with tempfile.NamedTemporaryFile(delete=False, suffix=f".{output_format}") as f:
+            f.write(data)
+            return f.name
+
+    def _synthesize_with(self, backend, text: str, output_format: str, voice: str, check_cache: bool = True) -> str:
+        """Render text with this backend only, through its own cache entry."""
+        if check_cache and self.cache is not None:
+            cached = self.cache.get(AudioCache.key(text, backend.name, voice, output_format), output_format)
+            if cached:
+                self.cache_hits += 1
+                metrics.count("cache_hits", cache="tts")
+                return cached
+            self.cache_misses += 1
+            metrics.count("cache_misses", cache="tts")
+        data = convert_audio(backend.synthesize(text, voice), backend.native_format, output_format)
+        return self._store(data, text, backend, output_format, voice)
+
+    def synthesize_streaming(self, text: str, output_format: str = "mp3", voice: str = None,
+                             on_segment=None, workers: int = 3) -> str:
+        """Synthesize sentence by sentence and return the stitched file's path.
+
+        Up to `workers` segments are synthesized ahead in a thread pool.
+        on_segment(index, path) is called in order, on the caller's thread, as
+        soon as each segment is ready, so playback can start after the first
+        sentence instead of after the whole text.
+
+        Every segment comes from the same backend. If one fails, the whole text
+        is redone with the next backend; segments already handed to on_segment
+        are not handed over again.
+        """
+        output_format = output_format.lower()
+        if output_format not in SUPPORTED_FORMATS:
+            raise ValueError("Unsupported output format. Use 'mp3' or 'wav'.")
+        sentences = split_for_speech(text)
+        if len(sentences) <= 1:
+            path = self.synthesize(text, output_format, voice)
+            if on_segment:
+                on_segment(0, path)
+            return path
+
+        cached = self._cached(text, output_format, voice)
+        if cached:
+            if on_segment:
+                on_segment(0, cached)
+            return cached
+        errors = []
+        delivered = [0]
+        for backend in self.backends:
+            try:
+                data = self._stream_with(backend, sentences, output_format, voice, on_segment, workers, delivered)
+            except Exception as e:
+                errors.append(f"{backend.name}: {e}")
+                continue
+            return self._store(data, text, backend, output_format, voice)
+        raise RuntimeError("; ".join(errors) or "No TTS backend configured.")
+
+    def _stream_with(self, backend, sentences, output_format, voice, on_segment, workers, delivered) -> bytes:
+        """Synthesize every sentence with one backend and return the joined audio."""
+        segment_data = []
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="tts") as pool:
+            pending = deque()
+            remaining = iter(sentences)
+            for sentence in remaining:
+                pending.append(pool.submit(self._synthesize_with, backend, sentence, output_format, voice))
+                if len(pending) >= workers:
+                    break
+            index = 0
+            try:
+                while pending:
+                    path = pending.popleft().result()
+                    for sentence in remaining:
+                        pending.append(pool.submit(self._synthesize_with, backend, sentence, output_format, voice))
+                        break
+                    if on_segment and index >= delivered[0]:
+                        on_segment(index, path)
+                        delivered[0] = index + 1
+                    with open(path, "rb") as f:
+                        segment_data.append(f.read())
+                    index += 1
+            except BaseException:
+                for future in pending:
+                    future.cancel()
+                raise
+        return join_audio(segment_data, output_format)
+
+
+def create_text_to_speech(backend_names: str = "gtts,pyttsx3", cache_dir: str = "data/tts_cache") -> TextToSpeech:
+    """Build a TextToSpeech from a comma-separated backend list, e.g. the TTS_BACKENDS setting."""
+    backends = [BACKENDS[name.strip()]() for name in backend_names.split(",") if name.strip()]
+    return TextToSpeech(backends, AudioCache(cache_dir) if cache_dir else None)
@@ -1,166 +1,311 @@
+import hashlib
 import os
-import sqlite3
-from datetime import datetime
-import tempfile
-import requests
-from dotenv import load_dotenv
-import cohere
+import time
 
-load_dotenv()
+from streamlit import cache_resource
 
-COHERE_API_KEY = os.getenv("COHERE_API_KEY")
-ASSEMBLYAI_API_KEY = os.getenv("ASSEMBLYAI_API_KEY")
+from chat_log import SESSION_LOG_SCHEMA, connect, fetch_page, get_writer
+from metrics import metrics
+from retrieval import estimate_tokens
+from transcription import FakeTranscriber, TranscriptionJobs
+from transport import transport
 
-if not COHERE_API_KEY:
-    raise ValueError("Please set your COHERE_API_KEY environment variable.")
-if not ASSEMBLYAI_API_KEY:
-    raise ValueError("Please set your ASSEMBLYAI_API_KEY environment variable.")
+# Clients, numpy-backed stores and audio decoding load on first use, not at import.
 
-co = cohere.Client(COHERE_API_KEY)
+_env_loaded = False
 
-knowledge_embeddings = []
-knowledge_texts = []
+def _getenv(name: str, default: str = None):
+    global _env_loaded
+    if not _env_loaded:
+        from dotenv import load_dotenv
+        load_dotenv()
+        _env_loaded = True
+    return os.getenv(name, default)
 
-def generate_response(prompt: str) -> str:
+def _require_key(name: str) -> str:
+    key = _getenv(name)
+    if not key:
+        raise ValueError(f"Please set your {name} environment variable.")
+    return key
+
+@cache_resource
+def get_cohere_client():
+    import cohere
+    return cohere.Client(
+        _require_key("COHERE_API_KEY"), httpx_client=transport.httpx_client("cohere"), max_retries=0
+    )
+
+_llm = None
+
+def get_llm():
+    global _llm
+    if _llm is None:
+        from llm import CohereChatBackend
+        _llm = CohereChatBackend(get_cohere_client(), model="command", max_tokens=300, temperature=0.7)
+    return _llm
+
+@cache_resource
+def get_embedder():
+    from embeddings import CachedEmbedder, CohereEmbedder, EmbeddingCache
+    return CachedEmbedder(CohereEmbedder(get_cohere_client(), model="small"), EmbeddingCache("data/embedding_cache.db"))
+
+@cache_resource
+def get_response_cache():
+    from response_cache import ResponseCache
+    similarity = _getenv("RESPONSE_CACHE_SIMILARITY")
+    return ResponseCache(
+        "data/response_cache.db",
+        embedder=get_embedder() if similarity else None,
+        similarity_threshold=float(similarity) if similarity else None,
+    )
+
+def _ann_options():
+    """IVF options from ANN_INDEX ("ivf", "ivf-int8" or "ivf-pq") and ANN_PROBES, or None for exact search."""
+    mode = _getenv("ANN_INDEX")
+    if not mode:
+        return None
+    kind, _, quantization = mode.partition("-")
+    if kind != "ivf":
+        raise ValueError(f"Unsupported ANN_INDEX {mode!r}; use ivf, ivf-int8 or ivf-pq.")
+    return {"n_probe": int(_getenv("ANN_PROBES", "8")), "quantization": quantization or None}
+
+@cache_resource
+def get_knowledge_store():
+    from knowledge_store import KnowledgeStore
+    return KnowledgeStore("data/knowledge_store", ann=_ann_options())
+
+@cache_resource
+def get_lexical_index():
+    from retrieval import StoreLexicalIndex
+    return StoreLexicalIndex(get_knowledge_store())
+
+@cache_resource
+def get_tts_engine():
+    from tts import create_text_to_speech
+    return create_text_to_speech(_getenv("TTS_BACKENDS", "gtts,pyttsx3"))
+
+@cache_resource
+def get_job_queue():
+    from jobs import JobQueue
+    return JobQueue("data/jobs.db")
+
+@cache_resource
+def get_transcript_cache():
+    from transcript_cache import TranscriptCache
+    return TranscriptCache("data/transcript_cache.db")
+
+@cache_resource
+def get_request_log():
+    from metrics import RequestLog
+    return RequestLog("data/request_log.jsonl")
+
+@cache_resource
+def start_metrics_export():
+    metrics.export_periodically("data/metrics.prom")
+    return True
+
+def trace_request(kind: str, **attrs):
+    """Time one user request; its stages and counters go to data/request_log.jsonl."""
+    return metrics.request(kind, log=get_request_log(), **attrs)
+
+def get_metrics_snapshot() -> dict:
+    return metrics.snapshot()
+
+def set_llm_backend(backend):
+    global _llm
+    _llm = backend
+
+def _cache_namespace() -> str:
+    llm = get_llm()
+    return getattr(llm, "model", type(llm).__name__)
+
+def generate_response(prompt: str, question: str = None) -> str:
     try:
-        response = co.chat(
-            model="command",
-            message=prompt,
-            temperature=0.7,
-            max_tokens=300,
-        )
-        return response.text.strip()
+        with metrics.span("generate"):
+            response_cache = get_response_cache()
+            cached = response_cache.get(prompt, _cache_namespace(), question)
+            if cached is not None:
+                metrics.count("cache_hits", cache="response")
+                return cached
+            metrics.count("cache_misses", cache="response")
+            response = get_llm().generate(prompt)
+            metrics.count("tokens_generated", estimate_tokens(response))
+            response_cache.put(prompt, response, _cache_namespace(), question)
+            return response
     except Exception as e:
         return f"Error generating response: {str(e)}"
 
-def save_chat_log(user_text: str, bot_response: str):
-    os.makedirs("data", exist_ok=True)
-    conn = sqlite3.connect("data/session_logs.db")
-    c = conn.cursor()
-    c.execute("""
-        CREATE TABLE IF NOT EXISTS chat_logs (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            timestamp TEXT,
-            user_input TEXT,
-            bot_response TEXT
-        )
-    """)
-    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    c.execute("INSERT INTO chat_logs (timestamp, user_input, bot_response) VALUES (?, ?, ?)",
-              (timestamp, user_text, bot_response))
-    conn.commit()
-    conn.close()
-
-def load_knowledge_base_from_text(text: str):
-    import numpy as np
+def generate_response_stream(prompt: str, question: str = None):
     try:
-        response = co.embed(
-            texts=[text],
-            model="small",
-            truncate="RIGHT"
-        )
-        embedding = response.embeddings[0]
-        knowledge_embeddings.append(embedding)
-        knowledge_texts.append(text)
-        return True
+        # Time only producing pieces, not how long the page takes to render each one.
+        yield from metrics.span_iter("generate", _stream_response(prompt, question))
     except Exception as e:
-        print(f"Error creating embedding: {e}")
-        return False
+        yield f"Error generating response: {str(e)}"
 
-def semantic_search(query: str, top_k=1):
-    import numpy as np
-    if not knowledge_embeddings:
-        return []
+def _stream_response(prompt: str, question: str = None):
+    start = time.perf_counter()
+    response_cache = get_response_cache()
+    cached = response_cache.get(prompt, _cache_namespace(), question)
+    if cached is not None:
+        metrics.count("cache_hits", cache="response")
+        yield cached
+        return
+    metrics.count("cache_misses", cache="response")
+    pieces = []
+    for piece in get_llm().stream(prompt):
+        if not pieces:
+            metrics.observe("generate.first_token", time.perf_counter() - start)
+        pieces.append(piece)
+        yield piece
+    response = "".join(pieces).strip()
+    metrics.count("tokens_generated", estimate_tokens(response))
+    response_cache.put(prompt, response, _cache_namespace(), question)
+
+def get_response_cache_stats() -> dict:
+    return get_response_cache().stats()
+
+SESSION_LOG_DB = "data/session_logs.db"
+
+def save_chat_log(user_text: str, bot_response: str):
+    with metrics.span("save_chat_log"):
+        get_writer(SESSION_LOG_DB, SESSION_LOG_SCHEMA).write(user_text, bot_response)
+
+def document_id(data) -> str:
+    """Content hash identifying an uploaded document across reruns and restarts."""
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    return hashlib.sha256(data).hexdigest()
+
+def load_knowledge_chunks(chunks, document: str = None):
+    """Embed chunk records in batches and append them to the knowledge store.
+
+    When `document` is already stored, nothing is re-chunked or re-embedded and
+    the stored chunk count is returned. If any batch fails, the batches already
+    added are deleted again and the error is raised, so a later upload of the
+    same document starts over instead of finding it half-loaded.
+    """
+    knowledge_store = get_knowledge_store()
+    if document and knowledge_store.document_size(document):
+        return knowledge_store.document_size(document)
+    embedder = get_embedder()
+    added = []
+    batch = []
     try:
-        response = co.embed(
-            texts=[query],
-            model="small",
-            truncate="RIGHT"
-        )
-        query_emb = np.array(response.embeddings[0])
-    except Exception as e:
-        print(f"Error embedding query: {e}")
-        return []
+        for chunk in chunks:
+            if document:
+                chunk["document"] = document
+            batch.append(chunk)
+            if len(batch) == embedder.batch_size:
+                added += _embed_and_add(batch)
+                batch = []
+        if batch:
+            added += _embed_and_add(batch)
+    except Exception:
+        knowledge_store.delete(added)
+        raise
+    return len(added)
 
-    def cosine_sim(a, b):
-        return np.dot(a, b) / (np.linalg.norm(a) * np.linalg.norm(b))
+def _embed_and_add(batch):
+    with metrics.span("embed"):
+        embeddings = get_embedder().embed([chunk["text"] for chunk in batch])
+    return get_knowledge_store().add(batch, embeddings)
+
+def load_knowledge_base_from_text(text: str, source: str = "upload"):
+    from chunking import chunk_text
+    return load_knowledge_chunks(chunk_text(text, source), document_id(text)) > 0
+
+def semantic_search(query: str, top_k=1):
+    return [chunk["text"] for chunk in semantic_search_chunks(query, top_k)]
 
-    sims = [cosine_sim(query_emb, np.array(doc_emb)) for doc_emb in knowledge_embeddings]
-    top_indices = sorted(range(len(sims)), key=lambda i: sims[i], reverse=True)[:top_k]
-    return [knowledge_texts[i] for i in top_indices]
+def semantic_search_chunks(query: str, top_k=3, mode: str = None):
+    """Like semantic_search, but return chunk records with source metadata.
+
+    mode is "hybrid" (BM25 and embeddings fused by reciprocal rank), "lexical"
+    (local BM25 only, no network call) or "vector"; RETRIEVAL_MODE sets the
+    default. Hybrid falls back to lexical results if the embed call fails.
+    """
+    from retrieval import reciprocal_rank_fusion
+    mode = mode or _getenv("RETRIEVAL_MODE", "hybrid")
+    knowledge_store = get_knowledge_store()
+    if not len(knowledge_store):
+        return []
+    with metrics.span("retrieve"):
+        candidates = max(top_k * 4, 20)
+        rankings = []
+        if mode in ("hybrid", "lexical"):
+            rankings.append(get_lexical_index().search(query, candidates))
+        if mode in ("hybrid", "vector"):
+            try:
+                query_emb = get_embedder().embed([query])[0]
+                rankings.append(knowledge_store.search_ids(query_emb, candidates))
+            except Exception as e:
+                print(f"Error embedding query: {e}")
+        if len(rankings) == 1:
+            hits = rankings[0][:top_k]
+        else:
+            hits = reciprocal_rank_fusion(rankings, top_k)
+        return [knowledge_store.get(record_id) for record_id, _ in hits]
 
 def has_knowledge():
-    return len(knowledge_texts) > 0
+    return len(get_knowledge_store()) > 0
 
 def get_knowledge_texts():
-    return knowledge_texts
-
-def transcribe_audio(audio_file) -> str:
-    headers = {"authorization": ASSEMBLYAI_API_KEY}
-
-    if hasattr(audio_file, "read"):
-        upload_response = requests.post(
-            "https://api.assemblyai.com/v2/upload",
-            headers=headers,
-            files={"file": audio_file}
-        )
-    elif isinstance(audio_file, str):
-        with open(audio_file, "rb") as f:
-            upload_response = requests.post(
-                "https://api.assemblyai.com/v2/upload",
-                headers=headers,
-                files={"file": f}
-            )
-    else:
-        raise ValueError("Invalid audio file input.")
-
-    audio_url = upload_response.json()["upload_url"]
-
-    transcript_response = requests.post(
-        "https://api.assemblyai.com/v2/transcript",
-        headers=headers,
-        json={"audio_url": audio_url}
-    )
-    transcript_id = transcript_response.json()["id"]
-    polling_url = f"https://api.assemblyai.com/v2/transcript/{transcript_id}"
-
-    while True:
-        status_response = requests.get(polling_url, headers=headers).json()
-        if status_response["status"] == "completed":
-            return status_response["text"]
-        elif status_response["status"] == "error":
-            raise Exception(f"AssemblyAI error: {status_response['error']}")
-
-def text_to_speech(text: str, output_format="mp3") -> str:
-    from gtts import gTTS
-    tts = gTTS(text)
-    ext = output_format.lower()
-    temp_dir = tempfile.gettempdir()
-
-    if ext == "mp3":
-        out_path = os.path.join(temp_dir, "tts_output.mp3")
-        tts.save(out_path)
-    elif ext == "wav":
+    return get_knowledge_store().texts()
+
+@cache_resource
+def get_transcription_jobs() -> TranscriptionJobs:
+    fake_latency = _getenv("FAKE_TRANSCRIPTION_LATENCY")
+    if fake_latency:
+        return TranscriptionJobs(transcriber=FakeTranscriber(latency=float(fake_latency)))
+    return TranscriptionJobs(_require_key("ASSEMBLYAI_API_KEY"))
+
+def get_transport_stats() -> dict:
+    return transport.snapshot()
+
+def transcript_cache_key(audio_file) -> str:
+    from transcript_cache import audio_fingerprint, transcript_key
+    return transcript_key(audio_fingerprint(audio_file))
+
+def transcribe_audio(audio_file, progress=None) -> str:
+    """Cached or fresh transcript; blocks, so call it from a background job.
+
+    progress(done, total, text so far) is called as segments finish. If it
+    raises, the remaining segments are cancelled.
+    """
+    from vad import prepare_segments
+    with metrics.span("transcribe"):
+        transcript_cache = get_transcript_cache()
+        key = transcript_cache_key(audio_file)
+        cached = transcript_cache.get(key)
+        if cached is not None:
+            metrics.count("cache_hits", cache="transcript")
+            return cached
+        metrics.count("cache_misses", cache="transcript")
+        jobs = get_transcription_jobs()
+        job_id = jobs.submit_many(prepare_segments(audio_file))
         try:
-            from pydub import AudioSegment
-        except ImportError:
-            raise ImportError("pydub required for WAV conversion. Install with: pip install pydub")
-
-        mp3_path = os.path.join(temp_dir, "tts_output.mp3")
-        wav_path = os.path.join(temp_dir, "tts_output.wav")
-        tts.save(mp3_path)
-        sound = AudioSegment.from_mp3(mp3_path)
-        sound.export(wav_path, format="wav")
-        out_path = wav_path
-    else:
-        raise ValueError("Unsupported output format. Use 'mp3' or 'wav'.")
-
-    return out_path
-
-def get_chat_logs():
-    conn = sqlite3.connect("data/session_logs.db")
-    c = conn.cursor()
-    c.execute("SELECT timestamp, user_input, bot_response FROM chat_logs ORDER BY id DESC LIMIT 20")
-    rows = c.fetchall()
-    conn.close()
-    return rows
+            while progress and jobs.status(job_id) == "processing":
+                text, done, total = jobs.partial(job_id)
+                progress(done, total, text)
+                time.sleep(0.25)
+            transcript = jobs.result(job_id)
+        finally:
+            jobs.cancel(job_id)
+            jobs.forget(job_id)
+        transcript_cache.put(key, transcript)
+        return transcript
+
+def text_to_speech(text: str, output_format="mp3", on_segment=None) -> str:
+    with metrics.span("tts"):
+        if on_segment:
+            return get_tts_engine().synthesize_streaming(text, output_format, on_segment=on_segment)
+        return get_tts_engine().synthesize(text, output_format)
+
+def get_chat_logs(search: str = "", before_id: int = None, limit: int = 20):
+    get_writer(SESSION_LOG_DB, SESSION_LOG_SCHEMA).flush()
+    conn = connect(SESSION_LOG_DB, SESSION_LOG_SCHEMA)
+    try:
+        rows = fetch_page(conn, SESSION_LOG_SCHEMA, search, before_id, limit)
+    finally:
+        conn.close()
+    return [(ts, user_input, bot_response) for _, ts, user_input, bot_response in rows]
@@ -1,25 +1,107 @@
 import os
-import requests
-from datetime import datetime
-from gtts import gTTS
-import tempfile
-import cohere
+import shutil
+import time
 
-# Load environment variables
-from dotenv import load_dotenv
-load_dotenv()
+from streamlit import cache_resource
 
-COHERE_API_KEY = os.getenv("COHERE_API_KEY")
-ASSEMBLYAI_API_KEY = os.getenv("ASSEMBLYAI_API_KEY")
+from chat_log import CHAT_LOG_SCHEMA, connect, fetch_page, get_writer
+from metrics import metrics
+from retrieval import estimate_tokens
+from transcription import FakeTranscriber, TranscriptionJobs
+from transport import transport
 
-# Validate API keys
-if not COHERE_API_KEY:
-    raise ValueError("❌ Please set your COHERE_API_KEY environment variable.")
-if not ASSEMBLYAI_API_KEY:
-    raise ValueError("❌ Please set your ASSEMBLYAI_API_KEY environment variable.")
+# Heavy clients (cohere, numpy-backed caches, audio decoding) load on first use,
+# so importing this module stays cheap and pages that never call them never pay.
 
-# Cohere client
-co = cohere.Client(COHERE_API_KEY)
+_env_loaded = False
+
+def _getenv(name: str, default: str = None):
+    """Read a setting, loading .env on first use."""
+    global _env_loaded
+    if not _env_loaded:
+        from dotenv import load_dotenv
+        load_dotenv()
+        _env_loaded = True
+    return os.getenv(name, default)
+
+def _require_key(name: str) -> str:
+    key = _getenv(name)
+    if not key:
+        raise ValueError(f"❌ Please set your {name} environment variable.")
+    return key
+
+@cache_resource
+def get_cohere_client():
+    """Process-wide Cohere client, created on first use."""
+    import cohere
+    return cohere.Client(
+        _require_key("COHERE_API_KEY"), httpx_client=transport.httpx_client("cohere"), max_retries=0
+    )
+
+_llm = None
+
+def get_llm():
+    """The text-generation backend; Cohere's 'command' model unless set_llm_backend swapped it."""
+    global _llm
+    if _llm is None:
+        from llm import CohereGenerateBackend
+        _llm = CohereGenerateBackend(get_cohere_client(), model="command", max_tokens=300, temperature=0.7)
+    return _llm
+
+@cache_resource
+def get_response_cache():
+    """Response cache, shared across processes through SQLite.
+
+    Set RESPONSE_CACHE_SIMILARITY (e.g. 0.95) to also serve near-duplicate questions.
+    """
+    from response_cache import ResponseCache
+    similarity = _getenv("RESPONSE_CACHE_SIMILARITY")
+    if not similarity:
+        return ResponseCache("data/response_cache.db")
+    from embeddings import CachedEmbedder, CohereEmbedder, EmbeddingCache
+    return ResponseCache(
+        "data/response_cache.db",
+        embedder=CachedEmbedder(CohereEmbedder(get_cohere_client()), EmbeddingCache("data/embedding_cache.db")),
+        similarity_threshold=float(similarity),
+    )
+
+@cache_resource
+def get_tts_engine():
+    """Text-to-speech with a content-addressed audio cache; TTS_BACKENDS lists engines tried in order."""
+    from tts import create_text_to_speech
+    return create_text_to_speech(_getenv("TTS_BACKENDS", "gtts,pyttsx3"))
+
+@cache_resource
+def get_job_queue():
+    """Background jobs for slow work (transcription, speech, ingestion, export); results persist in data/jobs.db."""
+    from jobs import JobQueue
+    return JobQueue("data/jobs.db")
+
+@cache_resource
+def get_transcript_cache():
+    """Transcripts keyed by a hash of the decoded audio, so re-uploads are never billed twice."""
+    from transcript_cache import TranscriptCache
+    return TranscriptCache("data/transcript_cache.db")
+
+@cache_resource
+def get_request_log():
+    """Buffered JSON-lines log of timed requests, one line each, in data/request_log.jsonl."""
+    from metrics import RequestLog
+    return RequestLog("data/request_log.jsonl")
+
+@cache_resource
+def start_metrics_export():
+    """Rewrite data/metrics.prom (Prometheus text format) every 15 seconds from a background thread."""
+    metrics.export_periodically("data/metrics.prom")
+    return True
+
+def trace_request(kind: str, **attrs):
+    """Context manager timing one user request; its stages and counters go to the request log."""
+    return metrics.request(kind, log=get_request_log(), **attrs)
+
+def get_metrics_snapshot() -> dict:
+    """Per-stage latency percentiles and counters (bytes uploaded, tokens generated, cache hits) for this process."""
+    return metrics.snapshot()
 
 # Default fallback knowledge
 knowledge_texts = [
@@ -32,89 +114,143 @@ knowledge_texts = [
     "Cloud computing provides scalable resources and infrastructure for deploying AI models and handling large datasets in a flexible, cost-efficient manner."
 ]
 
+@cache_resource
+def get_transcription_jobs() -> TranscriptionJobs:
+    """Process-wide non-blocking AssemblyAI job runner, created on first use.
+
+    FAKE_TRANSCRIPTION_LATENCY (seconds per job) swaps in an offline fake service.
+    """
+    fake_latency = _getenv("FAKE_TRANSCRIPTION_LATENCY")
+    if fake_latency:
+        return TranscriptionJobs(transcriber=FakeTranscriber(latency=float(fake_latency)))
+    return TranscriptionJobs(_require_key("ASSEMBLYAI_API_KEY"))
+
+def get_transport_stats() -> dict:
+    """Per-endpoint latency, retry and connection-reuse counters for outbound HTTP."""
+    return transport.snapshot()
+
 def transcribe_audio(audio_file):
-    """Transcribe audio using AssemblyAI."""
+    """Transcribe audio using AssemblyAI, after trimming silence and splitting long recordings."""
+    options = {"language_code": "en", "auto_chapters": False}
     try:
-        headers = {'authorization': ASSEMBLYAI_API_KEY}
-        upload_url = 'https://api.assemblyai.com/v2/upload'
-
-        with open(audio_file, 'rb') as f:
-            response = requests.post(upload_url, headers=headers, files={'file': f})
-        audio_url = response.json()['upload_url']
-
-        transcript_request = {
-            'audio_url': audio_url,
-            'language_code': 'en',
-            'auto_chapters': False
-        }
-        transcript_response = requests.post(
-            'https://api.assemblyai.com/v2/transcript',
-            json=transcript_request,
-            headers=headers
-        )
-        transcript_id = transcript_response.json()['id']
-
-        polling_url = f'https://api.assemblyai.com/v2/transcript/{transcript_id}'
-        while True:
-            poll_response = requests.get(polling_url, headers=headers).json()
-            if poll_response['status'] == 'completed':
-                return poll_response['text']
-            elif poll_response['status'] == 'error':
-                raise Exception(poll_response['error'])
+        from transcript_cache import audio_fingerprint, transcript_key
+        from vad import prepare_segments
+        transcript_cache = get_transcript_cache()
+        with metrics.span("transcribe"):
+            key = transcript_key(audio_fingerprint(audio_file), **options)
+            cached = transcript_cache.get(key)
+            if cached is not None:
+                metrics.count("cache_hits", cache="transcript")
+                return cached
+            metrics.count("cache_misses", cache="transcript")
+            transcript = get_transcription_jobs().transcribe_many(prepare_segments(audio_file), **options)
+            transcript_cache.put(key, transcript)
+            return transcript
     except Exception as e:
         return f"❌ Error during transcription: {e}"
 
-def generate_response(user_input: str) -> str:
-    """Generate a response using Cohere's 'command' model."""
+def get_transcript_cache_stats() -> dict:
+    """Entry count, size and hit/miss counters of the transcript cache."""
+    return get_transcript_cache().stats()
+
+def set_llm_backend(backend):
+    """Swap the text-generation backend, e.g. for llm.FakeStreamingBackend when offline."""
+    global _llm
+    _llm = backend
+
+def _cache_namespace() -> str:
+    llm = get_llm()
+    return getattr(llm, "model", type(llm).__name__)
+
+def generate_response(user_input: str, question: str = None) -> str:
+    """Generate a response using Cohere's 'command' model, serving repeats from cache.
+
+    Pass `question` when user_input wraps the user's words in context; near-duplicate
+    cache matches then compare only the question.
+    """
     try:
-        response = co.generate(
-            model="command",
-            prompt=user_input,
-            max_tokens=300,
-            temperature=0.7
-        )
-        return response.generations[0].text.strip()
+        with metrics.span("generate"):
+            response_cache = get_response_cache()
+            cached = response_cache.get(user_input, _cache_namespace(), question)
+            if cached is not None:
+                metrics.count("cache_hits", cache="response")
+                return cached
+            metrics.count("cache_misses", cache="response")
+            response = get_llm().generate(user_input)
+            metrics.count("tokens_generated", estimate_tokens(response))
+            response_cache.put(user_input, response, _cache_namespace(), question)
+            return response
     except Exception as e:
         return f"❌ Error generating response: {e}"
 
-def text_to_speech(text: str, output_file: str = None):
-    """Convert text to speech using Google TTS online (MP3)."""
+def generate_response_stream(user_input: str, question: str = None):
+    """Yield the response piece by piece as the model produces it."""
     try:
-        if not output_file:
-            with tempfile.NamedTemporaryFile(delete=False, suffix=".mp3") as temp_file:
-                output_file = temp_file.name
+        # Time only producing pieces, not how long the page takes to render each one.
+        yield from metrics.span_iter("generate", _stream_response(user_input, question))
+    except Exception as e:
+        yield f"❌ Error generating response: {e}"
 
-        tts = gTTS(text=text, lang='en')
-        tts.save(output_file)
-        return output_file
+def _stream_response(user_input: str, question: str = None):
+    """Body of generate_response_stream: cached answer or backend stream, cached once complete."""
+    start = time.perf_counter()
+    response_cache = get_response_cache()
+    cached = response_cache.get(user_input, _cache_namespace(), question)
+    if cached is not None:
+        metrics.count("cache_hits", cache="response")
+        yield cached
+        return
+    metrics.count("cache_misses", cache="response")
+    pieces = []
+    for piece in get_llm().stream(user_input):
+        if not pieces:
+            metrics.observe("generate.first_token", time.perf_counter() - start)
+        pieces.append(piece)
+        yield piece
+    response = "".join(pieces).strip()
+    metrics.count("tokens_generated", estimate_tokens(response))
+    response_cache.put(user_input, response, _cache_namespace(), question)
+
+def get_response_cache_stats() -> dict:
+    """Hit/miss counters for the response cache in this process."""
+    return get_response_cache().stats()
+
+def text_to_speech(text: str, output_file: str = None, on_segment=None):
+    """Convert text to speech (MP3), reusing cached audio for text heard before.
+
+    With on_segment, long text is synthesized sentence by sentence and
+    on_segment(index, path) is called as each piece becomes playable.
+    """
+    try:
+        with metrics.span("tts"):
+            if on_segment:
+                audio_path = get_tts_engine().synthesize_streaming(text, "mp3", on_segment=on_segment)
+            else:
+                audio_path = get_tts_engine().synthesize(text, "mp3")
+        if output_file:
+            shutil.copyfile(audio_path, output_file)
+            return output_file
+        return audio_path
     except Exception as e:
         return f"❌ Error generating audio: {e}"
 
 def save_chat_log(user_input: str, response: str, db_path: str = "chat_log.db"):
-    """Save user input and AI response to a local SQLite database."""
+    """Queue user input and AI response for a batched write to the local SQLite database."""
     try:
-        import sqlite3
-        from datetime import datetime
-
-        conn = sqlite3.connect(db_path)
-        c = conn.cursor()
-        c.execute('''
-            CREATE TABLE IF NOT EXISTS chat_log (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                timestamp TEXT,
-                question TEXT,
-                answer TEXT
-            )
-        ''')
-        c.execute('''
-            INSERT INTO chat_log (timestamp, question, answer)
-            VALUES (?, ?, ?)
-        ''', (datetime.now().isoformat(), user_input, response))
-        conn.commit()
-        conn.close()
+        with metrics.span("save_chat_log"):
+            get_writer(db_path, CHAT_LOG_SCHEMA).write(user_input, response)
     except Exception as e:
         print(f"❌ Error saving chat log: {e}")
 
+def get_chat_log_page(search: str = "", before_id: int = None, page_size: int = 20, db_path: str = "chat_log.db"):
+    """Return one page of (id, timestamp, question, answer) rows, newest first, optionally full-text filtered."""
+    get_writer(db_path, CHAT_LOG_SCHEMA).flush()
+    conn = connect(db_path, CHAT_LOG_SCHEMA)
+    try:
+        return fetch_page(conn, CHAT_LOG_SCHEMA, search, before_id, page_size)
+    finally:
+        conn.close()
+
 def load_knowledge_base(file_path: str):
     """Load knowledge base text from file or return fallback if not available."""
     if os.path.exists(file_path):
@@ -130,4 +266,4 @@ def generate_custom_content(topic: str) -> str:
         f"Write an easy-to-understand educational explanation about the topic: {topic}.\n"
         f"Include examples where helpful. Keep it clear and informative."
     )
-    return generate_response(prompt)
+    return generate_response(prompt, question=topic)
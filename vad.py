@@ -0,0 +1,129 @@
+import io
+
+import numpy as np
+
+from audio_buffer import AudioBuffer, resample, to_mono
+
+
+def frame_energies(samples, sample_rate: int, frame_ms: int = 30):
+    """RMS level in dBFS of consecutive non-overlapping frames."""
+    frame_length = max(1, int(sample_rate * frame_ms / 1000))
+    n_frames = len(samples) // frame_length
+    if not n_frames:
+        return np.empty(0, dtype=np.float32)
+    frames = np.asarray(samples[:n_frames * frame_length], dtype=np.float32).reshape(n_frames, frame_length)
+    rms = np.sqrt(np.mean(frames * frames, axis=1))
+    return 20 * np.log10(np.maximum(rms, 1e-10))
+
+
+def speech_mask(samples, sample_rate: int, frame_ms: int = 30, threshold_db: float = None,
+                margin_db: float = 12.0, hangover_ms: int = 200):
+    """Boolean speech/silence decision per frame from energy gating.
+
+    Without an explicit threshold, the gate sits `margin_db` above the noise
+    floor (the 10th-percentile frame level) but never above -30 dBFS. Short
+    dips inside speech are bridged by `hangover_ms`.
+    """
+    energies = frame_energies(samples, sample_rate, frame_ms)
+    if not len(energies):
+        return energies.astype(bool)
+    if threshold_db is None:
+        threshold_db = min(np.percentile(energies, 10) + margin_db, -30.0)
+    mask = energies > threshold_db
+    hangover = max(1, hangover_ms // frame_ms)
+    # Dilate speech regions forwards and backwards by the hangover length.
+    kernel = np.ones(2 * hangover + 1, dtype=np.int32)
+    return np.convolve(mask.astype(np.int32), kernel, mode="same") > 0
+
+
+def _speech_runs(mask):
+    """(start_frame, end_frame) of each run of True in mask."""
+    padded = np.concatenate([[False], mask, [False]])
+    edges = np.flatnonzero(padded[1:] != padded[:-1])
+    return list(zip(edges[::2], edges[1::2]))
+
+
+def trim_silence(samples, sample_rate: int, max_pause_ms: int = 600, frame_ms: int = 30, **gate_options):
+    """Drop leading/trailing silence and shorten pauses longer than max_pause_ms."""
+    mask = speech_mask(samples, sample_rate, frame_ms, **gate_options)
+    runs = _speech_runs(mask)
+    if not runs:
+        return samples[:0]
+    frame_length = int(sample_rate * frame_ms / 1000)
+    keep_pause = int(sample_rate * max_pause_ms / 1000)
+    pieces = []
+    for i, (start, end) in enumerate(runs):
+        if i:
+            gap_start = runs[i - 1][1] * frame_length
+            gap = samples[gap_start:start * frame_length]
+            if len(gap) > keep_pause:
+                half = keep_pause // 2
+                gap = np.concatenate([gap[:half], gap[len(gap) - (keep_pause - half):]])
+            pieces.append(gap)
+        pieces.append(samples[start * frame_length:min(len(samples), end * frame_length)])
+    return np.concatenate(pieces)
+
+
+def split_on_silence(samples, sample_rate: int, max_segment_seconds: float = 300.0,
+                     frame_ms: int = 30, **gate_options):
+    """Sample ranges of at most max_segment_seconds, cut in the quietest frame before each limit."""
+    limit = int(max_segment_seconds * sample_rate)
+    if len(samples) <= limit:
+        return [(0, len(samples))]
+    frame_length = int(sample_rate * frame_ms / 1000)
+    energies = frame_energies(samples, sample_rate, frame_ms)
+    mask = speech_mask(samples, sample_rate, frame_ms, **gate_options)
+    ranges = []
+    start = 0
+    while len(samples) - start > limit:
+        window_start = (start + limit // 2) // frame_length
+        window_end = (start + limit) // frame_length
+        window = np.arange(window_start, window_end)
+        silent = window[~mask[window]]
+        candidates = silent if len(silent) else window
+        cut_frame = candidates[np.argmin(energies[candidates])]
+        cut = int(cut_frame * frame_length + frame_length // 2)
+        ranges.append((start, cut))
+        start = cut
+    ranges.append((start, len(samples)))
+    return ranges
+
+
+def decode_audio(audio_file):
+    """Decode an audio file, path or buffer to (mono float32 samples, sample rate)."""
+    import soundfile as sf
+    if isinstance(audio_file, AudioBuffer):
+        audio_file = io.BytesIO(audio_file.data)
+    elif isinstance(audio_file, (bytes, bytearray, memoryview)):
+        audio_file = io.BytesIO(audio_file)
+    elif hasattr(audio_file, "seek"):
+        audio_file.seek(0)
+    samples, sample_rate = sf.read(audio_file, dtype="float32", always_2d=True)
+    return to_mono(samples), sample_rate
+
+
+def prepare_segments(audio_file, max_segment_seconds: float = 300.0, target_rate: int = 16000,
+                     max_pause_ms: int = 600, overlap_seconds: float = 2.0):
+    """Gate silence, then cut long audio at silent points into compact mono WAV segments.
+
+    Each segment after the first starts `overlap_seconds` early, so a word cut
+    at a boundary is heard whole by one side; merge_transcripts drops the
+    duplicated words. The segments can be transcribed in parallel.
+
+    Input that cannot be decoded locally (e.g. m4a without an ffmpeg-enabled
+    libsndfile) comes back unchanged as a single segment, so transcription
+    never fails because of this stage.
+    """
+    try:
+        samples, sample_rate = decode_audio(audio_file)
+    except Exception:
+        return [audio_file]
+    trimmed = trim_silence(samples, sample_rate, max_pause_ms)
+    if not len(trimmed):
+        trimmed = samples
+    trimmed = resample(trimmed, sample_rate, target_rate)
+    overlap = int(overlap_seconds * target_rate)
+    return [
+        AudioBuffer.from_pcm(trimmed[max(0, start - overlap):end], target_rate)
+        for start, end in split_on_silence(trimmed, target_rate, max_segment_seconds)
+    ]
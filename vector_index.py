@@ -0,0 +1,110 @@
+import numpy as np
+
+
+def normalize_rows(vectors):
+    """Return vectors as a 2-D float32 array with unit-length rows."""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if vectors.ndim == 1:
+        vectors = vectors[None, :]
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def top_k_indices(scores, top_k: int):
+    """Indices of the top_k highest scores in each row, best first."""
+    n = scores.shape[1]
+    k = min(top_k, n)
+    if k < n:
+        part = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    else:
+        part = np.broadcast_to(np.arange(n), (scores.shape[0], n))
+    part_scores = np.take_along_axis(scores, part, axis=1)
+    order = np.argsort(-part_scores, axis=1)
+    return np.take_along_axis(part, order, axis=1)
+
+
+class VectorIndex:
+    """In-memory cosine-similarity index over pre-normalized float32 embeddings."""
+
+    def __init__(self, dim: int = None, initial_capacity: int = 64):
+        self.dim = dim
+        self._capacity = max(1, initial_capacity)
+        self._size = 0
+        self._matrix = None
+        self.texts = []
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def matrix(self):
+        """View of the stored (normalized) vectors, without spare capacity."""
+        if self._matrix is None:
+            return np.empty((0, self.dim or 0), dtype=np.float32)
+        return self._matrix[:self._size]
+
+    def _ensure_capacity(self, extra: int):
+        needed = self._size + extra
+        if self._matrix is None:
+            capacity = self._capacity
+            while capacity < needed:
+                capacity *= 2
+            self._matrix = np.empty((capacity, self.dim), dtype=np.float32)
+            self._capacity = capacity
+            return
+        if needed <= self._capacity:
+            return
+        capacity = self._capacity
+        while capacity < needed:
+            capacity *= 2
+        grown = np.empty((capacity, self.dim), dtype=np.float32)
+        grown[:self._size] = self._matrix[:self._size]
+        self._matrix = grown
+        self._capacity = capacity
+
+    def add(self, embedding, text: str):
+        """Add a single embedding and the text it represents."""
+        self.add_many([embedding], [text])
+
+    def add_many(self, embeddings, texts):
+        """Add a batch of embeddings with their texts."""
+        texts = list(texts)
+        if not texts and not len(embeddings):
+            return
+        vectors = normalize_rows(embeddings)
+        if len(vectors) != len(texts):
+            raise ValueError("Number of embeddings and texts must match.")
+        if self.dim is None:
+            self.dim = vectors.shape[1]
+        elif vectors.shape[1] != self.dim:
+            raise ValueError(f"Expected embeddings of size {self.dim}, got {vectors.shape[1]}.")
+        self._ensure_capacity(len(texts))
+        self._matrix[self._size:self._size + len(texts)] = vectors
+        self._size += len(texts)
+        self.texts.extend(texts)
+
+    def clear(self):
+        self._matrix = None
+        self._size = 0
+        del self.texts[:]
+
+    def search_many(self, queries, top_k: int = 1):
+        """Return a list of (index, score) lists, one per query row."""
+        if self._size == 0 or top_k <= 0:
+            return [[] for _ in range(len(queries))]
+        q = normalize_rows(queries)
+        scores = q @ self.matrix.T
+        top = top_k_indices(scores, top_k)
+        return [
+            [(int(i), float(scores[row, i])) for i in top[row]]
+            for row in range(len(q))
+        ]
+
+    def search(self, query, top_k: int = 1):
+        """Return (index, score) pairs for the top_k nearest vectors to query."""
+        return self.search_many([query], top_k)[0]
+
+    def search_texts(self, query, top_k: int = 1):
+        """Return the texts of the top_k nearest vectors to query."""
+        return [self.texts[i] for i, _ in self.search(query, top_k)]